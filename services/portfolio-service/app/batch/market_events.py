@@ -0,0 +1,66 @@
+"""
+Bulk load market events from a CSV file with date and headline columns (and optionally source).
+
+    python -m app.batch.market_events events.csv
+    python -m app.batch.market_events events.csv --chunk-size 20000
+
+Run from services/portfolio-service. Rows are loaded a chunk at a time, each in its own
+transaction; rows without a valid date or headline are skipped, and events already stored
+with the same date and headline are left as they are, so a file can be loaded again safely.
+"""
+import argparse
+import sys
+import time
+
+import pandas as pd
+
+from app.crud.market_event import BULK_COLUMNS, bulk_insert_market_events
+from app.database import SessionLocal
+from app.models import MarketEvent
+
+
+def read_events(path, chunksize):
+    """Validated event chunks (BULK_COLUMNS) and the number of rows skipped in each."""
+    for chunk in pd.read_csv(path, dtype=str, chunksize=chunksize, encoding="utf-8"):
+        missing = {"date", "headline"} - set(chunk.columns)
+        if missing:
+            raise ValueError(f"CSV missing columns: {missing}")
+        events = pd.DataFrame({
+            "date": pd.to_datetime(chunk["date"], errors="coerce", format="mixed").dt.date,
+            "headline": chunk["headline"].str.strip(),
+            "source": chunk["source"].str.strip() if "source" in chunk.columns else None
+        }, columns=BULK_COLUMNS)
+        valid = events["date"].notna() & events["headline"].fillna("").ne("")
+        yield events[valid], int((~valid).sum())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="CSV file with date,headline[,source] columns")
+    parser.add_argument("--chunk-size", type=int, default=50000, help="Rows per insert")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        before = db.query(MarketEvent).count()
+        started = time.perf_counter()
+        skipped = 0
+        for events, invalid in read_events(args.path, args.chunk_size):
+            skipped += invalid
+            if not events.empty:
+                bulk_insert_market_events(db, events)
+                db.commit()
+        added = db.query(MarketEvent).count() - before
+        print(f"Loaded {added} new events in {time.perf_counter() - started:.1f}s "
+              f"({skipped} invalid rows skipped)", file=sys.stderr)
+    except (ValueError, pd.errors.ParserError, UnicodeDecodeError) as e:
+        db.rollback()
+        print(f"Could not load {args.path}: {e}", file=sys.stderr)
+        return 1
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+"""
+Nightly extension of every portfolio's daily NAV series, so requests find them current.
+
+    python -m app.batch.nav                      # every portfolio, through the last complete trading day
+    python -m app.batch.nav --portfolio-ids 1 2 --through 2024-06-28
+
+Run from services/portfolio-service, e.g. from cron after the market close. Portfolios already
+current are skipped with one query; the others are extended from their last stored day, or
+recomputed from the earliest transaction changed since.
+"""
+import argparse
+import sys
+import time
+
+from app.crud.nav import refresh_nav
+from app.database import SessionLocal
+from app.models import Portfolio
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--portfolio-ids", nargs="+", type=int, default=None, help="Only these portfolios")
+    parser.add_argument("--through", default=None, help="Last day to compute (default: last complete trading day)")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        query = db.query(Portfolio.id).order_by(Portfolio.id)
+        if args.portfolio_ids:
+            query = query.filter(Portfolio.id.in_(args.portfolio_ids))
+        portfolio_ids = [pid for (pid,) in query]
+
+        started = time.perf_counter()
+        failed = 0
+        for portfolio_id in portfolio_ids:
+            try:
+                refresh_nav(db, portfolio_id, args.through)
+            except Exception as e:
+                db.rollback()
+                failed += 1
+                print(f"Portfolio {portfolio_id}: NAV refresh failed: {e}", file=sys.stderr)
+        print(f"Refreshed {len(portfolio_ids) - failed} of {len(portfolio_ids)} portfolios "
+              f"in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    finally:
+        db.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""
+Nightly rebalancing suggestions: every portfolio's minimum-volatility allocation for a target
+return, stored in suggested_allocations and served by GET /portfolio/suggested-allocation/{id}.
+
+    python -m app.batch.rebalance                          # every portfolio, target return 0.20
+    python -m app.batch.rebalance --target-return 0.1 --workers 8 --page-size 5000
+    python -m app.batch.rebalance --as-of 2024-06-28       # resume a run started on that day
+    python -m app.batch.rebalance --covariance factor      # factor-model covariance for large universes
+
+Run from services/portfolio-service, e.g. from cron after the market close. Portfolios are read a
+page at a time in ID order and grouped by the set of tickers they hold. Price history for every
+ticker of a page is fetched in one call, return statistics are assembled once per group from the
+shared series and covariance cache, and each group is solved once in a worker process, with only
+the per-portfolio figures computed per member. Pages are committed as they finish; a rerun for the
+same day and target return skips portfolios whose suggestion is current.
+"""
+import argparse
+import multiprocessing
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from app.crud.position import get_holdings_for_portfolios
+from app.crud.suggested_allocation import count_pending_portfolios, pending_portfolios, save_suggested_allocations
+from app.database import SessionLocal
+from app.executor import ANALYTICS_WORKERS
+from app.logic.covariance import ESTIMATORS
+from app.logic.optimize import allocation_performance, allocation_summary, held_tickers, load_return_statistics, preload_return_statistics, solve_allocation
+
+# Groups sent to a worker per task; small groups are batched so pickling does not dominate.
+GROUPS_PER_TASK = 64
+
+
+def optimize_groups(groups, target_return, end_date):
+    """
+    optimize_portfolio results for groups of (tickers, stats, solution, members), where every member
+    (portfolio_id, holdings) holds exactly `tickers`. Each group's allocation is solved once (unless
+    its solution from an earlier page is given) and summarised per portfolio.
+    Returns ({portfolio_id: result}, {tickers: solution}).
+    """
+    results, solutions = {}, {}
+    for tickers, stats, solution, members in groups:
+        if solution is None:
+            weights, error = solve_allocation(stats, target_return)
+            solution = (weights, error, allocation_performance(stats, weights) if error is None else None)
+        weights, error, performance = solution
+        solutions[tuple(tickers)] = solution
+        for portfolio_id, holdings in members:
+            results[portfolio_id] = error if error is not None \
+                else allocation_summary(holdings, tickers, stats, weights, end_date, performance)
+    return results, solutions
+
+
+def group_by_universe(holdings):
+    """{tuple of held tickers: [(portfolio_id, holdings)]} of {portfolio_id: holdings}."""
+    groups = defaultdict(list)
+    for portfolio_id, positions in holdings.items():
+        groups[tuple(held_tickers(positions))].append((portfolio_id, positions))
+    return groups
+
+
+def rebalance_page(holdings, target_return, end_date, pool=None, solutions=None, covariance=None):
+    """
+    Optimization results {portfolio_id: result} for one page of {portfolio_id: holdings}.
+    solutions: {tickers: solution} of earlier pages of the run, reused and extended in place.
+    covariance: the covariance estimator (see load_return_statistics).
+    """
+    solutions = {} if solutions is None else solutions
+    groups = group_by_universe(holdings)
+    results = {}
+    for portfolio_id, positions in groups.pop((), []):
+        results[portfolio_id] = {"message": "No net holdings to optimize." if positions else "No transactions to optimize."}
+
+    preload_return_statistics(sorted({ticker for universe in groups for ticker in universe}), end_date)
+    solvable = []
+    for universe, members in groups.items():
+        stats = load_return_statistics(list(universe), end_date, covariance)
+        if stats is None:
+            results.update((pid, {"message": "Insufficient price data for optimization."}) for pid, _ in members)
+        else:
+            solvable.append((list(universe), stats, solutions.get(universe), members))
+
+    tasks = [solvable[i:i + GROUPS_PER_TASK] for i in range(0, len(solvable), GROUPS_PER_TASK)]
+    if pool is None:
+        outputs = (optimize_groups(task, target_return, end_date) for task in tasks)
+    else:
+        outputs = pool.map(optimize_groups, tasks, [target_return] * len(tasks), [end_date] * len(tasks))
+    for task_results, task_solutions in outputs:
+        results.update(task_results)
+        solutions.update(task_solutions)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target-return", type=float, default=0.20, help="Target return as a decimal (default: 0.20)")
+    parser.add_argument("--as-of", default=None, help="Last day of price history to use (default: today, UTC)")
+    parser.add_argument("--portfolio-ids", nargs="+", type=int, default=None, help="Only these portfolios")
+    parser.add_argument("--page-size", type=int, default=2000, help="Portfolios read and committed at a time")
+    parser.add_argument("--workers", type=int, default=ANALYTICS_WORKERS, help="Solver processes; 0 solves in this process")
+    parser.add_argument("--covariance", choices=ESTIMATORS, default=None, help="Covariance estimator (default: COVARIANCE_ESTIMATOR)")
+    args = parser.parse_args(argv)
+
+    end_date = datetime.fromisoformat(args.as_of) if args.as_of else datetime.utcnow()
+    as_of = end_date.date()
+    pool = ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn")) \
+        if args.workers > 0 else None
+
+    db = SessionLocal()
+    try:
+        total = count_pending_portfolios(db, as_of, args.target_return, args.portfolio_ids)
+        print(f"{total} portfolios to rebalance as of {as_of}", file=sys.stderr)
+
+        started = time.perf_counter()
+        done = failed = 0
+        after_id = 0
+        solutions = {}  # Allocation per ticker set, shared by every page of the run
+        while True:
+            versions = pending_portfolios(db, as_of, args.target_return, after_id, args.page_size, args.portfolio_ids)
+            if not versions:
+                break
+            after_id = max(versions)
+            try:
+                holdings = get_holdings_for_portfolios(db, list(versions))
+                results = rebalance_page(holdings, args.target_return, end_date, pool, solutions, args.covariance)
+                save_suggested_allocations(db, as_of, args.target_return, versions, results)
+            except Exception as e:
+                # Left unsaved, so the next run retries them
+                db.rollback()
+                failed += len(versions)
+                print(f"Portfolios {min(versions)}-{after_id}: rebalancing failed: {e}", file=sys.stderr)
+                continue
+
+            done += len(versions)
+            elapsed = time.perf_counter() - started
+            rate = done / elapsed if elapsed > 0 else 0.0
+            remaining = max(total - done - failed, 0)
+            print(f"{done}/{total} portfolios, {rate:.0f}/s, ~{remaining / rate if rate else 0:.0f}s left", file=sys.stderr)
+
+        print(f"Rebalanced {done} of {total} portfolios in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    finally:
+        db.close()
+        if pool is not None:
+            pool.shutdown()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+import datetime
+import json
+import uuid
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+from app.models import Job
+
+def get_job(db: Session, job_id: str):
+    """The job, or None if it does not exist or its result has expired."""
+    now = datetime.datetime.utcnow()
+    return db.query(Job).filter(Job.id == job_id, or_(Job.expires_at.is_(None), Job.expires_at > now)).first()
+
+def find_duplicate_job(db: Session, user_id: str, dedupe_key: str):
+    """An identical job of the user that is still pending or running, or succeeded and not yet expired."""
+    now = datetime.datetime.utcnow()
+    return db.query(Job).filter(
+        Job.user_id == user_id,
+        Job.dedupe_key == dedupe_key,
+        or_(Job.status.in_(["pending", "running"]), and_(Job.status == "succeeded", Job.expires_at > now))
+    ).order_by(Job.created_at.desc()).first()
+
+def create_job(db: Session, user_id: str, portfolio_id: int, kind: str, params: dict, dedupe_key: str):
+    job = Job(id=str(uuid.uuid4()), user_id=user_id, portfolio_id=portfolio_id, kind=kind,
+              params=json.dumps(params), dedupe_key=dedupe_key, status="pending", attempts=0)
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+def claim_next_job(db: Session, stale_after: int, max_attempts: int, ttl: int):
+    """
+    Mark the oldest pending job as running and return it, or None if there is none. Jobs left
+    running for more than stale_after seconds (their worker died) are claimed again, up to
+    max_attempts runs in all; after that they are marked failed (kept for ttl seconds) instead,
+    so a job that keeps killing its worker is not retried forever. The conditional update makes
+    the claim safe across processes sharing the table.
+    """
+    now = datetime.datetime.utcnow()
+    stale = and_(Job.status == "running", Job.started_at < now - datetime.timedelta(seconds=stale_after))
+    db.query(Job).filter(stale, Job.attempts >= max_attempts).update({
+        Job.status: "failed",
+        Job.error: f"Job abandoned after {max_attempts} attempts",
+        Job.finished_at: now,
+        Job.expires_at: now + datetime.timedelta(seconds=ttl)
+    }, synchronize_session=False)
+    db.commit()
+
+    claimable = or_(Job.status == "pending", and_(stale, Job.attempts < max_attempts))
+    for (job_id,) in db.query(Job.id).filter(claimable).order_by(Job.created_at).limit(10).all():
+        claimed = db.query(Job).filter(Job.id == job_id, claimable).update(
+            {Job.status: "running", Job.started_at: now, Job.attempts: Job.attempts + 1},
+            synchronize_session=False
+        )
+        db.commit()
+        if claimed:
+            return db.query(Job).filter(Job.id == job_id).first()
+    return None
+
+def release_job(db: Session, job_id: str):
+    """
+    Put a claimed job back in the queue, e.g. when the analytics pool is saturated. The claim
+    does not count towards its attempts.
+    """
+    db.query(Job).filter(Job.id == job_id, Job.status == "running").update(
+        {Job.status: "pending", Job.started_at: None, Job.attempts: Job.attempts - 1},
+        synchronize_session=False
+    )
+    db.commit()
+
+def finish_job(db: Session, job_id: str, ttl: int, result=None, error: str = None):
+    """Record the job's result (JSON-serialisable) or error; both are kept for ttl seconds."""
+    now = datetime.datetime.utcnow()
+    db.query(Job).filter(Job.id == job_id).update({
+        Job.status: "failed" if error is not None else "succeeded",
+        Job.result: json.dumps(result) if error is None else None,
+        Job.error: error,
+        Job.finished_at: now,
+        Job.expires_at: now + datetime.timedelta(seconds=ttl)
+    }, synchronize_session=False)
+    db.commit()
+
+def delete_expired_jobs(db: Session):
+    deleted = db.query(Job).filter(Job.expires_at <= datetime.datetime.utcnow()).delete(synchronize_session=False)
+    db.commit()
+    return deleted
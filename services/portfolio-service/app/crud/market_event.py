@@ -0,0 +1,78 @@
+from io import StringIO
+import pandas as pd
+from sqlalchemy import insert, text
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.orm import Session
+from app.models import MarketEvent
+
+BULK_COLUMNS = ["date", "headline", "source"]
+
+# Loaded into an empty market_events table on startup
+SAMPLE_EVENTS = [
+    {"date": "2020-03-12", "headline": "Global markets crash due to COVID-19 pandemic fears."},
+    {"date": "2020-11-09", "headline": "Pfizer announces COVID-19 vaccine efficacy, markets rally."},
+    {"date": "2021-01-06", "headline": "Capitol riots in US shake investor confidence briefly."},
+    {"date": "2021-11-10", "headline": "US inflation hits 30-year high, concerns over Fed rate hikes."},
+    {"date": "2022-02-24", "headline": "Russia invades Ukraine, markets drop sharply."},
+    {"date": "2022-06-15", "headline": "Federal Reserve hikes rates by 75bps, largest since 1994."},
+    {"date": "2023-03-10", "headline": "Silicon Valley Bank collapse triggers tech sector selloff."},
+    {"date": "2023-10-12", "headline": "US bond yields surge, fears of economic slowdown increase."},
+    {"date": "2024-01-25", "headline": "Tech stocks rally on strong AI growth projections."},
+    {"date": "2024-08-15", "headline": "Oil prices spike due to Middle East tensions."},
+    {"date": "2025-03-05", "headline": "Global markets stabilize on easing inflation fears."}
+]
+
+def get_market_events(db: Session, start=None, end=None, limit=None):
+    """Events with start <= date <= end in date order, as (date, headline, source) rows, from the date index."""
+    query = db.query(MarketEvent.date, MarketEvent.headline, MarketEvent.source)
+    if start is not None:
+        query = query.filter(MarketEvent.date >= start)
+    if end is not None:
+        query = query.filter(MarketEvent.date <= end)
+    query = query.order_by(MarketEvent.date, MarketEvent.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+def bulk_insert_market_events(db: Session, rows):
+    """
+    Insert a DataFrame of events (BULK_COLUMNS, date as datetime.date), skipping any already
+    stored with the same date and headline. On PostgreSQL the rows are COPYed into a temporary
+    table and merged from there; SQLite uses INSERT OR IGNORE. Does not commit.
+    """
+    frame = rows.reindex(columns=BULK_COLUMNS)
+    dialect = db.get_bind().dialect.name
+
+    if dialect == "postgresql":
+        db.execute(text(
+            "CREATE TEMP TABLE IF NOT EXISTS market_events_load (date date, headline text, source varchar) ON COMMIT DROP"
+        ))
+        db.execute(text("TRUNCATE market_events_load"))
+        buffer = StringIO()
+        frame.to_csv(buffer, header=False, index=False)
+        buffer.seek(0)
+        cursor = db.connection().connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY market_events_load ({', '.join(BULK_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+        finally:
+            cursor.close()
+        db.execute(text(
+            f"INSERT INTO {MarketEvent.__tablename__} ({', '.join(BULK_COLUMNS)}) "
+            f"SELECT DISTINCT ON (date, headline) {', '.join(BULK_COLUMNS)} FROM market_events_load "
+            "ON CONFLICT (date, headline) DO NOTHING"
+        ))
+        return
+
+    records = frame.astype(object).where(frame.notna(), None).to_dict("records")
+    if dialect == "sqlite":
+        statement = sqlite.insert(MarketEvent).on_conflict_do_nothing()
+    else:
+        statement = insert(MarketEvent)
+    db.execute(statement, records)
+
+def seed_market_events(db: Session):
+    """Load SAMPLE_EVENTS if there are no events yet. Commits."""
+    if db.query(MarketEvent.id).first():
+        return
+    bulk_insert_market_events(db, pd.DataFrame(SAMPLE_EVENTS).assign(date=lambda f: pd.to_datetime(f["date"]).dt.date))
+    db.commit()
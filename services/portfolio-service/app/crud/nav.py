@@ -0,0 +1,144 @@
+import pandas as pd
+from sqlalchemy import func, insert, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.models import Portfolio, PortfolioNav, PortfolioNavSummary
+from app.crud.transaction import load_ledger
+from app.logic.nav import NavState, OPENING_STATE, NAV_COLUMNS, extend_nav, first_nav_day, last_complete_day
+
+def invalidate_nav(db: Session, portfolio_id: int, changed_from):
+    """
+    Mark the portfolio's NAV rows from the business day of changed_from on as stale. None (an
+    undated transaction changed) drops the summary, so the series is rebuilt from the start.
+    Does not commit.
+    """
+    if changed_from is None:
+        db.query(PortfolioNavSummary).filter(PortfolioNavSummary.portfolio_id == portfolio_id) \
+            .delete(synchronize_session=False)
+        return
+    day = first_nav_day(changed_from).date()
+    db.query(PortfolioNavSummary).filter(
+        PortfolioNavSummary.portfolio_id == portfolio_id,
+        or_(PortfolioNavSummary.dirty_from.is_(None), PortfolioNavSummary.dirty_from > day)
+    ).update({PortfolioNavSummary.dirty_from: day}, synchronize_session=False)
+
+def nav_state(summary: PortfolioNavSummary):
+    return NavState(*(getattr(summary, field) for field in NavState._fields))
+
+def get_nav_states(db: Session, portfolio_ids):
+    """{portfolio_id: NavState} of the stored summaries, in one query. Call refresh_nav first."""
+    summaries = db.query(PortfolioNavSummary).filter(PortfolioNavSummary.portfolio_id.in_(portfolio_ids))
+    return {summary.portfolio_id: nav_state(summary) for summary in summaries}
+
+def get_nav_series(db: Session, portfolio_id: int, start=None, end=None):
+    query = db.query(*(getattr(PortfolioNav, c) for c in NAV_COLUMNS)).filter(PortfolioNav.portfolio_id == portfolio_id)
+    if start is not None:
+        query = query.filter(PortfolioNav.date >= start)
+    if end is not None:
+        query = query.filter(PortfolioNav.date <= end)
+    return query.order_by(PortfolioNav.date).all()
+
+def _opening_state(db: Session, portfolio_id: int, day):
+    """The NavState after the stored rows before day, aggregated in the database."""
+    kept = db.query(
+        func.count(PortfolioNav.daily_return), func.sum(PortfolioNav.daily_return),
+        func.sum(PortfolioNav.daily_return * PortfolioNav.daily_return),
+        func.max(PortfolioNav.twr_index), func.min(PortfolioNav.drawdown)
+    ).filter(PortfolioNav.portfolio_id == portfolio_id, PortfolioNav.date < day).one()
+    last = db.query(PortfolioNav.market_value, PortfolioNav.twr_index) \
+        .filter(PortfolioNav.portfolio_id == portfolio_id, PortfolioNav.date < day) \
+        .order_by(PortfolioNav.date.desc()).first()
+    if last is None:
+        return None
+    count, total, squares, peak, drawdown = kept
+    return NavState(last.market_value, last.twr_index, max(peak, 1.0), min(drawdown, 0.0), count, total or 0.0, squares or 0.0)
+
+def _is_current(summary, version, through):
+    if summary is None or summary.version != version or summary.dirty_from is not None:
+        return False
+    # Without transactions up to `through` there are no rows to add
+    if summary.start_date is None or summary.start_date > through:
+        return True
+    return summary.end_date is not None and summary.end_date >= through
+
+def refresh_nav(db: Session, portfolio_id: int, through=None, attempts=2):
+    """
+    Bring the portfolio's NAV series up to date through `through` (default: the last business day
+    with a final close) and return its summary. A current series is left alone; otherwise only
+    the days from the earliest changed transaction date (dirty_from) or after the last stored
+    day are computed. The series is rebuilt from scratch if the portfolio changed without
+    invalidate_nav being called. A portfolio without transactions gets an empty summary.
+    If a concurrent refresh of the same portfolio wins the commit, its summary is used when
+    current, else the refresh is redone (up to `attempts` times in all). Commits.
+    """
+    through = pd.Timestamp(through or last_complete_day()).date()
+    version = db.query(Portfolio.version).filter(Portfolio.id == portfolio_id).scalar()
+    summary = db.get(PortfolioNavSummary, portfolio_id)
+    if _is_current(summary, version, through):
+        return summary
+
+    transactions = load_ledger(db, portfolio_id)
+    first_day = first_nav_day(transactions.dates[0]).date() if len(transactions) else None
+
+    # Where to resume, and the state after the day before
+    start, opening = first_day, OPENING_STATE
+    if summary is not None and summary.end_date is not None and first_day is not None \
+            and (summary.version == version or summary.dirty_from is not None):
+        resume = (pd.Timestamp(summary.end_date) + pd.offsets.BDay(1)).date()
+        if summary.dirty_from is not None:
+            resume = min(resume, summary.dirty_from)
+        if resume > first_day:
+            kept = _opening_state(db, portfolio_id, resume)
+            if kept is not None:
+                start, opening = resume, kept
+
+    stale = db.query(PortfolioNav).filter(PortfolioNav.portfolio_id == portfolio_id)
+    if start is not None:
+        stale = stale.filter(PortfolioNav.date >= start)
+    stale.delete(synchronize_session=False)
+
+    state = opening
+    if start is not None:
+        rows, state = extend_nav(transactions, start, through, opening)
+        if len(rows):
+            records = rows.assign(portfolio_id=portfolio_id, date=rows["date"].dt.date)
+            records = records.astype(object).where(records.notna(), None).to_dict("records")
+            db.execute(insert(PortfolioNav), records)
+
+    if summary is None:
+        summary = PortfolioNavSummary(portfolio_id=portfolio_id)
+        db.add(summary)
+    summary.version = version
+    summary.start_date = first_day
+    summary.end_date = db.query(func.max(PortfolioNav.date)).filter(PortfolioNav.portfolio_id == portfolio_id).scalar()
+    summary.dirty_from = None
+    for field, value in state._asdict().items():
+        setattr(summary, field, value)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another request refreshed the same portfolio concurrently
+        db.rollback()
+        summary = db.get(PortfolioNavSummary, portfolio_id)
+        if _is_current(summary, version, through):
+            return summary
+        if attempts <= 1:
+            raise
+        return refresh_nav(db, portfolio_id, through, attempts - 1)
+    return summary
+
+def refresh_navs(db: Session, portfolio_ids, through=None):
+    """
+    NavStates of several portfolios as {portfolio_id: NavState}: current summaries are read with
+    one query, only the stale ones go through refresh_nav.
+    """
+    through = pd.Timestamp(through or last_complete_day()).date()
+    rows = db.query(Portfolio.id, Portfolio.version, PortfolioNavSummary) \
+        .outerjoin(PortfolioNavSummary, PortfolioNavSummary.portfolio_id == Portfolio.id) \
+        .filter(Portfolio.id.in_(portfolio_ids)).all()
+    states = {}
+    for portfolio_id, version, summary in rows:
+        if not _is_current(summary, version, through):
+            summary = refresh_nav(db, portfolio_id, through)
+        states[portfolio_id] = nav_state(summary)
+    return states
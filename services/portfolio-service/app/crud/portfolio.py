@@ -23,3 +23,8 @@ def update_portfolio_name(db: Session, portfolio: Portfolio, new_name: str):
 def delete_portfolio(db: Session, portfolio: Portfolio):
     db.delete(portfolio)
     db.commit()
+
+def bump_portfolio_version(db: Session, portfolio_id: int):
+    """Mark the portfolio's transactions as changed, invalidating cached analytics. Does not commit."""
+    db.query(Portfolio).filter(Portfolio.id == portfolio_id) \
+        .update({Portfolio.version: Portfolio.version + 1}, synchronize_session=False)
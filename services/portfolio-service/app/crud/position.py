@@ -0,0 +1,149 @@
+import pandas as pd
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.models import Position, Transaction
+from app.logic.ledger import action_sides
+from app.logic.positions import Holding, summarize_positions, trade_date
+
+# Net share counts closer to zero than this are treated as fully closed.
+SHARES_EPSILON = 1e-9
+
+def get_positions(db: Session, portfolio_id: int):
+    ensure_positions(db, portfolio_id)
+    return db.query(Position).filter(Position.portfolio_id == portfolio_id).order_by(Position.ticker).all()
+
+def get_holdings(db: Session, portfolio_id: int):
+    """Positions as plain Holding tuples, safe to pass to worker processes."""
+    return get_holdings_for_portfolios(db, [portfolio_id])[portfolio_id]
+
+def get_holdings_for_portfolios(db: Session, portfolio_ids):
+    """
+    Holding tuples of several portfolios from a single query, as {portfolio_id: [holdings]}.
+    On a read-only (replica) session, portfolios without stored positions are summarised in
+    memory instead of being backfilled.
+    """
+    stored = {pid for (pid,) in db.query(Position.portfolio_id).filter(Position.portfolio_id.in_(portfolio_ids)).distinct()}
+    summarised = {}
+    for portfolio_id in set(portfolio_ids) - stored:
+        if db.info.get("read_only"):
+            summarised[portfolio_id] = [
+                Holding(ticker, row.net_shares, row.cost_basis, trade_date(row.first_trade_date), trade_date(row.last_trade_date))
+                for ticker, row in _transaction_summary(db, portfolio_id).iterrows()
+            ]
+        else:
+            ensure_positions(db, portfolio_id)
+
+    holdings = {portfolio_id: [] for portfolio_id in portfolio_ids}
+    rows = db.query(
+        Position.portfolio_id, Position.ticker, Position.net_shares, Position.cost_basis,
+        Position.first_trade_date, Position.last_trade_date
+    ).filter(Position.portfolio_id.in_(portfolio_ids)).order_by(Position.portfolio_id, Position.ticker).all()
+    for portfolio_id, *row in rows:
+        holdings[portfolio_id].append(Holding(*row))
+    holdings.update(summarised)
+    return holdings
+
+def ensure_positions(db: Session, portfolio_id: int):
+    """Portfolios that predate the positions table get theirs built once from the transaction history."""
+    if db.query(Position.id).filter(Position.portfolio_id == portfolio_id).first():
+        return
+    if db.query(Transaction.id).filter(Transaction.portfolio_id == portfolio_id).first():
+        rebuild_positions(db, portfolio_id)
+        db.commit()
+
+def _transaction_summary(db: Session, portfolio_id: int):
+    rows = db.query(Transaction.date, Transaction.ticker, Transaction.action, Transaction.shares, Transaction.amount) \
+        .filter(Transaction.portfolio_id == portfolio_id).all()
+    return summarize_positions(pd.DataFrame(rows, columns=["date", "ticker", "action", "shares", "amount"]))
+
+def rebuild_positions(db: Session, portfolio_id: int):
+    """Recompute every position of a portfolio from its transactions. Does not commit."""
+    summary = _transaction_summary(db, portfolio_id)
+    db.query(Position).filter(Position.portfolio_id == portfolio_id).delete(synchronize_session=False)
+    add_positions(db, portfolio_id, summary)
+
+def add_positions(db: Session, portfolio_id: int, summary):
+    """
+    Fold newly inserted transactions, already aggregated per ticker by summarize_positions,
+    into the stored positions. Does not commit.
+    """
+    if summary.empty:
+        return
+    existing = {
+        p.ticker: p for p in db.query(Position).filter(
+            Position.portfolio_id == portfolio_id, Position.ticker.in_(summary.index.tolist())
+        )
+    }
+    for ticker, row in summary.iterrows():
+        position = existing.get(ticker)
+        if position is None:
+            db.add(Position(
+                portfolio_id=portfolio_id,
+                ticker=ticker,
+                net_shares=_snap(row.net_shares),
+                cost_basis=row.cost_basis,
+                first_trade_date=trade_date(row.first_trade_date),
+                last_trade_date=trade_date(row.last_trade_date)
+            ))
+        else:
+            position.net_shares = _snap(position.net_shares + row.net_shares)
+            position.cost_basis += row.cost_basis
+            position.first_trade_date = _earliest(position.first_trade_date, trade_date(row.first_trade_date))
+            position.last_trade_date = _latest(position.last_trade_date, trade_date(row.last_trade_date))
+    db.flush()
+
+def apply_transaction(db: Session, transaction: Transaction):
+    """Add one transaction's effect to its position. Does not commit."""
+    _apply(db, transaction.portfolio_id, transaction.ticker, transaction.action,
+           transaction.shares, transaction.amount, transaction.date, sign=1)
+
+def revert_transaction(db: Session, portfolio_id: int, ticker: str, action: str, shares: float, amount: float, date):
+    """
+    Remove a transaction's effect from its position, given the values it had when it was applied.
+    Must run after the transaction row itself was changed or deleted and flushed. Does not commit.
+    """
+    _apply(db, portfolio_id, ticker, action, shares, amount, date, sign=-1)
+
+def _apply(db, portfolio_id, ticker, action, shares, amount, date, sign):
+    delta = float(action_sides([action])[0] * shares)
+    bought = amount if delta > 0 else 0.0
+    position = db.query(Position).filter(Position.portfolio_id == portfolio_id, Position.ticker == ticker).first()
+
+    if sign > 0:
+        if position is None:
+            db.add(Position(portfolio_id=portfolio_id, ticker=ticker, net_shares=_snap(delta), cost_basis=bought,
+                            first_trade_date=date, last_trade_date=date))
+        else:
+            position.net_shares = _snap(position.net_shares + delta)
+            position.cost_basis += bought
+            position.first_trade_date = _earliest(position.first_trade_date, date)
+            position.last_trade_date = _latest(position.last_trade_date, date)
+        db.flush()
+        return
+
+    if position is None:
+        return
+    position.net_shares = _snap(position.net_shares - delta)
+    position.cost_basis -= bought
+
+    # Trade date bounds can't be decremented; look them up again only if this trade was on one
+    # (an undated trade may have been the only one).
+    if date is None or date in (position.first_trade_date, position.last_trade_date):
+        count, first, last = db.query(func.count(Transaction.id), func.min(Transaction.date), func.max(Transaction.date)).filter(
+            Transaction.portfolio_id == portfolio_id, Transaction.ticker == ticker
+        ).one()
+        if not count:
+            db.delete(position)  # No trades left in this ticker
+            db.flush()
+            return
+        position.first_trade_date, position.last_trade_date = first, last
+
+def _earliest(a, b):
+    # Undated trades (None) do not move the bounds
+    return b if a is None else a if b is None else min(a, b)
+
+def _latest(a, b):
+    return b if a is None else a if b is None else max(a, b)
+
+def _snap(shares):
+    return 0.0 if abs(shares) < SHARES_EPSILON else shares
@@ -0,0 +1,55 @@
+import datetime
+import json
+from sqlalchemy import and_, func, insert
+from sqlalchemy.orm import Session
+from app.models import Portfolio, SuggestedAllocation
+
+def get_suggested_allocation(db: Session, portfolio_id: int):
+    return db.get(SuggestedAllocation, portfolio_id)
+
+def _pending(db: Session, columns, as_of, target_return, portfolio_ids=None):
+    done = and_(
+        SuggestedAllocation.portfolio_id == Portfolio.id,
+        SuggestedAllocation.as_of == as_of,
+        SuggestedAllocation.target_return == target_return,
+        SuggestedAllocation.version == Portfolio.version
+    )
+    query = db.query(*columns).select_from(Portfolio).outerjoin(SuggestedAllocation, done) \
+        .filter(SuggestedAllocation.portfolio_id.is_(None))
+    if portfolio_ids is not None:
+        query = query.filter(Portfolio.id.in_(portfolio_ids))
+    return query
+
+def count_pending_portfolios(db: Session, as_of, target_return, portfolio_ids=None):
+    return _pending(db, [func.count(Portfolio.id)], as_of, target_return, portfolio_ids).scalar()
+
+def pending_portfolios(db: Session, as_of, target_return, after_id=0, limit=1000, portfolio_ids=None):
+    """
+    {portfolio_id: version} of up to `limit` portfolios with IDs above after_id, in ID order, that
+    have no suggestion for this as_of day, target return and their current version, so an
+    interrupted run resumes where it stopped.
+    """
+    query = _pending(db, [Portfolio.id, Portfolio.version], as_of, target_return, portfolio_ids)
+    return dict(query.filter(Portfolio.id > after_id).order_by(Portfolio.id).limit(limit).all())
+
+def save_suggested_allocations(db: Session, as_of, target_return, versions, results):
+    """
+    Replace the suggestions of the portfolios in results ({portfolio_id: optimization result})
+    in one statement each for the delete and the insert. versions maps portfolio_id to the
+    Portfolio.version the result was computed from. Commits.
+    """
+    if not results:
+        return
+    db.query(SuggestedAllocation).filter(SuggestedAllocation.portfolio_id.in_(list(results))) \
+        .delete(synchronize_session=False)
+    now = datetime.datetime.utcnow()
+    db.execute(insert(SuggestedAllocation), [{
+        "portfolio_id": portfolio_id,
+        "as_of": as_of,
+        "version": versions[portfolio_id],
+        "target_return": target_return,
+        "status": "succeeded" if "optimized_allocation" in result else "failed",
+        "result": json.dumps(result),
+        "created_at": now
+    } for portfolio_id, result in results.items()])
+    db.commit()
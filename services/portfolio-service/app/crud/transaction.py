@@ -1,12 +1,107 @@
+import csv
+from io import StringIO
+import pandas as pd
+from sqlalchemy import and_, func, insert, or_, select, tuple_
 from sqlalchemy.orm import Session
 from app.models import Transaction
+from app.logic.ledger import TRANSACTION_COLUMNS, Ledger
+
+BULK_COLUMNS = ["portfolio_id", "date", "ticker", "action", "shares", "price", "amount", "notes"]
 
 def get_transactions_by_portfolio(db: Session, portfolio_id: int):
     return db.query(Transaction).filter(Transaction.portfolio_id == portfolio_id).all()
 
+def traded_tickers(db: Session):
+    """{ticker: date of its first transaction} over every portfolio, from the ticker index."""
+    rows = db.query(Transaction.ticker, func.min(Transaction.date)).group_by(Transaction.ticker).all()
+    return {ticker: first for ticker, first in rows if ticker}
+
+def load_ledger(db: Session, portfolio_id: int):
+    """A portfolio's transactions as a Ledger (see load_ledgers)."""
+    return load_ledgers(db, [portfolio_id])[portfolio_id]
+
+def load_ledgers(db: Session, portfolio_ids):
+    """
+    Transactions of several portfolios in one query, as {portfolio_id: Ledger}. Only
+    TRANSACTION_COLUMNS are selected and no ORM objects are built: PostgreSQL streams the
+    result as CSV through COPY, elsewhere the cursor's rows go straight into a frame, which
+    is then split into per-portfolio ledgers.
+    """
+    query = select(Transaction.portfolio_id, *(getattr(Transaction, c) for c in TRANSACTION_COLUMNS)) \
+        .where(Transaction.portfolio_id.in_(portfolio_ids)) \
+        .order_by(Transaction.portfolio_id, Transaction.date)
+    columns = ["portfolio_id"] + TRANSACTION_COLUMNS
+
+    if db.get_bind().dialect.name == "postgresql":
+        sql = query.compile(dialect=db.get_bind().dialect, compile_kwargs={"literal_binds": True})
+        buffer = StringIO()
+        cursor = db.connection().connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv)", buffer)
+        finally:
+            cursor.close()
+        buffer.seek(0)
+        frame = pd.read_csv(buffer, names=columns, dtype={"ticker": str, "action": str})
+    else:
+        frame = pd.DataFrame.from_records(db.execute(query).fetchall(), columns=columns)
+
+    ledgers = {pid: Ledger.from_frame(group) for pid, group in frame.groupby("portfolio_id")}
+    return {pid: ledgers[pid] if pid in ledgers else Ledger.empty() for pid in portfolio_ids}
+
+LISTING_COLUMNS = (
+    Transaction.id, Transaction.portfolio_id, Transaction.date, Transaction.ticker, Transaction.action,
+    Transaction.shares, Transaction.price, Transaction.amount, Transaction.notes
+)
+
+def list_transactions(db: Session, portfolio_ids, ticker=None, start=None, end=None, after=None):
+    """
+    Query of plain transaction rows in (portfolio_id, date, id) order, rows without a date last
+    within their portfolio (the order of the (portfolio_id, date, id) index in PostgreSQL).
+    portfolio_ids: list or subquery of portfolio ids. start/end bound the date as [start, end).
+    after: (portfolio_id, date or None, id) of the last row already returned, for keyset pagination.
+    """
+    query = db.query(*LISTING_COLUMNS).filter(Transaction.portfolio_id.in_(portfolio_ids))
+    if ticker:
+        query = query.filter(Transaction.ticker == ticker)
+    if start is not None:
+        query = query.filter(Transaction.date >= start)
+    if end is not None:
+        query = query.filter(Transaction.date < end)
+    if after is not None:
+        portfolio_id, day, transaction_id = after
+        # A row comparison is NULL on a NULL date, so the undated rows after the cursor are added explicitly
+        undated = and_(Transaction.portfolio_id == portfolio_id, Transaction.date.is_(None))
+        if day is None:
+            query = query.filter(or_(Transaction.portfolio_id > portfolio_id, and_(undated, Transaction.id > transaction_id)))
+        else:
+            query = query.filter(or_(tuple_(Transaction.portfolio_id, Transaction.date, Transaction.id) > tuple_(*after), undated))
+    return query.order_by(Transaction.portfolio_id, Transaction.date.asc().nulls_last(), Transaction.id)
+
 def get_transaction(db: Session, transaction_id: int):
     return db.query(Transaction).filter(Transaction.id == transaction_id).first()
 
+def bulk_insert_transactions(db: Session, portfolio_id: int, rows):
+    """
+    Insert a DataFrame of validated transactions without building ORM objects.
+    Uses COPY on PostgreSQL and an executemany INSERT elsewhere. Does not commit.
+    """
+    frame = rows.assign(portfolio_id=portfolio_id)[BULK_COLUMNS]
+
+    if db.get_bind().dialect.name == "postgresql":
+        buffer = StringIO()
+        frame.to_csv(buffer, header=False, index=False, quoting=csv.QUOTE_MINIMAL, date_format="%Y-%m-%d %H:%M:%S")
+        buffer.seek(0)
+        cursor = db.connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {Transaction.__tablename__} ({', '.join(BULK_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                buffer
+            )
+        finally:
+            cursor.close()
+    else:
+        db.execute(insert(Transaction), frame.to_dict("records"))
+
 def update_transaction(db: Session, transaction: Transaction, updated_data: dict):
     for key, value in updated_data.items():
         setattr(transaction, key, value)
@@ -0,0 +1,61 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from app.instrumentation import start_worker_metrics
+
+# Worker processes for CPU-bound analytics. 0 runs them on the default thread pool instead (tests, dev).
+ANALYTICS_WORKERS = int(os.getenv("ANALYTICS_WORKERS", str(os.cpu_count() or 1)))
+# Jobs allowed to wait for a free worker; anything beyond that is rejected with 503.
+ANALYTICS_QUEUE_LIMIT = int(os.getenv("ANALYTICS_QUEUE_LIMIT", "16"))
+ANALYTICS_RETRY_AFTER = int(os.getenv("ANALYTICS_RETRY_AFTER", "5"))
+
+_executor = None
+_in_flight = 0
+
+
+class AnalyticsOverloaded(Exception):
+    """Raised when every worker is busy and the wait queue is full."""
+
+
+def get_executor():
+    global _executor
+    if _executor is None and ANALYTICS_WORKERS > 0:
+        # spawn: forked children would inherit the parent's DB connection pool and threads.
+        _executor = ProcessPoolExecutor(max_workers=ANALYTICS_WORKERS, mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=start_worker_metrics)
+    return _executor
+
+
+def capacity():
+    return max(ANALYTICS_WORKERS, 1) + ANALYTICS_QUEUE_LIMIT
+
+
+async def run_cpu(fn, *args, **kwargs):
+    """
+    Run fn(*args, **kwargs) in the analytics process pool and await the result.
+    fn and its arguments must be picklable (module-level functions, plain data).
+    """
+    global _in_flight, _executor
+    if _in_flight >= capacity():
+        raise AnalyticsOverloaded()
+
+    _in_flight += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_executor(), partial(fn, *args, **kwargs))
+    except BrokenProcessPool:
+        _executor = None  # A worker died; start a fresh pool for the next request
+        raise
+    finally:
+        _in_flight -= 1
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,226 @@
+import atexit
+import os
+import shutil
+import tempfile
+import time
+from contextvars import ContextVar
+from types import SimpleNamespace
+
+# Set to false to turn instrumentation off entirely: no middleware, no SQLAlchemy listeners,
+# no /metrics route, and every record_* hook below is a no-op.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# [query count, query seconds] of the request being handled, shared with the threads it runs DB work on
+_request_db = ContextVar("request_db", default=None)
+
+# The metrics of this process once start_metrics (web process) or start_worker_metrics (analytics
+# worker) has run; until then every hook is a no-op. _owned_dir: the samples directory start_metrics
+# created because PROMETHEUS_MULTIPROC_DIR was not configured, removed again by stop_metrics.
+_metrics = None
+_owned_dir = None
+
+
+def _create_metrics():
+    # Imported only now: prometheus_client picks multiprocess mode from PROMETHEUS_MULTIPROC_DIR on import.
+    # Samples are read back from the directory by /metrics, so nothing goes in the default registry.
+    from prometheus_client import Counter, Histogram
+
+    return SimpleNamespace(
+        request_latency=Histogram(
+            "http_request_duration_seconds", "Request latency by route template",
+            ["method", "route", "status"], buckets=LATENCY_BUCKETS, registry=None
+        ),
+        request_db_queries=Histogram(
+            "http_request_db_queries", "Database queries issued per request", ["route"], buckets=COUNT_BUCKETS, registry=None
+        ),
+        request_db_seconds=Histogram(
+            "http_request_db_seconds", "Time spent in database queries per request", ["route"], buckets=LATENCY_BUCKETS,
+            registry=None
+        ),
+        db_query_latency=Histogram(
+            "db_query_duration_seconds", "Latency of individual database queries", buckets=LATENCY_BUCKETS, registry=None
+        ),
+        price_fetch_latency=Histogram(
+            "price_fetch_duration_seconds", "Latency of price downloads from the upstream provider",
+            buckets=LATENCY_BUCKETS, registry=None
+        ),
+        price_fetch_tickers=Counter("price_fetch_tickers", "Tickers requested from the upstream provider", registry=None),
+        cache_lookups=Counter("cache_lookups", "Cache lookups by cache and result", ["cache", "result"], registry=None),
+        optimizer_solve_latency=Histogram(
+            "optimizer_solve_duration_seconds", "Portfolio optimizer solve time", buckets=LATENCY_BUCKETS, registry=None
+        ),
+        optimizer_iterations=Histogram("optimizer_iterations", "Iterations per optimizer solve", buckets=COUNT_BUCKETS, registry=None),
+        upload_rows=Counter("upload_rows", "CSV upload rows by outcome", ["result"], registry=None),
+        upload_throughput=Histogram(
+            "upload_rows_per_second", "Rows imported per second per CSV upload",
+            buckets=(100, 1000, 5000, 10000, 25000, 50000, 100000, 250000, 500000, 1000000), registry=None
+        ),
+    )
+
+
+def start_metrics():
+    """
+    Turn metrics on in the web process (called from the app lifespan). Every process writes its
+    samples under PROMETHEUS_MULTIPROC_DIR and /metrics aggregates them; if it is not configured,
+    a temporary directory is created for the app's lifetime. It is set in the environment so the
+    analytics workers, spawned later, inherit it. A configured directory should be emptied by the
+    deployment between runs.
+    """
+    global _metrics, _owned_dir
+    if not METRICS_ENABLED or _metrics is not None:
+        return
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        _owned_dir = tempfile.mkdtemp(prefix="portfolio-metrics-")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = _owned_dir
+    _metrics = _create_metrics()
+
+
+def stop_metrics():
+    """Turn metrics off again (app lifespan shutdown), removing the samples directory if start_metrics created it."""
+    global _metrics, _owned_dir
+    if _metrics is None:
+        return
+    _metrics = None
+    _mark_process_dead(os.getpid())
+    if _owned_dir is not None:
+        os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+        shutil.rmtree(_owned_dir, ignore_errors=True)
+        _owned_dir = None
+
+
+def start_worker_metrics():
+    """Initializer of the analytics worker processes: record into the web process's samples directory, if any."""
+    global _metrics
+    if METRICS_ENABLED and os.environ.get("PROMETHEUS_MULTIPROC_DIR") and _metrics is None:
+        _metrics = _create_metrics()
+        atexit.register(_mark_process_dead, os.getpid())
+
+
+def _mark_process_dead(pid):
+    # Drops the exited process's live gauge files; its counters and histograms stay in the totals.
+    from prometheus_client import multiprocess
+
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory and os.path.isdir(directory):
+        multiprocess.mark_process_dead(pid, directory)
+
+
+def record_price_fetch(tickers, seconds):
+    if _metrics is not None:
+        _metrics.price_fetch_tickers.inc(tickers)
+        _metrics.price_fetch_latency.observe(seconds)
+
+
+def record_cache_lookups(cache, hits, misses):
+    if _metrics is None:
+        return
+    if hits:
+        _metrics.cache_lookups.labels(cache, "hit").inc(hits)
+    if misses:
+        _metrics.cache_lookups.labels(cache, "miss").inc(misses)
+
+
+def record_optimizer_solve(seconds, iterations):
+    if _metrics is not None:
+        _metrics.optimizer_solve_latency.observe(seconds)
+        _metrics.optimizer_iterations.observe(iterations)
+
+
+def record_upload(imported, failed, seconds):
+    if _metrics is None:
+        return
+    _metrics.upload_rows.labels("imported").inc(imported)
+    _metrics.upload_rows.labels("failed").inc(failed)
+    if seconds > 0:
+        _metrics.upload_throughput.observe((imported + failed) / seconds)
+
+
+def _route_template(scope):
+    """Route path with placeholders, e.g. /portfolio/metrics/{portfolio_id}, to keep label cardinality bounded."""
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+    # Depending on the FastAPI version the matched route may not carry its router's prefix;
+    # take the prefix from the leading segments of the concrete path.
+    segments = scope["path"].rstrip("/").split("/")
+    depth = len(route.path.rstrip("/").split("/"))
+    return "/".join(segments[:len(segments) - depth + 1]) + route.path
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency and database usage per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or _metrics is None:
+            return await self.app(scope, receive, send)
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        db = [0, 0.0]
+        token = _request_db.set(db)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_db.reset(token)
+            metrics = _metrics
+            if metrics is not None:
+                route = _route_template(scope)
+                metrics.request_latency.labels(scope["method"], route, str(status)).observe(elapsed)
+                metrics.request_db_queries.labels(route).observe(db[0])
+                metrics.request_db_seconds.labels(route).observe(db[1])
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    metrics = _metrics
+    if metrics is None:
+        return
+    elapsed = time.perf_counter() - context._query_started
+    metrics.db_query_latency.observe(elapsed)
+    db = _request_db.get()
+    if db is not None:
+        db[0] += 1
+        db[1] += elapsed
+
+
+def instrument_app(app):
+    """
+    Install the request middleware, the SQLAlchemy query listeners and GET /metrics. They record
+    nothing until start_metrics has run.
+    """
+    if not METRICS_ENABLED:
+        return
+
+    from fastapi import Response
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    app.add_middleware(MetricsMiddleware)
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, generate_latest, multiprocess
+
+        registry = CollectorRegistry()
+        if _metrics is not None:
+            multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
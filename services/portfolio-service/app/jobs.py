@@ -0,0 +1,150 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+
+from app.crud.job import claim_next_job, delete_expired_jobs, finish_job, release_job
+from app.database import ReadSessionLocal, SessionLocal
+from app.executor import AnalyticsOverloaded
+from app.logic.price_provider import price_data_as_of
+
+# Concurrent jobs per process. 0 runs none here, e.g. when a separate process works the queue.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Idle workers look for new jobs this often (seconds); submissions in this process wake them at once.
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+# Finished jobs and their results are deleted this long after they finish.
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "3600"))
+# Jobs running for longer than this are assumed to have lost their worker and are run again.
+JOB_STALE_AFTER = int(os.getenv("JOB_STALE_AFTER", "1800"))
+# A job whose worker was lost this many times is marked failed rather than run again.
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_CLEANUP_INTERVAL = 300
+
+# kind -> async handler(db, portfolio_id, **params) returning a JSON-serialisable result
+JOB_HANDLERS = {}
+
+_wakeup = None
+_workers = []
+
+
+def job_handler(kind):
+    """Register an async function as the handler of a job kind."""
+    def register(fn):
+        JOB_HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+def dedupe_key(kind, portfolio_id, version, params):
+    """Identical submissions (same inputs and the same price data) share one job."""
+    payload = json.dumps([kind, portfolio_id, version, str(price_data_as_of()), params], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def notify_workers():
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+def _claim():
+    db = SessionLocal()
+    try:
+        job = claim_next_job(db, JOB_STALE_AFTER, JOB_MAX_ATTEMPTS, JOB_RESULT_TTL)
+        return (job.id, job.kind, job.portfolio_id, json.loads(job.params)) if job else None
+    finally:
+        db.close()
+
+
+def _finish(job_id, result=None, error=None):
+    db = SessionLocal()
+    try:
+        finish_job(db, job_id, JOB_RESULT_TTL, result=result, error=error)
+    finally:
+        db.close()
+
+
+def _release(job_id):
+    db = SessionLocal()
+    try:
+        release_job(db, job_id)
+    finally:
+        db.close()
+
+
+def _cleanup():
+    db = SessionLocal()
+    try:
+        return delete_expired_jobs(db)
+    finally:
+        db.close()
+
+
+async def run_next_job():
+    """Claim and run one job. Returns False if there was nothing to run or it had to be put back."""
+    claimed = await run_in_threadpool(_claim)
+    if claimed is None:
+        return False
+
+    job_id, kind, portfolio_id, params = claimed
+    db = ReadSessionLocal()
+    try:
+        result = await JOB_HANDLERS[kind](db, portfolio_id, **params)
+    except AnalyticsOverloaded:
+        await run_in_threadpool(_release, job_id)
+        return False
+    except asyncio.CancelledError:
+        _release(job_id)  # Shutting down: leave the job for the next worker
+        raise
+    except HTTPException as e:
+        await run_in_threadpool(_finish, job_id, error=str(e.detail))
+    except Exception as e:
+        print(f"Job {job_id} ({kind}) failed: {e}")
+        await run_in_threadpool(_finish, job_id, error="Job failed")
+    else:
+        await run_in_threadpool(_finish, job_id, result=jsonable_encoder(result))
+    finally:
+        await run_in_threadpool(db.close)
+    return True
+
+
+async def _worker_loop():
+    last_cleanup = 0.0
+    while True:
+        try:
+            if await run_next_job():
+                continue
+            if time.monotonic() - last_cleanup > JOB_CLEANUP_INTERVAL:
+                last_cleanup = time.monotonic()
+                await run_in_threadpool(_cleanup)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Job worker error: {e}")
+
+        _wakeup.clear()
+        try:
+            await asyncio.wait_for(_wakeup.wait(), JOB_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_job_workers():
+    """Start JOB_WORKERS worker tasks on the running event loop (called from the app lifespan)."""
+    global _wakeup
+    _wakeup = asyncio.Event()
+    _workers.extend(asyncio.create_task(_worker_loop()) for _ in range(JOB_WORKERS))
+
+
+async def stop_job_workers():
+    """Cancel the workers; the jobs they were running go back to the queue."""
+    global _wakeup
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    _wakeup = None
@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+
+# Estimators selectable for the optimizer's covariance (see ReturnStatsCache.statistics):
+#   sample       pairwise-complete sample covariance, projected to positive semi-definite
+#   ledoit_wolf  that covariance shrunk towards a scaled identity (Ledoit & Wolf, 2004)
+#   factor       low-rank statistical factor model fitted from the returns (thin SVD), kept as
+#                loadings and specific variances; never forms the n x n matrix
+ESTIMATORS = ("sample", "ledoit_wolf", "factor")
+
+
+class FactorCovariance:
+    """
+    Covariance in factored form, loadings @ loadings.T + diag(specific): n * (k + 1) numbers
+    for n assets and k factors instead of n * n. Supports cov @ w, so it can stand in for the
+    matrix wherever only products with weights are taken; the optimizer solves on it directly.
+    """
+
+    def __init__(self, loadings, specific, tickers=None):
+        self.loadings = np.asarray(loadings, dtype=float)
+        self.specific = np.asarray(specific, dtype=float)
+        self.tickers = list(tickers) if tickers is not None else None
+
+    @property
+    def shape(self):
+        return (len(self.specific), len(self.specific))
+
+    def __len__(self):
+        return len(self.specific)
+
+    def __matmul__(self, weights):
+        weights = np.asarray(weights, dtype=float)
+        return self.loadings @ (self.loadings.T @ weights) + (self.specific * weights.T).T
+
+    def diagonal(self):
+        return np.einsum("ij,ij->i", self.loadings, self.loadings) + self.specific
+
+    def subset(self, index):
+        """The covariance of the assets at positions `index`."""
+        tickers = [self.tickers[i] for i in index] if self.tickers is not None else None
+        return FactorCovariance(self.loadings[index], self.specific[index], tickers)
+
+    def solve(self, rhs):
+        """cov^-1 rhs by the Woodbury identity, in O(n k^2) without forming the n x n matrix."""
+        scaled = self.loadings / self.specific[:, None]
+        inner = np.eye(self.loadings.shape[1]) + self.loadings.T @ scaled
+        rhs = np.asarray(rhs, dtype=float)
+        direct = (rhs.T / self.specific).T
+        return direct - scaled @ np.linalg.solve(inner, self.loadings.T @ direct)
+
+    def to_numpy(self):
+        """The full matrix, for callers that need it; avoid for large universes."""
+        return self.loadings @ self.loadings.T + np.diag(self.specific)
+
+
+def pairwise_covariance(returns):
+    """
+    Sample covariance (ddof 1) of returns (periods x assets, NaN where an asset has no return),
+    each pair over the days both have one; 0 for pairs with fewer than two such days.
+    """
+    cov = pd.DataFrame(returns).cov().to_numpy()
+    return np.where(np.isnan(cov), 0.0, cov)
+
+
+def nearest_psd(cov):
+    """
+    cov if it is positive semi-definite, else the nearest positive semi-definite matrix in the
+    Frobenius norm (negative eigenvalues set to 0). Pairwise-complete covariances of series with
+    different histories need not be positive semi-definite.
+    """
+    cov = (cov + cov.T) / 2
+    ridge = 1e-12 * max(float(np.abs(np.diag(cov)).mean()), 1e-18) if len(cov) else 0.0
+    try:
+        np.linalg.cholesky(cov + ridge * np.eye(len(cov)))
+        return cov
+    except np.linalg.LinAlgError:
+        values, vectors = np.linalg.eigh(cov)
+        return (vectors * np.maximum(values, 0.0)) @ vectors.T
+
+
+def ledoit_wolf(returns, periods_per_year=1, sample=None):
+    """
+    Ledoit-Wolf shrinkage (Ledoit & Wolf, 2004) of the pairwise-complete sample covariance of
+    `returns` (periods x assets, NaN where an asset has no return) towards mu * I, mu the average
+    variance, with the intensity that minimises the expected Frobenius loss. The variance of each
+    entry's estimate is taken over that pair's common days, so with no gaps this is the usual
+    estimator. sample: that covariance, already computed and annualised, if at hand.
+    Well conditioned even with more assets than periods.
+    """
+    X = np.asarray(returns, dtype=float)
+    observed = ~np.isnan(X)
+    X = np.where(observed, X - np.nanmean(X, axis=0), 0.0)
+    n = X.shape[1]
+    sample = pairwise_covariance(returns) if sample is None else np.asarray(sample, dtype=float) / periods_per_year
+    sample = nearest_psd(sample)
+    mu = np.trace(sample) / n
+
+    # Variance of each entry's estimate over its N_ij common days: (sum x_i^2 x_j^2 / N - (sum x_i x_j / N)^2) / N
+    counts = observed.T.astype(float) @ observed.astype(float)
+    products, squares = X.T @ X, (X ** 2).T @ (X ** 2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        entry_variance = np.where(counts > 0, (squares / counts - (products / counts) ** 2) / counts, 0.0)
+    beta = entry_variance.sum() / n
+    delta = np.sum((sample - mu * np.eye(n)) ** 2) / n
+    shrinkage = 0.0 if delta <= 0 else min(max(beta, 0.0), delta) / delta
+
+    shrunk = (1 - shrinkage) * sample
+    shrunk[np.diag_indices(n)] += shrinkage * mu
+    return shrunk * periods_per_year
+
+
+def factor_model(returns, factors, periods_per_year=1, tickers=None):
+    """
+    Statistical factor model fitted directly from a returns DataFrame (periods x tickers, NaN
+    where a ticker has no return): the `factors` leading principal components of the demeaned
+    returns as loadings, and each asset's remaining variance as its specific variance (floored so
+    the result stays positive definite). Gaps are filled with the ticker's mean and each column is
+    scaled to its own-history variance, so a thin SVD of the T x n returns is all it takes; the
+    n x n covariance is never formed.
+    """
+    frame = pd.DataFrame(returns)
+    values = frame.to_numpy(dtype=float)
+    observed = ~np.isnan(values)
+    counts = np.maximum(observed.sum(axis=0) - 1, 1)
+    centred = np.where(observed, values - np.nanmean(values, axis=0), 0.0)
+    scaled = centred * np.sqrt(periods_per_year / counts)
+
+    n = scaled.shape[1]
+    factors = max(0, min(factors, n - 1, len(scaled)))
+    if factors:
+        _, singular, vt = np.linalg.svd(scaled, full_matrices=False)
+        loadings = vt[:factors].T * singular[:factors]
+    else:
+        loadings = np.zeros((n, 0))
+
+    variances = np.sum(scaled ** 2, axis=0)
+    floor = 1e-6 * max(float(variances.mean()), 1e-18)
+    specific = np.maximum(variances - np.sum(loadings ** 2, axis=1), floor)
+    return FactorCovariance(loadings, specific, list(frame.columns) if tickers is None else tickers)
+
+
+def estimate_covariance(returns, estimator, periods_per_year=1, factors=10, sample=None):
+    """
+    Covariance of a returns DataFrame (periods x tickers, NaN where a ticker has no return) by
+    `estimator`: "sample" (the pairwise-complete sample covariance, `sample` if already computed,
+    projected to positive semi-definite) and "ledoit_wolf" as DataFrames, "factor" as a
+    FactorCovariance fitted straight from the returns without any n x n matrix.
+    """
+    tickers = list(returns.columns)
+    if estimator == "factor":
+        return factor_model(returns, factors, periods_per_year, tickers)
+    if sample is None:
+        sample = pairwise_covariance(returns) * periods_per_year
+    if estimator == "sample":
+        return pd.DataFrame(nearest_psd(sample), index=tickers, columns=tickers)
+    if estimator == "ledoit_wolf":
+        return pd.DataFrame(ledoit_wolf(returns, periods_per_year, sample), index=tickers, columns=tickers)
+    raise ValueError(f"Unknown covariance estimator: {estimator}")
+
+
+def as_covariance(cov):
+    """A covariance as the optimizer takes it: a FactorCovariance as is, anything else as an array."""
+    return cov if isinstance(cov, FactorCovariance) else np.asarray(cov, dtype=float)
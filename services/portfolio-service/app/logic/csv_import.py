@@ -0,0 +1,148 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.crud.position import add_positions
+from app.instrumentation import record_upload
+from app.crud.transaction import bulk_insert_transactions
+from app.logic.positions import summarize_positions
+
+REQUIRED_COLUMNS = ["date", "ticker", "action", "shares", "price", "amount", "notes"]
+
+# Rows parsed, validated and inserted at a time; bounds memory regardless of file size.
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "50000"))
+# Per-row errors returned in the response; the total count is always reported.
+MAX_REPORTED_ERRORS = int(os.getenv("IMPORT_MAX_REPORTED_ERRORS", "100"))
+
+# Date formats a file may use, in order of preference when its dates fit more than one
+# (01/02/2023 is read month first unless a date such as 13/02/2023 rules that out).
+# Maps each pandas format to how it is shown in row errors.
+DATE_FORMATS = {
+    "ISO8601": "YYYY-MM-DD",
+    "%m/%d/%Y": "MM/DD/YYYY",
+    "%d/%m/%Y": "DD/MM/YYYY",
+    "%Y/%m/%d": "YYYY/MM/DD",
+    "%d.%m.%Y": "DD.MM.YYYY",
+}
+
+
+class CSVImportError(ValueError):
+    pass
+
+
+def open_transaction_csv(fileobj, chunksize=IMPORT_CHUNK_SIZE):
+    """
+    Check the CSV header and return an iterator of raw string chunks.
+    Raises CSVImportError if required columns are missing or the file is not a CSV.
+    """
+    try:
+        header = pd.read_csv(fileobj, nrows=0, encoding="utf-8")
+        fileobj.seek(0)
+        missing = set(REQUIRED_COLUMNS) - set(header.columns)
+        if missing:
+            raise CSVImportError(f"CSV missing columns: {missing}")
+        return pd.read_csv(fileobj, usecols=REQUIRED_COLUMNS, dtype=str, chunksize=chunksize, encoding="utf-8")
+    except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as e:
+        raise CSVImportError(f"Could not parse CSV: {e}")
+
+
+def infer_date_format(dates):
+    """
+    The DATE_FORMATS entry the file's dates are written in, decided once from its first chunk:
+    the first format every date parses with, else the one most of them parse with.
+    """
+    dates = pd.Index(dates.dropna().unique()).str.strip()
+    best, parsed_best = next(iter(DATE_FORMATS)), -1
+    for date_format in DATE_FORMATS:
+        parsed = int(pd.to_datetime(dates, errors="coerce", format=date_format).notna().sum())
+        if parsed == len(dates):
+            return date_format
+        if parsed > parsed_best:
+            best, parsed_best = date_format, parsed
+    return best
+
+
+def parse_dates(dates, date_format):
+    """
+    Dates in date_format as datetimes, NaT where missing or not in that format. Each distinct
+    value is parsed once: files repeat dates heavily, and non-ISO formats parse slowly in pandas.
+    """
+    codes, uniques = pd.factorize(dates)
+    parsed = pd.to_datetime(pd.Index(uniques).str.strip(), errors="coerce", format=date_format)
+    return pd.Series(parsed.take(codes, allow_fill=True, fill_value=pd.NaT), index=dates.index)
+
+
+def validate_chunk(chunk, date_format=None):
+    """
+    Coerce one chunk to typed columns, parsing dates with date_format (inferred from this chunk
+    if not given); dates in any other format are invalid. Returns (valid_rows, rejected) where
+    rejected maps the file line number of every invalid row to the reasons it was rejected.
+    """
+    date_format = date_format or infer_date_format(chunk["date"])
+    ticker = chunk["ticker"].str.strip()
+    action = chunk["action"].str.strip().str.lower()
+    values = pd.DataFrame({
+        "date": parse_dates(chunk["date"], date_format),
+        "ticker": ticker,
+        "action": action,
+        "shares": pd.to_numeric(chunk["shares"], errors="coerce"),
+        "price": pd.to_numeric(chunk["price"], errors="coerce"),
+        "amount": pd.to_numeric(chunk["amount"], errors="coerce"),
+        "notes": chunk["notes"].fillna(""),
+    }, index=chunk.index)
+
+    checks = [
+        (values["date"].isna(), f"invalid date (expected {DATE_FORMATS[date_format]})"),
+        (ticker.isna() | (ticker == ""), "missing ticker"),
+        (~action.isin(["buy", "sell"]), "action must be buy or sell"),
+        (~(values["shares"] > 0), "shares must be a positive number"),
+        (~(values["price"] >= 0), "price must be a non-negative number"),
+        (values["amount"].isna(), "amount must be a number"),
+    ]
+
+    invalid = np.zeros(len(chunk), dtype=bool)
+    for mask, _ in checks:
+        invalid |= mask.to_numpy()
+
+    reasons = pd.Series("", index=chunk.index[invalid], dtype=object)
+    if invalid.any():
+        for mask, message in checks:
+            mask = mask[invalid]
+            reasons = reasons.where(~mask, reasons + message + "; ")
+        # +2: one for the header line, one because file lines are 1-based
+        reasons.index = reasons.index + 2
+
+    return values[~invalid], reasons.str.rstrip("; ")
+
+
+def import_transactions(db, portfolio_id, chunks):
+    """
+    Validate and bulk insert every chunk into the portfolio within the caller's transaction,
+    folding each chunk into the portfolio's positions as it goes. The date format is inferred
+    from the first chunk and applies to the whole file.
+    """
+    date_format = None
+    imported = 0
+    failed = 0
+    errors = []
+    started = time.perf_counter()
+
+    try:
+        for chunk in chunks:
+            date_format = date_format or infer_date_format(chunk["date"])
+            valid, rejected = validate_chunk(chunk, date_format)
+            failed += len(rejected)
+            for row, reason in rejected.head(MAX_REPORTED_ERRORS - len(errors)).items():
+                errors.append({"row": int(row), "error": reason})
+
+            if not valid.empty:
+                bulk_insert_transactions(db, portfolio_id, valid)
+                add_positions(db, portfolio_id, summarize_positions(valid))
+                imported += len(valid)
+    except (pd.errors.ParserError, UnicodeDecodeError) as e:
+        raise CSVImportError(f"Could not parse CSV: {e}")
+
+    record_upload(imported, failed, time.perf_counter() - started)
+    return {"rows_imported": imported, "rows_failed": failed, "errors": errors}
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+# Supported valuation frequencies and how their periods are labelled in responses.
+FREQUENCIES = {
+    "daily": "%Y-%m-%d",
+    "weekly": "%Y-%m-%d",
+    "monthly": "%Y-%m",
+}
+
+
+def period_grid(start_date, end_date, frequency="monthly"):
+    """
+    End dates of every period between start_date and end_date.
+    Daily uses business days, weekly ends on Fridays, monthly on the last calendar day.
+    """
+    if frequency == "daily":
+        return pd.bdate_range(start_date, end_date)
+    if frequency == "weekly":
+        periods = pd.period_range(start=start_date, end=end_date, freq="W-FRI")
+    elif frequency == "monthly":
+        periods = pd.period_range(start=start_date, end=end_date, freq="M")
+    else:
+        raise ValueError(f"Unsupported frequency: {frequency}")
+    return periods.to_timestamp(how="end").normalize()
+
+
+def period_labels(grid, frequency="monthly"):
+    return grid.strftime(FREQUENCIES[frequency]).tolist()
+
+
+def holdings_matrix(dates, ticker_codes, shares_delta, num_tickers, grid):
+    """
+    Shares held at the end of every period, shape (len(grid), num_tickers).
+    Each transaction lands in the first period ending on or after its date; the
+    per-period flows are then accumulated with one cumsum.
+    """
+    dates = np.asarray(dates, dtype="datetime64[D]")
+    period_index = np.searchsorted(grid.values.astype("datetime64[D]"), dates, side="left")
+    inside = period_index < len(grid)
+
+    flows = np.zeros((len(grid), num_tickers))
+    np.add.at(flows, (period_index[inside], np.asarray(ticker_codes)[inside]), np.asarray(shares_delta)[inside])
+    return np.cumsum(flows, axis=0)
+
+
+def aligned_prices(daily_prices, tickers, grid):
+    """Last close on or before each period end, shape (len(grid), len(tickers))."""
+    if daily_prices.empty:
+        return np.full((len(grid), len(tickers)), np.nan)
+    daily_prices = daily_prices.reindex(columns=tickers).sort_index()
+    return daily_prices.ffill().reindex(grid, method="ffill").to_numpy(dtype=float)
+
+
+def portfolio_values(holdings, prices):
+    """Value per period; short/empty positions and missing prices contribute nothing."""
+    valid = (holdings > 0) & (prices > 0)
+    return np.where(valid, holdings * np.nan_to_num(prices), 0.0).sum(axis=1)
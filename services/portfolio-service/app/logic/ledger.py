@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+
+# Transaction fields the analytics read (see load_ledgers in app/crud/transaction.py).
+TRANSACTION_COLUMNS = ["date", "ticker", "action", "shares", "price", "amount"]
+
+# One row per transaction. date is nanoseconds since the epoch, ticker an index into
+# Ledger.tickers and side +1 for buys, -1 for sells and 0 otherwise. signed_shares and
+# cash_flow are shares and amount with that sign applied (buys add shares and money).
+LEDGER_DTYPE = np.dtype([
+    ("date", "i8"),
+    ("ticker", "i4"),
+    ("side", "i1"),
+    ("shares", "f8"),
+    ("price", "f8"),
+    ("amount", "f8"),
+    ("signed_shares", "f8"),
+    ("cash_flow", "f8"),
+])
+
+
+def action_sides(actions):
+    """
+    +1 for buys, -1 for sells and 0 for anything else, case-insensitively: the sign every share
+    count and amount takes in holdings and cash flows.
+    """
+    actions = pd.Series(actions, dtype=object).str.lower().to_numpy()
+    return np.where(actions == "buy", 1, np.where(actions == "sell", -1, 0))
+
+
+class Ledger:
+    """
+    A portfolio's transactions as one NumPy structured array sorted by date, with tickers as
+    categorical codes. Built once per request and shared by every analytics function; it is
+    compact to hold and cheap to pickle to the worker processes.
+    """
+
+    __slots__ = ("rows", "tickers")
+
+    def __init__(self, rows, tickers):
+        self.rows = rows
+        self.tickers = list(tickers)
+
+    @classmethod
+    def from_columns(cls, date, ticker, action, shares, price, amount):
+        """Build from column arrays; rows with a missing date, ticker or share count are dropped."""
+        date = pd.to_datetime(np.asarray(date), errors="coerce")
+        codes, tickers = pd.factorize(pd.Series(ticker, dtype=object), sort=True)
+        shares = np.asarray(shares, dtype=float)
+        keep = ~np.asarray(date.isna()) & (codes >= 0) & ~np.isnan(shares)
+
+        side = action_sides(action)
+        rows = np.empty(int(keep.sum()), dtype=LEDGER_DTYPE)
+        rows["date"] = date.values[keep].astype("datetime64[ns]").view("i8")
+        rows["ticker"] = codes[keep]
+        rows["side"] = side[keep]
+        rows["shares"] = shares[keep]
+        rows["price"] = np.asarray(price, dtype=float)[keep]
+        rows["amount"] = np.asarray(amount, dtype=float)[keep]
+        rows["signed_shares"] = rows["shares"] * rows["side"]
+        rows["cash_flow"] = rows["amount"] * rows["side"]
+        rows = rows[np.argsort(rows["date"], kind="stable")]
+
+        # Drop tickers that only appeared on dropped rows
+        used = np.unique(rows["ticker"])
+        if len(used) < len(tickers):
+            rows["ticker"] = np.searchsorted(used, rows["ticker"])
+            tickers = tickers[used]
+        return cls(rows, tickers)
+
+    @classmethod
+    def from_frame(cls, frame):
+        return cls.from_columns(*(frame[c].to_numpy() for c in TRANSACTION_COLUMNS))
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, dtype=LEDGER_DTYPE), [])
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getstate__(self):
+        return self.rows, self.tickers
+
+    def __setstate__(self, state):
+        self.rows, self.tickers = state
+
+    @property
+    def dates(self):
+        return self.rows["date"].view("datetime64[ns]")
+
+    @property
+    def days(self):
+        return self.dates.astype("datetime64[D]")
+
+    @property
+    def ticker_codes(self):
+        return self.rows["ticker"]
+
+    @property
+    def signed_shares(self):
+        return self.rows["signed_shares"]
+
+    @property
+    def cash_flows(self):
+        return self.rows["cash_flow"]
+
+    def to_frame(self):
+        """The ledger as a DataFrame with TRANSACTION_COLUMNS, for callers that want one."""
+        side = self.rows["side"]
+        return pd.DataFrame({
+            "date": self.dates,
+            "ticker": np.asarray(self.tickers, dtype=object)[self.ticker_codes] if len(self) else np.empty(0, dtype=object),
+            "action": np.where(side == 1, "buy", np.where(side == -1, "sell", "")),
+            "shares": self.rows["shares"],
+            "price": self.rows["price"],
+            "amount": self.rows["amount"],
+        }, columns=TRANSACTION_COLUMNS)
+
+
+def as_ledger(transactions):
+    """
+    A Ledger from a Ledger (returned as is), a DataFrame with TRANSACTION_COLUMNS or an
+    iterable of objects with those attributes (e.g. Transaction rows).
+    """
+    if isinstance(transactions, Ledger):
+        return transactions
+    if transactions is None:
+        return Ledger.empty()
+    if isinstance(transactions, pd.DataFrame):
+        return Ledger.from_frame(transactions)
+    transactions = list(transactions)
+    return Ledger.from_columns(*([getattr(t, c) for t in transactions] for c in TRANSACTION_COLUMNS))
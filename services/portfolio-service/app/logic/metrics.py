@@ -1,108 +1,185 @@
+import numpy as np
 import pandas as pd
-import yfinance as yf
-from datetime import datetime
-import math
-
-def compute_portfolio_metrics(transactions):
-    df = pd.DataFrame([{
-        "date": t.date,
-        "ticker": t.ticker,
-        "action": t.action.lower(),
-        "shares": t.shares,
-        "price": t.price,
-        "amount": t.amount
-    } for t in transactions])
-
-    if df.empty:
-        return {
-            "total_invested": 0,
-            "current_value": 0,
-            "profit": 0,
-            "net_shares": {},
-            "cagr": 0,
-            "max_drawdown": 0,
-            "sharpe_ratio": 0
-        }
-
-    df["date"] = pd.to_datetime(df["date"])
-    df["signed_shares"] = df.apply(lambda row: row["shares"] if row["action"] == "buy" else -row["shares"], axis=1)
-
-    total_invested = df[df["signed_shares"] > 0]["amount"].sum()
-    net_shares_per_ticker = df.groupby("ticker")["signed_shares"].sum()
-    net_shares_per_ticker = net_shares_per_ticker[net_shares_per_ticker != 0]
-    tickers = net_shares_per_ticker.index.tolist()
-
-    if not tickers:
-        return {
-            "total_invested": round(total_invested, 2),
-            "current_value": 0,
-            "profit": -round(total_invested, 2),
-            "net_shares": {},
-            "cagr": 0,
-            "max_drawdown": 0,
-            "sharpe_ratio": 0
-        }
-
-    latest_transaction_date = df["date"].max()
-    fetch_start = (latest_transaction_date - pd.Timedelta(days=5)).strftime('%Y-%m-%d')
-    fetch_end = (latest_transaction_date + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
-
-    prices_now = yf.download(tickers, start=fetch_start, end=fetch_end, auto_adjust=True, progress=False)["Close"]
-
-    if isinstance(prices_now, pd.Series):
-        prices_now = prices_now.to_frame().T
-
-    prices_now = prices_now.ffill().bfill()
 
-    # Get the closest available prices on or before the latest transaction date
-    valid_prices = prices_now.loc[:latest_transaction_date].iloc[-1]
-
-    current_value = 0
-    for ticker in tickers:
-        if ticker in valid_prices.index:
-            price_on_date = valid_prices[ticker]
-            if pd.notna(price_on_date):
-                current_value += net_shares_per_ticker[ticker] * price_on_date
+from app.logic.ledger import as_ledger
+from app.logic.positions import positions_from_transactions, trade_date_range
+from app.logic.price_provider import get_price_provider
+
+RISK_FREE_RATE = 0.02
+# Calendar days a price may be stale and still value a holding (matches get_latest_close).
+PRICE_LOOKBACK_DAYS = 5
+
+def compute_portfolio_metrics(transactions, positions=None, nav=None):
+    """
+    transactions: the portfolio's Ledger (see load_ledgers), or anything as_ledger accepts.
+    positions: stored Position rows for the portfolio. Net shares, invested amount and the
+    holding period come from them; they are derived from the transactions if not given.
+    nav: the NavState of the portfolio's daily NAV series (see app/crud/nav.py). Max drawdown
+    and Sharpe ratio come from it, and transactions may then be None; without it they are
+    approximated from the cumulative transaction amounts.
+    """
+    return compute_batch_metrics({None: (transactions, positions)}, None if nav is None else {None: nav})[None]
+
+def empty_metrics(total_invested=0):
+    return {
+        "total_invested": round(total_invested, 2),
+        "current_value": 0,
+        "profit": -round(total_invested, 2) if total_invested else 0,
+        "net_shares": {},
+        "cagr": 0,
+        "max_drawdown": 0,
+        "sharpe_ratio": 0,
+        "time_weighted_return": 0
+    }
 
+def compute_batch_metrics(portfolios, nav=None):
+    """
+    portfolios: {portfolio_id: (transactions, positions)}, transactions and positions as in
+    compute_portfolio_metrics.
+    nav: {portfolio_id: NavState}, as in compute_portfolio_metrics.
+    Computes the metrics of every portfolio together: one price fetch for the union of held
+    tickers, and valuation, CAGR, drawdown and Sharpe ratio as array operations over all of them.
+    Returns {portfolio_id: metrics}.
+    """
+    nav = nav or {}
+    results = {}
+    held = []  # (portfolio_id, net_shares Series, total_invested, first trade, latest trade)
+    ledgers = {}
+    for portfolio_id, (transactions, positions) in portfolios.items():
+        if transactions is not None:
+            transactions = ledgers[portfolio_id] = as_ledger(transactions)
+        if positions is None:
+            positions = positions_from_transactions(transactions) if len(transactions) else []
+        if not positions:
+            results[portfolio_id] = empty_metrics()
+            continue
+
+        total_invested = sum(p.cost_basis for p in positions)
+        net_shares = pd.Series({p.ticker: p.net_shares for p in positions}, dtype=float)
+        net_shares = net_shares[net_shares != 0]
+        if net_shares.empty:
+            results[portfolio_id] = empty_metrics(total_invested)
+            continue
+        first, last = trade_date_range(positions)
+        if last is None:
+            # Only undated trades: there is no day to value the holdings at
+            results[portfolio_id] = empty_metrics(total_invested)
+            continue
+        held.append((portfolio_id, net_shares, total_invested, pd.Timestamp(first), pd.Timestamp(last)))
+
+    if not held:
+        return results
+
+    ids = [h[0] for h in held]
+    total_invested = np.array([h[2] for h in held], dtype=float)
+    start_dates = pd.DatetimeIndex([h[3] for h in held])
+    end_dates = pd.DatetimeIndex([h[4] for h in held])
+
+    current_value = _current_values(held, end_dates)
     profit = current_value - total_invested
 
-    # Safe CAGR Calculation
-    start_date = df["date"].min()
-    end_date = latest_transaction_date
-    days_held = (end_date - start_date).days
-    years_held = days_held / 365.25 if days_held > 0 else 1 / 365.25
-
-    if total_invested > 0 and current_value > 0 and years_held > 0:
-        try:
-            ratio = current_value / total_invested
-            cagr = (math.pow(ratio, 1 / years_held) - 1) * 100
-            if math.isnan(cagr) or math.isinf(cagr):
-                cagr = 0
-        except Exception:
-            cagr = 0
-    else:
-        cagr = 0
-
-    # Max Drawdown
-    df_sorted = df.sort_values("date")
-    df_sorted["cumulative_value"] = df_sorted["amount"].cumsum()
-    rolling_max = df_sorted["cumulative_value"].cummax()
-    drawdown = df_sorted["cumulative_value"] / rolling_max - 1
-    max_drawdown = drawdown.min() * 100 if not drawdown.empty else 0
-
-    # Sharpe Ratio
-    returns = df_sorted["cumulative_value"].pct_change().dropna()
-    try:
-        sharpe_ratio = ((returns.mean() - 0.02 / 252) / returns.std()) * (252 ** 0.5) if not returns.empty and returns.std() > 0 else 0
-    except Exception:
-        sharpe_ratio = 0
-
+    # Safe CAGR
+    days_held = (end_dates - start_dates).days.to_numpy()
+    years_held = np.where(days_held > 0, days_held, 1) / 365.25
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        cagr = (np.power(current_value / total_invested, 1 / years_held) - 1) * 100
+    valid = (total_invested > 0) & (current_value > 0) & np.isfinite(cagr)
+    cagr = np.where(valid, cagr, 0)
+
+    approximated = [pid for pid in ids if pid not in nav]
+    max_drawdown, sharpe_ratio = _cash_flow_statistics([ledgers[pid] for pid in approximated])
+    cash_flow = {pid: i for i, pid in enumerate(approximated)}
+
+    for i, (portfolio_id, net_shares, *_) in enumerate(held):
+        if portfolio_id in nav:
+            risk = nav_statistics(nav[portfolio_id])
+        else:
+            j = cash_flow[portfolio_id]
+            risk = {
+                "max_drawdown": round(float(max_drawdown[j]), 2),
+                "sharpe_ratio": round(float(sharpe_ratio[j]), 2),
+                "time_weighted_return": 0
+            }
+        results[portfolio_id] = {
+            "total_invested": round(float(total_invested[i]), 2),
+            "current_value": round(float(current_value[i]), 2),
+            "profit": round(float(profit[i]), 2),
+            "net_shares": {ticker: round(share, 2) for ticker, share in net_shares.items()},
+            "cagr": round(float(cagr[i]), 2),
+            **risk
+        }
+    return {portfolio_id: results[portfolio_id] for portfolio_id in portfolios}
+
+def _current_values(held, end_dates):
+    """
+    Value of each portfolio's net shares at the closest close on or before its latest transaction
+    (within PRICE_LOOKBACK_DAYS), from one price fetch covering every portfolio.
+    """
+    owner = np.concatenate([np.full(len(h[1]), i) for i, h in enumerate(held)])
+    tickers = np.concatenate([h[1].index.to_numpy(dtype=object) for h in held])
+    shares = np.concatenate([h[1].to_numpy() for h in held])
+
+    union = sorted(set(tickers))
+    days = end_dates.values.astype("datetime64[D]")
+    prices = get_price_provider().get_close(
+        union, days.min() - np.timedelta64(PRICE_LOOKBACK_DAYS, "D"), days.max() + np.timedelta64(1, "D")
+    ).reindex(columns=union)
+    if prices.empty:
+        return np.zeros(len(held))
+
+    price_days = prices.index.values.astype("datetime64[D]")
+    observed = pd.DataFrame(
+        np.where(prices.notna(), price_days[:, None], np.datetime64("NaT", "D")), index=prices.index, columns=union
+    ).ffill().to_numpy(dtype="datetime64[D]")
+    closes = prices.ffill().to_numpy()
+
+    rows = np.searchsorted(price_days, days, side="right")[owner] - 1
+    columns = np.searchsorted(union, tickers)
+    price = np.where(rows >= 0, closes[rows, columns], np.nan)
+    fresh = np.where(rows >= 0, observed[rows, columns], np.datetime64("NaT", "D"))
+    stale = ~(fresh >= days[owner] - np.timedelta64(PRICE_LOOKBACK_DAYS, "D"))
+    price[stale] = np.nan
+
+    return np.bincount(owner, weights=np.nan_to_num(shares * price), minlength=len(held))
+
+def _cash_flow_statistics(ledgers):
+    """Max drawdown (%) and annualised Sharpe ratio of each portfolio's cumulative transaction amounts."""
+    if not ledgers:
+        return np.zeros(0), np.zeros(0)
+    # Ledgers are sorted by date already, so the rows are in (portfolio, date) order
+    df = pd.DataFrame({
+        "portfolio": np.repeat(np.arange(len(ledgers)), [len(ledger) for ledger in ledgers]),
+        "amount": np.concatenate([ledger.rows["amount"] for ledger in ledgers])
+    })
+
+    cumulative = df.groupby("portfolio")["amount"].cumsum()
+    rolling_max = cumulative.groupby(df["portfolio"]).cummax()
+    drawdown = (cumulative / rolling_max - 1).groupby(df["portfolio"]).min()
+    max_drawdown = drawdown.reindex(range(len(ledgers))).fillna(0).to_numpy() * 100
+
+    returns = cumulative.groupby(df["portfolio"]).pct_change()
+    returns = returns[returns.notna()].groupby(df["portfolio"])
+    mean, std = returns.mean(), returns.std()
+    with np.errstate(invalid="ignore"):
+        sharpe = ((mean - RISK_FREE_RATE / 252) / std) * (252 ** 0.5)
+    sharpe = sharpe.where(std > 0, 0).reindex(range(len(ledgers))).fillna(0).to_numpy()
+    return max_drawdown, sharpe
+
+
+def nav_statistics(state):
+    """
+    Max drawdown (%), annualised Sharpe ratio and time-weighted return (%) of a portfolio's daily
+    NAV series, from its running NavState (see app/logic/nav.py) rather than the series itself.
+    """
+    sharpe = 0.0
+    n = state.return_count
+    if n > 1:
+        mean = state.return_sum / n
+        variance = (state.return_sumsq - n * mean ** 2) / (n - 1)
+        if variance > 1e-18:
+            sharpe = (mean - RISK_FREE_RATE / 252) / np.sqrt(variance) * np.sqrt(252)
     return {
-        "total_invested": round(total_invested, 2),
-        "current_value": round(current_value, 2),
-        "profit": round(profit, 2),
-        "net_shares": {ticker: round(share, 2) for ticker, share in net_shares_per_ticker.items()},
-        "cagr": round(cagr, 2),
-        "max_drawdown": round(max_drawdown, 2),
-        "sharpe_ratio": round(sharpe_ratio, 2)
+        "max_drawdown": round(state.max_drawdown * 100, 2),
+        "sharpe_ratio": round(float(sharpe), 2),
+        "time_weighted_return": round((state.twr_index - 1) * 100, 2)
     }
@@ -0,0 +1,99 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.offsets import BDay
+
+from app.logic.holdings import holdings_matrix, aligned_prices, portfolio_values
+from app.logic.portfolio_value import fetch_historical_prices
+from app.logic.ledger import as_ledger
+
+# Running state of a NAV series after its last day, enough to extend it and to derive its metrics
+# without reading the series back: last value and time-weighted return index, the index's peak and
+# deepest drawdown so far, and the count, sum and sum of squares of the daily returns.
+NavState = namedtuple("NavState", [
+    "market_value", "twr_index", "peak", "max_drawdown", "return_count", "return_sum", "return_sumsq"
+])
+OPENING_STATE = NavState(0.0, 1.0, 1.0, 0.0, 0, 0.0, 0.0)
+
+NAV_COLUMNS = ["date", "market_value", "net_flow", "daily_return", "twr_index", "drawdown"]
+# Calendar days of prices fetched before the first day, so holdings are valued at their last close.
+PRICE_LOOKBACK_DAYS = 10
+
+
+def last_complete_day(now=None):
+    """The most recent business day whose close is final: the one before today (UTC)."""
+    today = pd.Timestamp.now("UTC").tz_localize(None).normalize() if now is None else pd.Timestamp(now).normalize()
+    return today - BDay(1)
+
+
+def first_nav_day(day):
+    """The business day a transaction dated `day` lands on (itself, or the next one for weekends)."""
+    return pd.bdate_range(pd.Timestamp(day).normalize(), periods=1)[0]
+
+
+def nav_series(transactions, prices, days, opening=OPENING_STATE):
+    """
+    Daily NAV rows for `days` (business days) and the state after the last one.
+
+    transactions: the portfolio's whole history as a Ledger (see load_ledgers); those dated before
+    days[0] only make up the opening holdings. prices: daily closes, from before days[0].
+    opening: the state after the day before days[0].
+
+    market_value is the holdings valued at the day's close, net_flow the day's buys minus sells.
+    The daily return treats the flow as made at the close, r = (value - flow) / previous value - 1,
+    and is undefined while nothing was held the day before. Chaining them gives the time-weighted
+    return index, so deposits and withdrawals do not count as performance.
+    """
+    ledger = as_ledger(transactions)
+    dates = ledger.days
+
+    holdings = holdings_matrix(dates, ledger.ticker_codes, ledger.signed_shares, len(ledger.tickers), days)
+    values = portfolio_values(holdings, aligned_prices(prices, ledger.tickers, days))
+
+    grid = days.values.astype("datetime64[D]")
+    day_index = np.searchsorted(grid, dates, side="left")
+    # Transactions after the previous business day are this range's flows (weekend ones land on Monday)
+    inside = (dates > np.busday_offset(grid[0], -1)) & (day_index < len(grid))
+    flows = np.zeros(len(grid))
+    np.add.at(flows, day_index[inside], ledger.cash_flows[inside])
+
+    previous = np.concatenate([[opening.market_value], values[:-1]])
+    valid = previous > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = np.where(valid, (values - flows) / previous - 1, np.nan)
+
+    twr_index = opening.twr_index * np.cumprod(1 + np.nan_to_num(returns))
+    peak = np.maximum(opening.peak, np.maximum.accumulate(twr_index))
+    drawdown = twr_index / peak - 1
+
+    observed = returns[valid]
+    state = NavState(
+        market_value=float(values[-1]),
+        twr_index=float(twr_index[-1]),
+        peak=float(peak[-1]),
+        max_drawdown=float(min(opening.max_drawdown, drawdown.min())),
+        return_count=opening.return_count + int(valid.sum()),
+        return_sum=opening.return_sum + float(observed.sum()),
+        return_sumsq=opening.return_sumsq + float((observed ** 2).sum())
+    )
+    rows = pd.DataFrame({
+        "date": days, "market_value": values, "net_flow": flows, "daily_return": returns,
+        "twr_index": twr_index, "drawdown": drawdown
+    }, columns=NAV_COLUMNS)
+    return rows, state
+
+
+def extend_nav(transactions, start, end, opening=OPENING_STATE):
+    """
+    NAV rows for the business days in [start, end] and the state after them, continuing from
+    `opening`. Returns (empty frame, opening) if there are no such days.
+    """
+    days = pd.bdate_range(start, end)
+    if len(days) == 0:
+        return pd.DataFrame(columns=NAV_COLUMNS), opening
+
+    ledger = as_ledger(transactions)
+    prices = fetch_historical_prices(ledger.tickers, days[0] - pd.Timedelta(days=PRICE_LOOKBACK_DAYS), days[-1])
+    return nav_series(ledger, prices, days, opening)
+
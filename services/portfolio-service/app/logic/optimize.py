@@ -1,103 +1,163 @@
 import pandas as pd
 import numpy as np
-import yfinance as yf
-from scipy.optimize import minimize
-from datetime import datetime, timedelta
+from datetime import datetime
 import math
-
-def optimize_portfolio(transactions, target_return=0.08):
-    df = pd.DataFrame([{
-        "date": t.date,
-        "ticker": t.ticker,
-        "action": t.action,
-        "shares": t.shares,
-        "price": t.price,
-        "amount": t.amount
-    } for t in transactions])
-
-    if df.empty:
+import time
+
+from app.instrumentation import record_optimizer_solve
+from app.logic.covariance import as_covariance
+from app.logic.positions import trade_date_range
+from app.logic.qp import return_range, solve_min_variance
+from app.logic.return_stats import get_return_stats_cache
+
+RISK_FREE_RATE = 0.02
+HISTORY_YEARS = 3
+
+def load_return_statistics(tickers, end_date=None, covariance=None):
+    """
+    Daily returns over the last HISTORY_YEARS years plus annualised mean returns, covariance
+    and latest close, served from the shared return statistics cache.
+    covariance: the estimator ("sample", "ledoit_wolf" or "factor"; default COVARIANCE_ESTIMATOR).
+    Returns None if there is not enough price data for every ticker.
+    """
+    end_date = end_date or datetime.utcnow()
+    return get_return_stats_cache().statistics(tickers, 365 * HISTORY_YEARS, end_date, covariance)
+
+def preload_return_statistics(tickers, end_date=None):
+    """Fetch the price history load_return_statistics needs for all of tickers in one call."""
+    get_return_stats_cache().preload(tickers, 365 * HISTORY_YEARS, end_date or datetime.utcnow())
+
+def portfolio_volatility(weights, cov_matrix):
+    return np.sqrt(weights @ (cov_matrix @ weights))
+
+def weight_cap_vector(tickers, max_weight=None, weight_caps=None):
+    """
+    Per-ticker upper bounds on the weights: max_weight for every ticker and weight_caps
+    ({ticker: cap}) for individual ones, whichever is lower. None without caps.
+    """
+    if max_weight is None and not weight_caps:
+        return None
+    default = 1.0 if max_weight is None else max_weight
+    return np.array([min(default, (weight_caps or {}).get(ticker, 1.0)) for ticker in tickers])
+
+def solve_min_volatility(mean_returns, cov_matrix, target_return, initial_weights=None, caps=None):
+    """
+    Long-only minimum-volatility weights reaching target_return, each at most its cap
+    (see app/logic/qp.py). Minimising the variance gives the same weights as the volatility.
+    """
+    started = time.perf_counter()
+    result = solve_min_variance(cov_matrix, mean_returns, target_return, caps, initial_weights)
+    record_optimizer_solve(time.perf_counter() - started, result.nit)
+    return result
+
+def held_tickers(positions):
+    """Tickers with positive net shares, sorted."""
+    return sorted(p.ticker for p in positions if p.net_shares > 0)
+
+def optimize_portfolio(positions, target_return=0.08, max_weight=None, weight_caps=None, covariance=None):
+    """
+    positions: the portfolio's Position rows (or Holding tuples), one per ticker.
+    Only tickers with positive net shares are optimized.
+    max_weight, weight_caps: optional upper bounds on the weights (see weight_cap_vector).
+    covariance: the covariance estimator (see load_return_statistics).
+    """
+    if not positions:
         return {"message": "No transactions to optimize."}
 
-    df["signed_shares"] = df.apply(lambda row: row["shares"] if row["action"] == "buy" else -row["shares"], axis=1)
-    net_shares_per_ticker = df.groupby("ticker")["signed_shares"].sum()
-    net_shares_per_ticker = net_shares_per_ticker[net_shares_per_ticker > 0]  # Only positive holdings
-    tickers = net_shares_per_ticker.index.tolist()
+    tickers = held_tickers(positions)  # Only positive holdings
 
     if not tickers:
         return {"message": "No net holdings to optimize."}
 
     end_date = datetime.utcnow()
-    start_date = end_date - timedelta(days=365 * 3)
-    price_data = yf.download(tickers, start=start_date, end=end_date, auto_adjust=True, progress=False)["Close"]
-
-    # Ensure price data is usable
-    if isinstance(price_data, pd.Series):
-        price_data = price_data.to_frame()
-
-    price_data = price_data.dropna(how='all').ffill().bfill()  # Fill missing data
-
-    if price_data.empty or price_data.shape[1] != len(tickers):
+    stats = load_return_statistics(tickers, end_date, covariance)
+    if stats is None:
         return {"message": "Insufficient price data for optimization."}
 
-    returns = price_data.pct_change().dropna()
-    mean_returns = returns.mean() * 252
-    cov_matrix = returns.cov() * 252
-    num_assets = len(tickers)
+    weights, error = solve_allocation(stats, target_return, weight_cap_vector(tickers, max_weight, weight_caps))
+    if error is not None:
+        return error
+    return allocation_summary(positions, tickers, stats, weights, end_date)
+
+def solve_allocation(stats, target_return, caps=None):
+    """
+    Minimum-volatility weights reaching target_return for the tickers of `stats` (see
+    load_return_statistics), each at most its cap, as (weights, None), or (None, error response)
+    if the target is infeasible or the solve fails. Depends only on the ticker set, not on the portfolio.
+    """
+    mean_returns = stats["mean_returns"]
+    num_assets = len(mean_returns)
 
     # Feasibility checks
     feasible_return = np.dot(np.ones(num_assets) / num_assets, mean_returns)
-    min_possible_return = mean_returns.min()
-    max_possible_return = mean_returns.max()
+    possible_returns = return_range(mean_returns, caps)
+    if possible_returns is None:
+        return None, {"message": "Weight caps add up to less than 100%."}
+    min_possible_return, max_possible_return = possible_returns
 
     if target_return > max_possible_return or target_return < min_possible_return:
-        return {
+        return None, {
             "message": "Target return not feasible with current assets.",
             "feasible_return_range": {
-                "min": round(feasible_return, 4),
+                "min": round(feasible_return if caps is None else min_possible_return, 4),
                 "max": round(max_possible_return, 4)
             }
         }
 
-    def portfolio_volatility(weights, cov_matrix):
-        return np.sqrt(np.dot(weights.T, np.dot(cov_matrix, weights)))
+    result = solve_min_volatility(mean_returns, as_covariance(stats["cov_matrix"]), target_return, caps=caps)
 
-    def return_constraint(weights):
-        return np.dot(weights, mean_returns) - target_return
+    if not result.success:
+        return None, {"message": "Optimization failed", "reason": result.message}
+    return result.x, None
 
-    initial_weights = np.ones(num_assets) / num_assets
-    constraints = (
-        {'type': 'eq', 'fun': lambda w: np.sum(w) - 1},
-        {'type': 'eq', 'fun': return_constraint}
-    )
-    bounds = tuple((0, 1) for _ in range(num_assets))
+def allocation_performance(stats, optimized_weights):
+    """
+    Figures of an allocation that do not depend on the amount invested: expected return, volatility
+    and Sharpe ratio, and the growth, max drawdown and Sharpe ratio of the weighted daily returns.
+    """
+    mean_returns = stats["mean_returns"].to_numpy()
+    cov_matrix = as_covariance(stats["cov_matrix"])
 
-    result = minimize(portfolio_volatility, initial_weights,
-                      args=(cov_matrix,),
-                      method='SLSQP',
-                      bounds=bounds,
-                      constraints=constraints)
+    portfolio_return = float(np.dot(optimized_weights, mean_returns))
+    portfolio_vol = float(portfolio_volatility(optimized_weights, cov_matrix))
+    sharpe_ratio = (portfolio_return - RISK_FREE_RATE) / portfolio_vol if portfolio_vol != 0 else 0
 
-    if not result.success:
-        return {"message": "Optimization failed", "reason": result.message}
+    weighted_returns = stats["returns"].to_numpy() @ optimized_weights
+    cumulative_returns = np.cumprod(1 + weighted_returns)
 
-    optimized_weights = result.x
-    portfolio_return = np.dot(optimized_weights, mean_returns)
-    portfolio_vol = portfolio_volatility(optimized_weights, cov_matrix)
-    sharpe_ratio = (portfolio_return - 0.02) / portfolio_vol if portfolio_vol != 0 else 0
+    # Max Drawdown calculation
+    drawdown = cumulative_returns / np.maximum.accumulate(cumulative_returns) - 1
+    max_drawdown = drawdown.min() * 100 if len(drawdown) else 0
 
-    optimized_allocation = {ticker: round(weight, 4) for ticker, weight in zip(tickers, optimized_weights)}
+    # Sharpe Ratio
+    volatility = weighted_returns.std(ddof=1) if len(weighted_returns) > 1 else 0
+    sharpe_ratio_full = ((weighted_returns.mean() - RISK_FREE_RATE / 252) / volatility) * (252 ** 0.5) if volatility > 0 else 0
 
-    total_invested = df[df["signed_shares"] > 0]["amount"].sum()
+    return {
+        "expected_return": portfolio_return,
+        "expected_volatility": portfolio_vol,
+        "sharpe_ratio": sharpe_ratio,
+        "growth": float(cumulative_returns[-1]) if len(cumulative_returns) else 1.0,
+        "max_drawdown": float(max_drawdown),
+        "sharpe_ratio_full": float(sharpe_ratio_full)
+    }
+
+def allocation_summary(positions, tickers, stats, optimized_weights, end_date, performance=None):
+    """
+    The optimize_portfolio response for weights from solve_allocation, applied to this portfolio.
+    performance: allocation_performance(stats, optimized_weights), if already computed.
+    """
+    performance = performance or allocation_performance(stats, optimized_weights)
+    optimized_allocation = {ticker: round(weight, 4) for ticker, weight in zip(tickers, optimized_weights)}
 
-    weighted_returns = (returns * optimized_weights).sum(axis=1)
-    cumulative_returns = (1 + weighted_returns).cumprod()
+    total_invested = sum(p.cost_basis for p in positions)
 
-    current_value = total_invested * cumulative_returns.iloc[-1] if total_invested > 0 else 0
+    current_value = total_invested * performance["growth"] if total_invested > 0 else 0
     profit = current_value - total_invested
 
     # Calculate CAGR safely
-    start_date_data = df["date"].min()
-    years_held = (end_date - start_date_data).days / 365.25
+    start_date_data, _ = trade_date_range(positions)
+    years_held = (end_date - start_date_data).days / 365.25 if start_date_data is not None else 0
     try:
         if total_invested > 0 and years_held > 0 and current_value > 0:
             ratio = current_value / total_invested
@@ -109,18 +169,8 @@ def optimize_portfolio(transactions, target_return=0.08):
     except Exception:
         cagr = 0
 
-    # Max Drawdown calculation
-    cumulative_values = total_invested * cumulative_returns
-    rolling_max = cumulative_values.cummax()
-    drawdown = cumulative_values / rolling_max - 1
-    max_drawdown = drawdown.min() * 100 if not drawdown.empty else 0
-
-    # Sharpe Ratio
-    sharpe_ratio_full = ((weighted_returns.mean() - 0.02 / 252) / weighted_returns.std()) * (252 ** 0.5) \
-        if not weighted_returns.empty and weighted_returns.std() > 0 else 0
-
     # Net shares using last available prices
-    latest_prices = price_data.iloc[-1]
+    latest_prices = stats["latest_prices"]
     net_shares = {}
     for ticker, weight in zip(tickers, optimized_weights):
         price = latest_prices.get(ticker, np.nan)
@@ -132,14 +182,73 @@ def optimize_portfolio(transactions, target_return=0.08):
 
     return {
         "optimized_allocation": optimized_allocation,
-        "expected_return": round(portfolio_return, 4),
-        "expected_volatility": round(portfolio_vol, 4),
-        "sharpe_ratio": round(sharpe_ratio, 4),
+        "expected_return": round(performance["expected_return"], 4),
+        "expected_volatility": round(performance["expected_volatility"], 4),
+        "sharpe_ratio": round(performance["sharpe_ratio"], 4),
         "total_invested": round(total_invested, 2),
         "current_value": round(current_value, 2),
         "profit": round(profit, 2),
         "net_shares": net_shares,
         "cagr": round(cagr, 2),
-        "max_drawdown": round(max_drawdown, 2),
-        "sharpe_ratio_full": round(sharpe_ratio_full, 2)
+        "max_drawdown": round(performance["max_drawdown"], 2),
+        "sharpe_ratio_full": round(performance["sharpe_ratio_full"], 2)
+    }
+
+def compute_efficient_frontier(positions, target_returns=None, steps=20, max_weight=None, weight_caps=None, covariance=None):
+    """
+    Minimum-volatility portfolios for many target returns from one set of return statistics.
+    Targets are solved in ascending order, each warm-started from the previous solution.
+    Without explicit targets, `steps` points span the range of returns reachable within the caps.
+    """
+    tickers = held_tickers(positions) if positions else []
+    if not tickers:
+        return {"message": "No net holdings to optimize."}
+
+    stats = load_return_statistics(tickers, covariance=covariance)
+    if stats is None:
+        return {"message": "Insufficient price data for optimization."}
+
+    mean_returns = stats["mean_returns"].to_numpy()
+    cov_matrix = as_covariance(stats["cov_matrix"])
+    caps = weight_cap_vector(tickers, max_weight, weight_caps)
+    possible_returns = return_range(mean_returns, caps)
+    if possible_returns is None:
+        return {"message": "Weight caps add up to less than 100%."}
+    min_possible_return, max_possible_return = possible_returns
+
+    if target_returns is None:
+        target_returns = np.linspace(min_possible_return, max_possible_return, steps)
+
+    frontier = []
+    weights = None
+    for target_return in sorted(float(t) for t in target_returns):
+        point = {"target_return": round(target_return, 4)}
+        if target_return < min_possible_return or target_return > max_possible_return:
+            frontier.append({**point, "feasible": False})
+            continue
+
+        result = solve_min_volatility(mean_returns, cov_matrix, target_return, weights, caps)
+        if not result.success:
+            frontier.append({**point, "feasible": False, "reason": result.message})
+            continue
+
+        weights = result.x
+        portfolio_return = float(np.dot(weights, mean_returns))
+        portfolio_vol = float(portfolio_volatility(weights, cov_matrix))
+        frontier.append({
+            **point,
+            "feasible": True,
+            "expected_return": round(portfolio_return, 4),
+            "expected_volatility": round(portfolio_vol, 4),
+            "sharpe_ratio": round((portfolio_return - RISK_FREE_RATE) / portfolio_vol, 4) if portfolio_vol != 0 else 0,
+            "allocation": {ticker: round(float(weight), 4) for ticker, weight in zip(tickers, weights)}
+        })
+
+    return {
+        "tickers": tickers,
+        "feasible_return_range": {
+            "min": round(float(min_possible_return), 4),
+            "max": round(float(max_possible_return), 4)
+        },
+        "frontier": frontier
     }
@@ -0,0 +1,160 @@
+from datetime import datetime
+
+import pandas as pd
+
+from app.logic.ledger import as_ledger
+from app.logic.metrics import compute_portfolio_metrics
+from app.logic.optimize import HISTORY_YEARS, optimize_portfolio
+from app.logic.portfolio_value import compute_value_over_time
+from app.logic.positions import positions_from_transactions
+from app.logic.price_provider import preloaded_prices
+from app.logic.simulate_dca import MONTE_CARLO_HISTORY_YEARS, monte_carlo_projection, simulate_dca_projection
+
+# Sections of the combined analytics response, in the order they are computed
+SECTIONS = ("positions", "metrics", "value_over_time", "optimization", "projection")
+
+# Parameters the stages read, with the same defaults as the individual routes
+DEFAULT_PARAMS = {
+    "target_return": 0.10,
+    "frequency": "monthly",
+    "initial_investment": 10000,
+    "monthly_contribution": 500,
+    "years": 10,
+    "mode": "deterministic",
+    "paths": 10000,
+    "method": "bootstrap",
+    "block_size": 12,
+    "seed": None,
+}
+
+
+class StageError(Exception):
+    """A stage cannot produce its section from this portfolio's data."""
+
+
+def dependencies(stage, params):
+    """Stages whose results `stage` reads."""
+    if stage in ("metrics", "optimization"):
+        return ("positions",)
+    if stage == "projection":
+        return ("optimization",) if params["mode"] == "monte_carlo" else ("metrics", "optimization")
+    return ()
+
+
+def resolve_stages(sections, params):
+    """The requested sections plus everything they depend on, dependencies first."""
+    order = []
+
+    def visit(stage):
+        if stage in order:
+            return
+        for dependency in dependencies(stage, params):
+            visit(dependency)
+        order.append(stage)
+
+    for section in sections:
+        visit(section)
+    return order
+
+
+def price_window(ledger, stages, params, today):
+    """First and last (exclusive) day of prices any of the stages will read."""
+    starts = [today]
+    if len(ledger):
+        starts.append(pd.Timestamp(ledger.dates[0]) - pd.Timedelta(days=10))
+    if "optimization" in stages:
+        starts.append(today - pd.Timedelta(days=365 * HISTORY_YEARS + 1))
+    if "projection" in stages and params["mode"] == "monte_carlo":
+        starts.append(today - pd.DateOffset(years=MONTE_CARLO_HISTORY_YEARS) - pd.Timedelta(days=1))
+    return min(starts), today + pd.Timedelta(days=1)
+
+
+def _positions(context, results, params):
+    return [{
+        "ticker": h.ticker,
+        "net_shares": float(h.net_shares),
+        "cost_basis": float(h.cost_basis),
+        "first_trade_date": h.first_trade_date,
+        "last_trade_date": h.last_trade_date
+    } for h in context["holdings"]]
+
+
+def _metrics(context, results, params):
+    return compute_portfolio_metrics(context["ledger"], context["holdings"], context["nav"])
+
+
+def _value_over_time(context, results, params):
+    return compute_value_over_time(context["ledger"], params["target_return"], params["frequency"])
+
+
+def _optimization(context, results, params):
+    return optimize_portfolio(context["holdings"], params["target_return"])
+
+
+def _projection(context, results, params):
+    optimized = results["optimization"]
+    if params["mode"] == "monte_carlo":
+        if "optimized_allocation" not in optimized:
+            return {"message": "Optimization failed", "reason": optimized.get("message")}
+        return monte_carlo_projection(
+            context["holdings"], optimized["optimized_allocation"],
+            params["initial_investment"], params["monthly_contribution"], params["years"],
+            paths=params["paths"], method=params["method"], block_size=params["block_size"], seed=params["seed"]
+        )
+
+    actual = results["metrics"]
+    if "cagr" not in actual or actual["cagr"] == 0:
+        raise StageError("CAGR could not be calculated from portfolio.")
+    if "cagr" not in optimized:
+        return {"message": "Optimization failed", "reason": optimized.get("message")}
+    return simulate_dca_projection(params["initial_investment"], params["monthly_contribution"], params["years"],
+                                   actual["cagr"], optimized["cagr"])
+
+
+STAGES = {
+    "positions": _positions,
+    "metrics": _metrics,
+    "value_over_time": _value_over_time,
+    "optimization": _optimization,
+    "projection": _projection,
+}
+
+
+def run_pipeline(transactions, positions, sections=SECTIONS, params=None, nav=None, strict=False):
+    """
+    Compute the requested analytics sections of one portfolio in a single pass.
+
+    transactions: the portfolio's Ledger (or anything as_ledger accepts); positions: its
+    Holding tuples, derived from the transactions if None; nav: its NavState, if stored.
+    The stages run in dependency order (positions -> metrics / optimization -> projection,
+    value_over_time on its own) over one ledger, with every price they read fetched up front
+    in one call. A stage that fails reports {"error": ...} in its section and in the sections
+    depending on it; with strict=True the StageError is raised instead.
+    Returns {section: result} for the requested sections.
+    """
+    params = {**DEFAULT_PARAMS, **(params or {})}
+    ledger = as_ledger(transactions)
+    holdings = positions if positions is not None else positions_from_transactions(ledger)
+    context = {"ledger": ledger, "holdings": holdings, "nav": nav}
+
+    stages = resolve_stages(sections, params)
+    today = pd.Timestamp(datetime.utcnow().date())
+    start, end = price_window(ledger, stages, params, today)
+    tickers = set(ledger.tickers) | {h.ticker for h in holdings}
+
+    results, failed = {}, set()
+    with preloaded_prices(tickers, start, end):
+        for stage in stages:
+            missing = [d for d in dependencies(stage, params) if d in failed]
+            if missing:
+                results[stage] = {"error": f"Requires {missing[0]}, which failed"}
+                failed.add(stage)
+                continue
+            try:
+                results[stage] = STAGES[stage](context, results, params)
+            except StageError as e:
+                if strict:
+                    raise
+                results[stage] = {"error": str(e)}
+                failed.add(stage)
+    return {section: results[section] for section in sections}
@@ -1,104 +1,59 @@
 import pandas as pd
-import yfinance as yf
-from collections import defaultdict
 from datetime import datetime
 
-def fetch_historical_prices_yfinance(tickers, start_date, end_date):
+from app.logic.holdings import FREQUENCIES, period_grid, period_labels, holdings_matrix, aligned_prices, portfolio_values
+from app.logic.ledger import as_ledger
+from app.logic.price_provider import get_price_provider
+
+def fetch_historical_prices(tickers, start_date, end_date):
     """
-    Fetch monthly close prices for tickers using yfinance with safe handling.
+    Fetch daily close prices for tickers in [start_date, end_date] from the price provider with safe handling.
     """
     if not tickers:
-        return {}
+        return pd.DataFrame()
 
-    tickers_str = " ".join(tickers)
     try:
-        data = yf.download(tickers=tickers_str, start=start_date, end=end_date, interval="1mo", group_by='ticker', auto_adjust=True, progress=False)
+        return get_price_provider().get_close(tickers, start_date, pd.Timestamp(end_date) + pd.Timedelta(days=1))
     except Exception as e:
-        print(f"Error fetching data from yfinance: {e}")
-        return {}
-
-    price_data = {}
-    for ticker in tickers:
-        try:
-            ticker_data = data[ticker] if len(tickers) > 1 else data  # yfinance returns differently for single ticker
-            monthly_prices = ticker_data['Close'].dropna()
-            price_data[ticker] = {
-                pd.Timestamp(date).to_period('M').to_timestamp(how='end'): float(price)
-                for date, price in monthly_prices.items()
-                if pd.notna(price) and price > 0
-            }
-        except Exception as e:
-            print(f"Error processing ticker {ticker}: {e}")
-            price_data[ticker] = {}
-    return price_data
+        print(f"Error fetching price data: {e}")
+        return pd.DataFrame()
 
-def compute_value_over_time(transactions, target_return):
-    if not transactions:
+def compute_value_over_time(transactions, target_return, frequency="monthly"):
+    if transactions is None or len(transactions) == 0:
         return {"error": "No transactions provided"}
+    if frequency not in FREQUENCIES:
+        return {"error": f"Unsupported frequency: {frequency}"}
 
     try:
-        # Convert transactions to DataFrame
-        data = [{
-            "date": t.date,
-            "ticker": t.ticker,
-            "action": t.action,
-            "shares": t.shares,
-            "price": t.price,
-            "amount": t.amount,
-            "notes": t.notes
-        } for t in transactions]
-
-        df = pd.DataFrame(data)
-        df["date"] = pd.to_datetime(df["date"], errors='coerce')
-        df = df.dropna(subset=["date", "ticker", "shares", "price"])  # Drop rows with critical NaNs
-
-        if df.empty:
+        # The ledger drops rows without a date, ticker or share count
+        ledger = as_ledger(transactions)
+        if len(ledger) == 0:
             return {"error": "No valid transactions after cleaning."}
 
-        df.sort_values(by="date", inplace=True)
-
-        start_date = df["date"].min()
-        end_date = df["date"].max()
-        tickers = df["ticker"].unique().tolist()
-
-        # Fetch real historical prices from yfinance
-        price_data = fetch_historical_prices_yfinance(tickers, start_date, end_date)
-
-        monthly_values = {}
-        holdings = defaultdict(float)
-
-        df["month"] = df["date"].dt.to_period("M")
-        all_months = pd.period_range(start=start_date, end=end_date, freq='M')
-
-        for month in all_months:
-            monthly_tx = df[df["month"] == month]
-
-            # Update cumulative holdings
-            for _, row in monthly_tx.iterrows():
-                if row["action"].lower() == "buy":
-                    holdings[row["ticker"]] += row["shares"]
-                elif row["action"].lower() == "sell":
-                    holdings[row["ticker"]] -= row["shares"]
+        start_date = pd.Timestamp(ledger.dates[0])
+        end_date = pd.Timestamp(ledger.dates[-1])
+        tickers = ledger.tickers
 
-            # Calculate portfolio value at the end of the month
-            month_end_date = month.to_timestamp(how='end')
-            total_value = 0.0
-            for ticker, shares in holdings.items():
-                if shares <= 0:
-                    continue  # Skip tickers with no shares
-                price_for_date = price_data.get(ticker, {}).get(month_end_date)
-                if price_for_date is None or price_for_date <= 0:
-                    continue  # Skip missing or invalid price
-                total_value += shares * price_for_date
+        # Shares held per (period, ticker), then valued against prices aligned to the same grid
+        grid = period_grid(start_date, end_date, frequency)
+        holdings = holdings_matrix(ledger.dates, ledger.ticker_codes, ledger.signed_shares, len(tickers), grid)
 
-            monthly_values[str(month)] = round(total_value, 2)
+        # Fetch real historical prices up to the last period end (or today, if sooner)
+        price_end = min(grid[-1], pd.Timestamp(datetime.utcnow().date()))
+        price_data = fetch_historical_prices(tickers, start_date, price_end)
+        values = portfolio_values(holdings, aligned_prices(price_data, tickers, grid))
 
-        return {
+        portfolio_value = dict(zip(period_labels(grid, frequency), values.round(2).tolist()))
+        result = {
             "start_date": str(start_date.date()),
             "end_date": str(end_date.date()),
-            "monthly_portfolio_value": monthly_values,
+            "frequency": frequency,
+            "portfolio_value": portfolio_value,
             "target_return": target_return
         }
+        if frequency == "monthly":
+            result["monthly_portfolio_value"] = portfolio_value
+        return result
 
     except Exception as e:
         print(f"Unexpected error in compute_value_over_time: {e}")
@@ -0,0 +1,66 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from app.logic.ledger import action_sides, as_ledger
+
+# Same fields as the Position model, for positions computed outside the database.
+Holding = namedtuple("Holding", ["ticker", "net_shares", "cost_basis", "first_trade_date", "last_trade_date"])
+
+
+def trade_date(value):
+    """A trade date as a datetime, or None for a missing (NaT/None) date, e.g. of an undated legacy row."""
+    return None if pd.isna(value) else pd.Timestamp(value).to_pydatetime()
+
+
+def trade_date_range(holdings):
+    """(first, last) trade date over holdings, ignoring missing dates; (None, None) if none are dated."""
+    firsts = [h.first_trade_date for h in holdings if h.first_trade_date is not None]
+    lasts = [h.last_trade_date for h in holdings if h.last_trade_date is not None]
+    return (min(firsts) if firsts else None), (max(lasts) if lasts else None)
+
+
+def summarize_positions(df):
+    """
+    Aggregate transactions (date, ticker, action, shares, amount) into one row per ticker
+    with net_shares, cost_basis (total spent on buys) and first/last trade dates (NaT for a
+    ticker whose transactions are all undated).
+    """
+    if df.empty:
+        return pd.DataFrame(columns=Holding._fields[1:], index=pd.Index([], name="ticker"))
+
+    delta = action_sides(df["action"]) * df["shares"].to_numpy(dtype=float)
+    frame = pd.DataFrame({
+        "ticker": df["ticker"].to_numpy(),
+        "net_shares": delta,
+        "cost_basis": df["amount"].where(delta > 0, 0.0).to_numpy(),
+        "date": pd.to_datetime(df["date"]).to_numpy(),
+    })
+    grouped = frame.groupby("ticker", sort=True)
+    return pd.DataFrame({
+        "net_shares": grouped["net_shares"].sum(),
+        "cost_basis": grouped["cost_basis"].sum(),
+        "first_trade_date": grouped["date"].min(),
+        "last_trade_date": grouped["date"].max(),
+    })
+
+
+def positions_from_transactions(transactions):
+    """
+    Holdings computed directly from transactions (a Ledger, or anything as_ledger accepts),
+    for callers without a positions table. Same aggregation as summarize_positions.
+    """
+    ledger = as_ledger(transactions)
+    n = len(ledger.tickers)
+    codes = ledger.ticker_codes
+    net_shares = np.bincount(codes, ledger.signed_shares, n)
+    cost_basis = np.bincount(codes, np.where(ledger.signed_shares > 0, ledger.rows["amount"], 0.0), n)
+    first = np.full(n, np.iinfo("i8").max)
+    last = np.full(n, np.iinfo("i8").min)
+    np.minimum.at(first, codes, ledger.rows["date"])
+    np.maximum.at(last, codes, ledger.rows["date"])
+    return [
+        Holding(ticker, net_shares[i], cost_basis[i], pd.Timestamp(first[i]).to_pydatetime(), pd.Timestamp(last[i]).to_pydatetime())
+        for i, ticker in enumerate(ledger.tickers)
+    ]
@@ -0,0 +1,247 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+# Which backend serves prices: "yfinance" (default) or "fixture" (files under PRICE_FIXTURE_DIR).
+PRICE_PROVIDER = os.getenv("PRICE_PROVIDER", "yfinance")
+PRICE_FIXTURE_DIR = os.getenv("PRICE_FIXTURE_DIR", "./price_fixtures")
+# Prices are treated as a snapshot that advances at this interval (seconds); cached analytics are keyed on it.
+PRICE_REFRESH_INTERVAL = int(os.getenv("PRICE_REFRESH_INTERVAL", "900"))
+
+
+def to_day(value):
+    return np.datetime64(pd.Timestamp(value).date(), "D")
+
+
+def price_data_as_of(now=None):
+    """Start of the current price refresh interval (UTC, ISO format): the as-of stamp of price-derived results."""
+    now = time.time() if now is None else now
+    start = now - now % PRICE_REFRESH_INTERVAL
+    return datetime.fromtimestamp(start, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def slice_days(frame, start, end):
+    """Rows of a date-indexed frame in [start, end)."""
+    index = frame.index.values.astype("datetime64[D]")
+    return frame[(index >= to_day(start)) & (index < to_day(end))]
+
+
+class PriceProvider:
+    """
+    Source of daily close prices. Subclasses implement get_close; everything the logic
+    modules need (latest close, monthly closes) is derived from it.
+    """
+
+    def get_close(self, tickers, start, end):
+        """
+        Daily close prices for tickers in [start, end).
+        Returns a DataFrame indexed by date with one column per ticker (NaN where missing).
+        """
+        raise NotImplementedError
+
+    def get_latest_close(self, tickers, on_or_before, lookback_days=5):
+        """Most recent close for each ticker on or before the given date."""
+        on_or_before = pd.Timestamp(on_or_before)
+        prices = self.get_close(
+            tickers, on_or_before - timedelta(days=lookback_days), on_or_before + timedelta(days=1)
+        )
+        if prices.empty:
+            return pd.Series(dtype=float)
+        return prices.ffill().iloc[-1]
+
+    def get_monthly_close(self, tickers, start, end):
+        """Last daily close of each month in [start, end), indexed by monthly Period."""
+        daily = self.get_close(tickers, start, end)
+        if daily.empty:
+            return daily
+        return daily.groupby(daily.index.to_period("M")).last()
+
+
+class YFinanceProvider(PriceProvider):
+    """Adjusted daily closes downloaded from Yahoo Finance."""
+
+    def get_close(self, tickers, start, end):
+        import yfinance as yf
+
+        tickers = list(tickers)
+        data = yf.download(tickers, start=str(to_day(start)), end=str(to_day(end)), auto_adjust=True, progress=False)
+        if data is None or data.empty:
+            return pd.DataFrame(columns=tickers, index=pd.DatetimeIndex([], name="Date"), dtype=float)
+
+        close = data["Close"]
+        if isinstance(close, pd.Series):
+            close = close.to_frame(tickers[0])
+        return close.reindex(columns=tickers)
+
+
+class FixtureProvider(PriceProvider):
+    """
+    Offline prices read from `<root>/<ticker>.csv` files with `date,close` columns.
+    Used by tests and benchmarks so they never touch the network.
+    """
+
+    def __init__(self, root=PRICE_FIXTURE_DIR):
+        self.root = root
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _path(self, ticker):
+        return os.path.join(self.root, quote(ticker, safe="") + ".csv")
+
+    def _series(self, ticker):
+        with self._lock:
+            if ticker not in self._cache:
+                try:
+                    frame = pd.read_csv(self._path(ticker), parse_dates=["date"])
+                    self._cache[ticker] = frame.set_index("date")["close"].sort_index()
+                except FileNotFoundError:
+                    self._cache[ticker] = pd.Series(dtype=float, index=pd.DatetimeIndex([]))
+            return self._cache[ticker]
+
+    def get_close(self, tickers, start, end):
+        tickers = list(tickers)
+        columns = {ticker: slice_days(self._series(ticker), start, end) for ticker in tickers}
+        return pd.DataFrame(columns, columns=tickers).sort_index()
+
+    @staticmethod
+    def write(root, prices):
+        """Write a date-indexed DataFrame of closes (one column per ticker) as fixture files."""
+        os.makedirs(root, exist_ok=True)
+        for ticker in prices.columns:
+            series = prices[ticker].dropna()
+            frame = pd.DataFrame({"date": series.index.strftime("%Y-%m-%d"), "close": series.values})
+            frame.to_csv(os.path.join(root, quote(ticker, safe="") + ".csv"), index=False)
+
+
+class _Flight:
+    def __init__(self, tickers, start, end):
+        self.tickers = tickers
+        self.start = start
+        self.end = end
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class CoalescingProvider(PriceProvider):
+    """
+    Single-flight wrapper: while a fetch for a ticker is in flight, any concurrent request
+    whose range it covers waits for that fetch instead of starting an identical download.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._inflight = {}  # ticker -> list of _Flight
+
+    def _covering_flight(self, ticker, start, end):
+        for flight in self._inflight.get(ticker, []):
+            if flight.start <= start and flight.end >= end:
+                return flight
+        return None
+
+    def get_close(self, tickers, start, end):
+        tickers = list(dict.fromkeys(tickers))
+        start, end = to_day(start), to_day(end)
+
+        waiting = {}
+        own = None
+        with self._lock:
+            missing = []
+            for ticker in tickers:
+                flight = self._covering_flight(ticker, start, end)
+                if flight is None:
+                    missing.append(ticker)
+                else:
+                    waiting.setdefault(flight, []).append(ticker)
+            if missing:
+                own = _Flight(missing, start, end)
+                for ticker in missing:
+                    self._inflight.setdefault(ticker, []).append(own)
+
+        frames = []
+        if own is not None:
+            try:
+                own.result = self.backend.get_close(own.tickers, start, end)
+            except Exception as e:
+                own.error = e
+            finally:
+                with self._lock:
+                    for ticker in own.tickers:
+                        self._inflight[ticker].remove(own)
+                        if not self._inflight[ticker]:
+                            del self._inflight[ticker]
+                own.done.set()
+            if own.error is not None:
+                raise own.error
+            frames.append(own.result.reindex(columns=own.tickers))
+
+        for flight, shared in waiting.items():
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            frames.append(slice_days(flight.result.reindex(columns=shared), start, end))
+
+        return pd.concat(frames, axis=1).sort_index().reindex(columns=tickers)
+
+
+def create_backend():
+    if PRICE_PROVIDER == "fixture":
+        return FixtureProvider(PRICE_FIXTURE_DIR)
+    if PRICE_PROVIDER == "yfinance":
+        return YFinanceProvider()
+    raise ValueError(f"Unknown PRICE_PROVIDER: {PRICE_PROVIDER}")
+
+
+class PreloadedProvider(PriceProvider):
+    """
+    Closes for a set of tickers over [start, end) fetched once up front; requests inside that
+    set and range are sliced from memory, anything else goes to the underlying provider.
+    """
+
+    def __init__(self, provider, tickers, start, end):
+        self.provider = provider
+        self.tickers = set(tickers)
+        self.start, self.end = to_day(start), to_day(end)
+        self.prices = provider.get_close(sorted(self.tickers), self.start, self.end) if self.tickers else pd.DataFrame()
+
+    def get_close(self, tickers, start, end):
+        tickers = list(tickers)
+        if tickers and self.tickers.issuperset(tickers) and self.start <= to_day(start) and to_day(end) <= self.end:
+            return slice_days(self.prices.reindex(columns=tickers), start, end)
+        return self.provider.get_close(tickers, start, end)
+
+
+_provider = None
+# Set by preloaded_prices for the duration of one computation
+_preloaded = ContextVar("preloaded_prices", default=None)
+
+
+@contextmanager
+def preloaded_prices(tickers, start, end):
+    """Within the block, get_price_provider() serves these tickers and dates from one fetch."""
+    token = _preloaded.set(PreloadedProvider(get_price_provider(), tickers, start, end))
+    try:
+        yield _preloaded.get()
+    finally:
+        _preloaded.reset(token)
+
+
+def get_price_provider():
+    """Process-wide provider: the persistent price store over a coalescing backend."""
+    global _provider
+    preloaded = _preloaded.get()
+    if preloaded is not None:
+        return preloaded
+    if _provider is None:
+        from app.logic.price_store import PriceStore
+
+        _provider = PriceStore(provider=CoalescingProvider(create_backend()))
+    return _provider
@@ -0,0 +1,259 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+from app.instrumentation import record_cache_lookups, record_price_fetch
+from app.logic.price_provider import PriceProvider, YFinanceProvider, to_day
+
+# Where the per-ticker price files live. Safe to share between processes.
+PRICE_STORE_DIR = os.getenv("PRICE_STORE_DIR", "./price_store")
+
+# When extending a ticker forwards we re-download a few days we already have and
+# compare them, so a split/dividend re-adjustment upstream invalidates the file.
+OVERLAP_DAYS = 7
+ADJUSTMENT_TOLERANCE = 1e-4
+
+# Time of day (UTC, HH:MM) from which the day's bar is final: 21:30 is after the US close in both
+# summer and winter time. Until then today's bar is still moving and is never marked as covered.
+MARKET_CLOSE_UTC = os.getenv("MARKET_CLOSE_UTC", "21:30")
+
+# A ticker the provider returned nothing for (unknown, delisted) is not asked for that range again
+# for this long (seconds), whether it was fetched alone or with others.
+PRICE_MISSING_TTL = int(os.getenv("PRICE_MISSING_TTL", str(6 * 3600)))
+
+PRICE_DTYPE = np.dtype([("date", "datetime64[D]"), ("close", "f8")])
+
+
+def settled_until(now=None):
+    """End (exclusive) of the days whose bars are final: tomorrow once past MARKET_CLOSE_UTC, else today."""
+    now = now or datetime.utcnow()
+    hour, minute = (int(part) for part in MARKET_CLOSE_UTC.split(":"))
+    today = np.datetime64(now.date(), "D")
+    return today + 1 if (now.hour, now.minute) >= (hour, minute) else today
+
+
+class PriceStore(PriceProvider):
+    """
+    Persistent store of daily close prices in front of another PriceProvider,
+    one memory-mapped NumPy file per ticker.
+
+    Each ticker has a `<ticker>.npy` structured array of (date, close) sorted by date and
+    a `<ticker>.json` sidecar recording the date range that has already been fetched.
+    Reads only fetch the parts of the requested range that are not covered yet. A fetch that
+    returned nothing for a ticker is recorded in a `<ticker>.missing.json` negative entry instead,
+    which suppresses that range until it expires.
+    """
+
+    def __init__(self, root=PRICE_STORE_DIR, provider=None):
+        self.root = root
+        self.provider = provider if provider is not None else YFinanceProvider()
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    # ---- file layout ----
+
+    def _path(self, ticker, suffix):
+        return os.path.join(self.root, quote(ticker, safe="") + suffix)
+
+    @contextmanager
+    def _ticker_lock(self, ticker):
+        # Thread lock for this process, flock for other workers sharing the directory.
+        with self._locks_guard:
+            lock = self._locks.setdefault(ticker, threading.Lock())
+        with lock, open(self._path(ticker, ".lock"), "a") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _tickers_lock(self, tickers):
+        # Always in sorted order, so two processes filling overlapping groups cannot deadlock.
+        with ExitStack() as stack:
+            for ticker in sorted(tickers):
+                stack.enter_context(self._ticker_lock(ticker))
+            yield
+
+    def _load_coverage(self, ticker):
+        try:
+            with open(self._path(ticker, ".json")) as f:
+                meta = json.load(f)
+            return np.datetime64(meta["start"], "D"), np.datetime64(meta["end"], "D")
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _load_missing(self, ticker):
+        try:
+            with open(self._path(ticker, ".missing.json")) as f:
+                meta = json.load(f)
+            return np.datetime64(meta["start"], "D"), np.datetime64(meta["end"], "D"), float(meta["until"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _load_prices(self, ticker):
+        try:
+            return np.load(self._path(ticker, ".npy"), mmap_mode="r")
+        except (OSError, ValueError):
+            return np.empty(0, dtype=PRICE_DTYPE)
+
+    def _save(self, ticker, prices, start, end):
+        # Replace the data before the coverage sidecar: a reader that sees new coverage
+        # always sees the data behind it.
+        npy_path = self._path(ticker, ".npy")
+        json_path = self._path(ticker, ".json")
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(npy_path + suffix, "wb") as f:
+            np.save(f, prices)
+        with open(json_path + suffix, "w") as f:
+            json.dump({"start": str(start), "end": str(end)}, f)
+        os.replace(npy_path + suffix, npy_path)
+        os.replace(json_path + suffix, json_path)
+
+    def _save_missing(self, ticker, start, end):
+        path = self._path(ticker, ".missing.json")
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(path + suffix, "w") as f:
+            json.dump({"start": str(start), "end": str(end), "until": time.time() + PRICE_MISSING_TTL}, f)
+        os.replace(path + suffix, path)
+
+    def clear(self, ticker):
+        for suffix in (".json", ".npy", ".missing.json"):
+            try:
+                os.remove(self._path(ticker, suffix))
+            except FileNotFoundError:
+                pass
+
+    # ---- fetching ----
+
+    def _missing_ranges(self, ticker, start, end):
+        coverage = self._load_coverage(ticker)
+        if coverage is None:
+            ranges = [(start, end)]
+        else:
+            covered_start, covered_end = coverage
+            ranges = []
+            if start < covered_start:
+                ranges.append((start, covered_start))
+            if end > covered_end:
+                ranges.append((max(covered_end - OVERLAP_DAYS, covered_start), end))
+
+        # Ranges recently fetched empty are left alone until the negative entry expires
+        missing = self._load_missing(ticker) if ranges else None
+        if missing is not None and time.time() < missing[2]:
+            ranges = [(lo, hi) for lo, hi in ranges if not (missing[0] <= lo and hi <= missing[1])]
+        return ranges
+
+    def _fetched_nothing(self, ticker, frame, fetch_end):
+        """
+        Whether the fetch returned no closes for ticker over a range that could have had some,
+        i.e. one not entirely before its stored history (nothing will ever appear there).
+        """
+        if ticker in frame.columns and (frame[ticker] > 0).any():
+            return False
+        prices = self._load_prices(ticker)
+        return not (len(prices) and fetch_end <= prices["date"][0])
+
+    def _merge(self, ticker, frame, fetch_start, fetch_end):
+        """Merge freshly fetched closes into the stored file for one ticker; the caller holds its lock."""
+        series = frame[ticker].dropna() if ticker in frame.columns else pd.Series(dtype=float)
+        series = series[series > 0]
+        new = np.empty(len(series), dtype=PRICE_DTYPE)
+        new["date"] = series.index.values.astype("datetime64[D]")
+        new["close"] = series.values
+
+        old = np.array(self._load_prices(ticker))
+        coverage = self._load_coverage(ticker)
+
+        # Upstream re-adjusted history (split/dividend): stored closes are stale, start over.
+        if len(old) and len(new):
+            common, old_idx, new_idx = np.intersect1d(old["date"], new["date"], return_indices=True)
+            if len(common):
+                drift = np.abs(old["close"][old_idx] / new["close"][new_idx] - 1)
+                if drift.max() > ADJUSTMENT_TOLERANCE:
+                    self.clear(ticker)
+                    return False
+
+        if len(old):
+            keep = (old["date"] < fetch_start) | (old["date"] >= fetch_end)
+            merged = np.concatenate([old[keep], new])
+            merged.sort(order="date")
+        else:
+            merged = new
+
+        # Today's bar is still moving until the close, so only then mark it as covered.
+        covered_end = min(fetch_end, settled_until())
+        if coverage is not None:
+            start = min(coverage[0], fetch_start)
+            covered_end = max(coverage[1], covered_end)
+        else:
+            start = fetch_start
+        self._save(ticker, merged, start, max(covered_end, start))
+        return True
+
+    def _fill(self, tickers, start, end):
+        # Group tickers that miss exactly the same range so each group is one fetch.
+        groups = {}
+        covered = 0
+        for ticker in tickers:
+            missing = self._missing_ranges(ticker, start, end)
+            covered += not missing
+            for fetch_range in missing:
+                groups.setdefault(fetch_range, []).append(ticker)
+        record_cache_lookups("price_store", covered, len(tickers) - covered)
+
+        stale = set()
+        for (fetch_start, fetch_end), group in groups.items():
+            # Hold the tickers' locks through the download: a worker that was waiting on them
+            # finds the range covered on the re-check instead of downloading it again.
+            with self._tickers_lock(group):
+                group = [t for t in group if self._missing_ranges(t, fetch_start, fetch_end)]
+                if not group:
+                    continue
+                started = time.perf_counter()
+                try:
+                    frame = self.provider.get_close(group, fetch_start, fetch_end)
+                except Exception as e:
+                    print(f"Error fetching prices for {group}: {e}")
+                    continue
+                finally:
+                    record_price_fetch(len(group), time.perf_counter() - started)
+                if frame is None:
+                    continue  # Failed fetch: leave the range uncovered and retry later
+                for ticker in group:
+                    # Nothing for this ticker, alone or in a group: a negative entry, not coverage
+                    if self._fetched_nothing(ticker, frame, fetch_end):
+                        self._save_missing(ticker, fetch_start, fetch_end)
+                    elif not self._merge(ticker, frame, fetch_start, fetch_end):
+                        stale.add(ticker)
+        return stale
+
+    def get_close(self, tickers, start, end):
+        tickers = list(dict.fromkeys(tickers))
+        if not tickers:
+            return pd.DataFrame()
+
+        start, end = to_day(start), to_day(end)
+        stale = self._fill(tickers, start, end)
+        if stale:
+            self._fill(sorted(stale), start, end)
+
+        columns = {}
+        for ticker in tickers:
+            prices = self._load_prices(ticker)
+            lo, hi = np.searchsorted(prices["date"], [start, end])
+            window = prices[lo:hi]
+            columns[ticker] = pd.Series(
+                np.array(window["close"]), index=pd.DatetimeIndex(np.array(window["date"]), name="Date")
+            )
+
+        return pd.DataFrame(columns, columns=tickers).sort_index()
@@ -0,0 +1,457 @@
+from collections import namedtuple
+
+import numpy as np
+
+from app.logic.covariance import FactorCovariance
+
+# Same fields the optimizer code read from scipy's OptimizeResult
+QPResult = namedtuple("QPResult", ["x", "success", "message", "nit"])
+
+# Weights within this of a bound count as on it; also the feasibility slack for the target return.
+WEIGHT_TOLERANCE = 1e-10
+# Rounds of guessing the binding bounds from the unbounded solution before the active-set iterations.
+CRASH_ROUNDS = 8
+# Ridge added to the covariance, relative to its average variance. Keeps the free-set inverse
+# accurate when the covariance is singular (fewer return observations than assets); shifts the
+# variance of any fully invested allocation by at most this fraction of the average variance.
+RIDGE = 1e-9
+# Bound multipliers down to -MULTIPLIER_TOLERANCE * average variance count as non-negative: freeing
+# such a weight could lower the variance by no more than that, and with a singular covariance
+# multipliers this small are round-off of the ridge, which would make the weight cycle.
+MULTIPLIER_TOLERANCE = 1e-8
+# Stationarity tolerance of the optimality check, relative to the average variance.
+KKT_TOLERANCE = 1e-6
+
+
+def weight_bounds(num_assets, caps=None):
+    """Upper bounds on the weights: caps (a scalar or one per asset) clipped to [0, 1], else 1."""
+    if caps is None:
+        return np.ones(num_assets)
+    return np.clip(np.broadcast_to(np.asarray(caps, dtype=float), (num_assets,)), 0.0, 1.0)
+
+
+def extreme_allocation(mean_returns, upper, highest=True):
+    """
+    Fully invested weights with the highest (or lowest) possible return under the bounds: the
+    assets are filled up to their cap in order of mean return. None if the caps sum to less than 1.
+    """
+    if upper.sum() < 1 - WEIGHT_TOLERANCE:
+        return None
+    order = np.argsort(-mean_returns if highest else mean_returns, kind="stable")
+    capped = upper[order]
+    weights = np.zeros(len(mean_returns))
+    weights[order] = np.clip(1 - (np.cumsum(capped) - capped), 0.0, capped)
+    return weights
+
+
+def return_range(mean_returns, caps=None):
+    """Lowest and highest return of a fully invested long-only allocation within the caps, or None."""
+    mean_returns = np.asarray(mean_returns, dtype=float)
+    upper = weight_bounds(len(mean_returns), caps)
+    low, high = extreme_allocation(mean_returns, upper, False), extreme_allocation(mean_returns, upper, True)
+    if low is None:
+        return None
+    return float(low @ mean_returns), float(high @ mean_returns)
+
+
+def _feasible_start(mean_returns, upper, target_return, initial_weights):
+    """
+    Weights meeting every constraint: the initial weights (if feasible for the bounds) moved
+    towards the highest- or lowest-return allocation until the target is met, else a blend of
+    those two allocations. None if the target is out of reach.
+    """
+    low, high = extreme_allocation(mean_returns, upper, False), extreme_allocation(mean_returns, upper, True)
+    if low is None:
+        return None
+    low_return, high_return = low @ mean_returns, high @ mean_returns
+    if not low_return - WEIGHT_TOLERANCE <= target_return <= high_return + WEIGHT_TOLERANCE:
+        return None
+
+    start = low
+    if initial_weights is not None:
+        initial = np.asarray(initial_weights, dtype=float)
+        if initial.shape == upper.shape and np.all(initial >= -WEIGHT_TOLERANCE) \
+                and np.all(initial <= upper + WEIGHT_TOLERANCE) and abs(initial.sum() - 1) <= 1e-8:
+            start = np.clip(initial, 0.0, upper)
+    start_return = start @ mean_returns
+
+    toward = high if target_return >= start_return else low
+    gap = toward @ mean_returns - start_return
+    theta = (target_return - start_return) / gap if abs(gap) > 1e-15 else 0.0
+    return np.clip(start + np.clip(theta, 0.0, 1.0) * (toward - start), 0.0, upper)
+
+
+def _average_variance(diagonal):
+    return max(float(np.abs(diagonal).mean()), 1e-12) if len(diagonal) else 1.0
+
+
+def _positive_definite(cov):
+    """cov plus a ridge of RIDGE times its average variance, shifted further along the diagonal
+    if that is still not positive definite (pairwise-complete covariances need not be positive
+    semi-definite)."""
+    ridge = RIDGE * _average_variance(np.diag(cov))
+    try:
+        np.linalg.cholesky(cov + ridge * np.eye(len(cov)))
+        return cov + ridge * np.eye(len(cov))
+    except np.linalg.LinAlgError:
+        shift = max(-float(np.linalg.eigvalsh(cov)[0]), 0.0) + ridge
+        return cov + shift * np.eye(len(cov))
+
+
+class _FreeInverse:
+    """
+    Inverse of cov over the free assets (in the order of .order), kept in a preallocated buffer and
+    updated in place by rank-one updates as assets are freed or fixed.
+    """
+
+    # Updates between full re-inversions, to bound the round-off they accumulate
+    REFRESH_EVERY = 64
+
+    def __init__(self, cov, free):
+        self.cov = cov
+        self.buffer = np.empty_like(cov)
+        self.reset(list(free))
+
+    @property
+    def inverse(self):
+        k = len(self.order)
+        return self.buffer[:k, :k]
+
+    def solve(self, rhs):
+        return self.inverse @ rhs
+
+    def reset(self, order):
+        self.order = order
+        if order:
+            self.buffer[:len(order), :len(order)] = np.linalg.inv(self.cov[np.ix_(order, order)])
+        self.updates = 0
+
+    def add(self, i):
+        if self.updates >= self.REFRESH_EVERY:
+            return self.reset(self.order + [i])
+        k = len(self.order)
+        u = self.cov[self.order, i]
+        hu = self.inverse @ u
+        d = self.cov[i, i] - u @ hu
+        self.buffer[:k, :k] += np.outer(hu, hu) / d
+        self.buffer[:k, k] = self.buffer[k, :k] = -hu / d
+        self.buffer[k, k] = 1 / d
+        self.order.append(i)
+        self.updates += 1
+
+    def remove(self, i):
+        # Move the asset to the last position, then drop it from the leading block
+        p, last = self.order.index(i), len(self.order) - 1
+        self.order[p] = self.order[last]
+        self.order.pop()
+        if self.updates >= self.REFRESH_EVERY:
+            return self.reset(self.order)
+        buffer = self.buffer
+        buffer[[p, last], :last + 1] = buffer[[last, p], :last + 1]
+        buffer[:last + 1, [p, last]] = buffer[:last + 1, [last, p]]
+        column = buffer[:last, last].copy()
+        buffer[:last, :last] -= np.outer(column, column) / buffer[last, last]
+        self.updates += 1
+
+
+class _DenseOperator:
+    """A covariance matrix, made positive definite, as the solver uses it."""
+
+    def __init__(self, cov):
+        self.cov = _positive_definite(np.asarray(cov, dtype=float))
+        self.scale = _average_variance(np.diag(self.cov))
+
+    def diagonal(self):
+        return np.diag(self.cov)
+
+    def dot(self, weights, rows=None):
+        """(cov @ weights)[rows], reading only the columns of the nonzero weights."""
+        nonzero = np.flatnonzero(weights)
+        block = self.cov[:, nonzero] if rows is None else self.cov[np.ix_(rows, nonzero)]
+        return block @ weights[nonzero]
+
+    def solve_subset(self, index, rhs):
+        return np.linalg.solve(self.cov[np.ix_(index, index)], rhs)
+
+    def free_inverse(self, free):
+        return _FreeInverse(self.cov, free)
+
+
+class _FactorOperator:
+    """
+    A FactorCovariance as the solver uses it: products and solves in O(n k) and O(n k^2), so the
+    n x n matrix is never formed.
+    """
+
+    def __init__(self, cov):
+        self.scale = _average_variance(cov.diagonal())
+        self.loadings = cov.loadings
+        self.specific = np.maximum(cov.specific, RIDGE * self.scale)
+
+    def diagonal(self):
+        return np.einsum("ij,ij->i", self.loadings, self.loadings) + self.specific
+
+    def dot(self, weights, rows=None):
+        """(cov @ weights)[rows]."""
+        rows = slice(None) if rows is None else rows
+        return self.loadings[rows] @ (self.loadings.T @ weights) + self.specific[rows] * weights[rows]
+
+    def solve_subset(self, index, rhs):
+        return FactorCovariance(self.loadings[index], self.specific[index]).solve(rhs)
+
+    def free_inverse(self, free):
+        return _FactorFreeInverse(self, free)
+
+
+class _FactorFreeInverse:
+    """The free-set solves of _FreeInverse for a factor covariance: Woodbury on the free rows."""
+
+    def __init__(self, operator, free):
+        self.operator = operator
+        self.order = list(free)
+
+    def solve(self, rhs):
+        return self.operator.solve_subset(self.order, rhs)
+
+    def add(self, i):
+        self.order.append(i)
+
+    def remove(self, i):
+        self.order.remove(i)
+
+
+def _covariance_operator(cov_matrix):
+    if isinstance(cov_matrix, FactorCovariance):
+        return _FactorOperator(cov_matrix)
+    return _DenseOperator(cov_matrix)
+
+
+def _equality_solution(cov, A, b, free, at_upper, upper):
+    """
+    Minimum of w' cov w subject to A w = b only, with the weights outside `free` fixed at 0 or (where
+    at_upper) their upper bound: w_F = S^-1 (A_F' lambda - c), S = cov_FF and c = cov_FU u_U.
+    cov: a covariance operator.
+    """
+    F, U = np.flatnonzero(free), np.flatnonzero(at_upper)
+    A_F = A[:, F]
+    c = cov.dot(np.where(at_upper, upper, 0.0), F)
+    solved = cov.solve_subset(F, np.column_stack([A_F.T, c]))
+    s_a, s_c = solved[:, :-1], solved[:, -1]
+    lam = np.linalg.lstsq(A_F @ s_a, b - A[:, U] @ upper[U] + A_F @ s_c, rcond=None)[0]
+    return s_a @ lam - s_c
+
+
+def _crash_working_set(cov, mu, A, b, upper, target_return, w):
+    """
+    Initial working set for a cold start: fix at their bound the weights that the solution without
+    bounds puts beyond them, re-solve on the rest and repeat (CRASH_ROUNDS times at most). Sets w
+    to a feasible point on that working set. The last guess with such a point is used; if none
+    has one, every weight starts free and w is left as it is.
+    """
+    n = len(mu)
+    at_lower, at_upper = np.zeros(n, dtype=bool), np.zeros(n, dtype=bool)
+    start = None
+    for _ in range(CRASH_ROUNDS):
+        free = ~(at_lower | at_upper)
+        if free.sum() <= len(A):
+            break
+        solution = _equality_solution(cov, A, b, free, at_upper, upper)
+        new_upper, new_lower = solution >= upper[free], solution <= 0
+        if not (new_upper | new_lower).any():
+            break
+        lower, upper_set = at_lower.copy(), at_upper.copy()
+        lower[np.flatnonzero(free)[new_lower & ~new_upper]] = True
+        upper_set[np.flatnonzero(free)[new_upper]] = True
+
+        # A feasible point with the guessed weights at their bounds: the rest, scaled to what the
+        # capped ones leave, between its lowest- and highest-return allocations
+        rest = ~(lower | upper_set)
+        remaining = 1 - upper[upper_set].sum()
+        target = target_return - upper[upper_set] @ mu[upper_set]
+        weights = _feasible_start(mu[rest], upper[rest] / remaining, target / remaining, None) if remaining > 0 else None
+        if weights is None:
+            break
+        at_lower, at_upper = lower, upper_set
+        start = np.where(at_upper, upper, 0.0)
+        start[rest] = weights * remaining
+
+    if start is None:
+        return np.zeros(n, dtype=bool), np.zeros(n, dtype=bool)
+    w[:] = start
+    return at_lower, at_upper
+
+
+def _active_set(cov, A, b, upper, w, at_lower, at_upper, max_iter):
+    """
+    Active-set iterations from w (feasible) with the given working set; w is updated in place.
+    Returns (converged, iterations, lambda).
+    """
+    # Keep the working set independent of the equalities: A must have full rank on the free set
+    for i in np.flatnonzero(at_lower | at_upper):
+        if np.linalg.matrix_rank(A[:, ~(at_lower | at_upper)]) == len(A):
+            break
+        at_lower[i] = at_upper[i] = False
+    free = cov.free_inverse(np.flatnonzero(~(at_lower | at_upper)))
+
+    multiplier_tolerance = MULTIPLIER_TOLERANCE * cov.scale
+    lam = np.zeros(len(A))
+    # After a step that no bound blocked, w is the minimum on the working set up to round-off;
+    # re-solving would only chase that round-off, so the multipliers are checked next.
+    full_step = False
+    for iteration in range(1, max_iter + 1):
+        F = np.array(free.order, dtype=int)
+        held = np.flatnonzero(at_upper)
+
+        # Equality-constrained minimum on the free weights: w_F = H (A_F' lambda - c), with
+        # H the free inverse, c = cov_FH w_H and (A_F H A_F') lambda = b - A_H w_H + A_F H c
+        A_F = A[:, F]
+        hc = free.solve(cov.dot(np.where(at_upper, w, 0.0), F))
+        ha = free.solve(A_F.T)
+        lam = np.linalg.lstsq(A_F @ ha, b - A[:, held] @ w[held] + A_F @ hc, rcond=None)[0]
+        step = ha @ lam - hc - w[F]
+
+        if len(F) == 0 or full_step or np.abs(step).max() <= WEIGHT_TOLERANCE:
+            full_step = False
+            # Stationary on the working set: check the multipliers of the fixed bounds
+            reduced = cov.dot(w) - A.T @ lam
+            multipliers = np.where(at_lower, reduced, np.where(at_upper, -reduced, np.inf))
+            worst = int(np.argmin(multipliers))
+            if multipliers[worst] >= -multiplier_tolerance:
+                return True, iteration, lam
+            at_lower[worst] = at_upper[worst] = False
+            free.add(worst)
+            continue
+
+        # Longest step up to 1 that keeps every free weight within its bounds
+        current = w[F]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratios = np.where(step < -1e-15, -current / step, np.where(step > 1e-15, (upper[F] - current) / step, np.inf))
+        # Lowest asset index among the nearest bounds
+        blocking = min(np.flatnonzero(ratios <= ratios.min() + 1e-15), key=lambda j: F[j])
+        alpha = max(0.0, min(1.0, ratios[blocking]))
+        w[F] = current + alpha * step
+        full_step = ratios[blocking] > 1.0
+        if not full_step:
+            i = F[blocking]
+            if step[blocking] < 0:
+                at_lower[i], w[i] = True, 0.0
+            else:
+                at_upper[i], w[i] = True, upper[i]
+            free.remove(i)
+
+    return False, max_iter, lam
+
+
+def _bounds_of(w, upper):
+    """Working set of the bounds w is on."""
+    at_upper = (w >= upper - WEIGHT_TOLERANCE) & (upper > WEIGHT_TOLERANCE)
+    return (w <= WEIGHT_TOLERANCE) & ~at_upper, at_upper
+
+
+def _restore_equalities(A, b, upper, w):
+    """
+    w with the round-off in A w = b removed (SLSQP meets the equalities only to its own tolerance,
+    and ill-conditioned steps drift from them): the least change to the weights inside their bounds.
+    """
+    w = np.clip(w, 0.0, upper)
+    inside = ~np.logical_or(*_bounds_of(w, upper))
+    A_in = A[:, inside]
+    if inside.any():
+        w[inside] += A_in.T @ np.linalg.lstsq(A_in @ A_in.T, b - A @ w, rcond=None)[0]
+    return np.clip(w, 0.0, upper)
+
+
+def _kkt_satisfied(cov, A, b, upper, w, lam):
+    """
+    Whether w is optimal: feasible, stationary on the weights strictly inside their bounds, and
+    with bound multipliers of the right sign. lambda is re-estimated from the weights inside
+    their bounds where they determine it, else the solver's is used.
+    """
+    if np.abs(A @ w - b).max() > 1e-9 or w.min() < -WEIGHT_TOLERANCE or (w - upper).max() > WEIGHT_TOLERANCE:
+        return False
+    tolerance = KKT_TOLERANCE * cov.scale
+    gradient = cov.dot(w)
+    at_lower, at_upper = _bounds_of(w, upper)
+    inside = ~(at_lower | at_upper)
+    if np.linalg.matrix_rank(A[:, inside]) == len(A):
+        lam = np.linalg.lstsq(A[:, inside].T, gradient[inside], rcond=None)[0]
+    reduced = gradient - A.T @ lam
+    return bool(np.all(np.abs(reduced[inside]) <= tolerance) and np.all(reduced[at_lower] >= -tolerance)
+                and np.all(reduced[at_upper] <= tolerance))
+
+
+def _slsqp(cov, A, b, upper, w):
+    """scipy's SLSQP from w, for the problems the active-set method does not solve reliably."""
+    from scipy.optimize import minimize
+
+    result = minimize(lambda x: x @ cov.dot(x), w, jac=lambda x: 2 * cov.dot(x), method="SLSQP",
+                      bounds=list(zip(np.zeros(len(w)), upper)), options={"ftol": 1e-15, "maxiter": 1000},
+                      constraints={"type": "eq", "fun": lambda x: A @ x - b, "jac": lambda x: A})
+    return _restore_equalities(A, b, upper, result.x)
+
+
+def solve_min_variance(cov_matrix, mean_returns, target_return, caps=None, initial_weights=None, max_iter=None):
+    """
+    Minimum-variance weights w with sum(w) = 1, w . mean_returns = target_return and
+    0 <= w <= caps, by a primal active-set method.
+
+    Weights held at a bound are fixed and the equality-constrained problem on the rest is solved
+    in closed form with the inverse covariance of the free assets, which is updated rather than
+    recomputed as assets are fixed or freed. Steps stop at the first bound they would cross,
+    which is then fixed; at a stationary point, a fixed weight with a negative bound multiplier
+    is freed, until none is.
+    Without initial_weights the working set starts as the bounds violated by the closed-form
+    solution without bounds, so only corrections to that guess take iterations (none if no bound
+    binds). With initial_weights (e.g. the previous solution on a frontier) it starts from those,
+    moved towards the target. Ties are broken by the lowest asset index, so results are deterministic.
+    cov_matrix may be a FactorCovariance, in which case free-set solves use the Woodbury identity
+    on the factor form instead of an explicit inverse.
+
+    The result is checked against the optimality (KKT) conditions. With a singular covariance
+    (fewer return observations than assets) the free-set inverse can be too inaccurate to pass;
+    the solve is then repeated from a plain feasible start, and failing that handed to SLSQP.
+    success is only reported for weights that pass the check.
+    """
+    mu = np.asarray(mean_returns, dtype=float)
+    n = len(mu)
+    upper = weight_bounds(n, caps)
+
+    w = _feasible_start(mu, upper, target_return, initial_weights)
+    if w is None:
+        return QPResult(None, False, "Target return not feasible with the weight caps.", 0)
+    start = w.copy()
+    cov = _covariance_operator(cov_matrix)
+
+    # Equality constraints; with equal mean returns the return constraint is implied by the sum
+    A = np.vstack([np.ones(n), mu])
+    b = np.array([1.0, target_return])
+    if np.ptp(mu) <= 1e-15:
+        A, b = A[:1], b[:1]
+
+    if initial_weights is not None:
+        # Warm start: the working set is the bounds the moved initial weights are on
+        at_lower, at_upper = _bounds_of(w, upper)
+    else:
+        at_lower, at_upper = _crash_working_set(cov, mu, A, b, upper, target_return, w)
+    w[at_lower], w[at_upper] = 0.0, upper[at_upper]
+    max_iter = max_iter or 10 * n + 50
+    converged, iterations, lam = _active_set(cov, A, b, upper, w, at_lower, at_upper, max_iter)
+    w = _restore_equalities(A, b, upper, w)
+    if converged and _kkt_satisfied(cov, A, b, upper, w, lam):
+        return QPResult(np.clip(w, 0.0, upper), True, "Optimization terminated successfully", iterations)
+
+    # Retry without the crash guess, from the plain feasible start
+    candidates = [w.copy()] if converged else []
+    w = start
+    converged, more, lam = _active_set(cov, A, b, upper, w, *_bounds_of(w, upper), max_iter)
+    iterations += more
+    w = _restore_equalities(A, b, upper, w)
+    if converged and _kkt_satisfied(cov, A, b, upper, w, lam):
+        return QPResult(np.clip(w, 0.0, upper), True, "Optimization terminated successfully", iterations)
+
+    candidates.append(w.copy())
+    best = min(candidates, key=lambda x: x @ cov.dot(x))
+    polished = _slsqp(cov, A, b, upper, best)
+    if _kkt_satisfied(cov, A, b, upper, polished, lam):
+        return QPResult(polished, True, "Optimization terminated successfully", iterations)
+    return QPResult(np.clip(best, 0.0, upper), False, "Solution failed the optimality check", iterations)
@@ -0,0 +1,251 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from app.instrumentation import record_cache_lookups
+from app.logic.covariance import FactorCovariance, estimate_covariance, pairwise_covariance
+from app.logic.price_provider import get_price_provider, to_day
+
+# Bounds for the per-process return statistics caches: a number of entries and a memory budget
+# in bytes (see approximate_bytes); whichever is reached first evicts the least recently used.
+RETURN_SERIES_CACHE_SIZE = int(os.getenv("RETURN_SERIES_CACHE_SIZE", "2000"))
+RETURN_SERIES_CACHE_BYTES = int(os.getenv("RETURN_SERIES_CACHE_BYTES", str(64 * 2 ** 20)))
+# Covariance rows: each ticker's covariances with every ticker it has been computed against.
+COVARIANCE_CACHE_SIZE = int(os.getenv("COVARIANCE_CACHE_SIZE", "2000"))
+COVARIANCE_CACHE_BYTES = int(os.getenv("COVARIANCE_CACHE_BYTES", str(128 * 2 ** 20)))
+# Estimated covariances per ticker set: n x n matrices, or loadings and specific variances.
+COVARIANCE_MODEL_CACHE_SIZE = int(os.getenv("COVARIANCE_MODEL_CACHE_SIZE", "500"))
+COVARIANCE_MODEL_CACHE_BYTES = int(os.getenv("COVARIANCE_MODEL_CACHE_BYTES", str(256 * 2 ** 20)))
+# Entries older than this are recomputed even if the as-of date matches (late price corrections).
+RETURN_STATS_TTL = int(os.getenv("RETURN_STATS_TTL", str(6 * 3600)))
+
+TRADING_DAYS = 252
+
+# Covariance estimator used by the optimizer unless a request picks one: "sample", "ledoit_wolf" or
+# "factor" (see app.logic.covariance), all from the same cached pairwise-complete covariance.
+COVARIANCE_ESTIMATOR = os.getenv("COVARIANCE_ESTIMATOR", "sample")
+# Number of statistical factors of the "factor" estimator.
+COVARIANCE_FACTORS = int(os.getenv("COVARIANCE_FACTORS", "10"))
+
+
+def approximate_bytes(value):
+    """
+    Rough in-memory size of a cached value: arrays, pandas objects and factor models by their
+    buffers, containers by their own size plus their items. Dicts are taken as covariance rows:
+    float values keyed by ticker strings that are shared with the rest of the process.
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (pd.Series, pd.DataFrame)):
+        return int(np.sum(value.memory_usage(index=True)))
+    if isinstance(value, FactorCovariance):
+        return value.loadings.nbytes + value.specific.nbytes
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sys.getsizeof(0.0) * len(value)
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(approximate_bytes(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """
+    Thread-safe mapping with LRU eviction and a per-entry TTL, bounded by a maximum number of
+    entries and, if max_bytes is set, by the total weigh(value) of its entries. A value that
+    alone exceeds max_bytes is not stored (and evicts nothing).
+    """
+
+    def __init__(self, max_entries, ttl, max_bytes=None, weigh=approximate_bytes):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.weigh = weigh
+        self.bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, key, now):
+        # Caller holds the lock
+        entry = self._data.get(key)
+        if entry is None or now - entry[0] > self.ttl:
+            if entry is not None:
+                self._discard(key)
+            return None
+        self._data.move_to_end(key)
+        return entry[1]
+
+    def _store(self, key, value, now):
+        # Caller holds the lock
+        if key in self._data:
+            self._discard(key)
+        size = self.weigh(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        self._data[key] = (now, value, size)
+        self.bytes += size
+
+    def _discard(self, key):
+        self.bytes -= self._data.pop(key)[2]
+
+    def _evict(self):
+        while self._data and (len(self._data) > self.max_entries
+                              or (self.max_bytes is not None and self.bytes > self.max_bytes)):
+            self._discard(next(iter(self._data)))
+
+    def get(self, key):
+        with self._lock:
+            value = self._lookup(key, time.monotonic())
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def get_many(self, keys):
+        """Values for keys (None where missing or expired), under one lock acquisition."""
+        now = time.monotonic()
+        with self._lock:
+            values = [self._lookup(key, now) for key in keys]
+            misses = values.count(None)
+            self.hits += len(values) - misses
+            self.misses += misses
+        return values
+
+    def put(self, key, value):
+        with self._lock:
+            self._store(key, value, time.monotonic())
+            self._evict()
+
+    def put_many(self, items):
+        with self._lock:
+            now = time.monotonic()
+            for key, value in items:
+                self._store(key, value, now)
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ReturnStatsCache:
+    """
+    Daily return series and rows of pairwise covariances per (ticker, window, as-of date), so
+    the annualised mean/covariance for any ticker set is assembled from cached pieces. Covariances
+    are pairwise-complete: each pair uses the days both tickers traded. The estimated covariance
+    (projected, shrunk or factored) depends on the whole ticker set, so it is cached per set too.
+    """
+
+    def __init__(self, provider=None, series_size=RETURN_SERIES_CACHE_SIZE,
+                 covariance_size=COVARIANCE_CACHE_SIZE, ttl=RETURN_STATS_TTL, model_size=COVARIANCE_MODEL_CACHE_SIZE,
+                 series_bytes=RETURN_SERIES_CACHE_BYTES, covariance_bytes=COVARIANCE_CACHE_BYTES,
+                 model_bytes=COVARIANCE_MODEL_CACHE_BYTES):
+        self.provider = provider
+        self.series = LRUCache(series_size, ttl, series_bytes)
+        self.covariances = LRUCache(covariance_size, ttl, covariance_bytes)
+        self.models = LRUCache(model_size, ttl, model_bytes)
+
+    def _series(self, tickers, window_days, as_of):
+        """Return series (pd.Series) and last close for each ticker, fetching misses in one call."""
+        found = {}
+        missing = []
+        for ticker in tickers:
+            entry = self.series.get((ticker, window_days, as_of))
+            if entry is None:
+                missing.append(ticker)
+            else:
+                found[ticker] = entry
+        record_cache_lookups("return_series", len(found), len(missing))
+
+        if missing:
+            provider = self.provider or get_price_provider()
+            prices = provider.get_close(missing, as_of - np.timedelta64(window_days, "D"), as_of)
+            for ticker in missing:
+                closes = prices[ticker].dropna() if ticker in prices.columns else pd.Series(dtype=float)
+                entry = (closes.pct_change().dropna(), float(closes.iloc[-1]) if len(closes) else np.nan)
+                self.series.put((ticker, window_days, as_of), entry)
+                found[ticker] = entry
+        return found
+
+    def _covariance(self, tickers, returns, window_days, as_of):
+        """
+        Pairwise-complete annualised covariance of tickers, assembled from the cached covariance
+        rows in one bulk lookup; pairs not cached are computed together and their rows updated.
+        """
+        n = len(tickers)
+        keys = [(ticker, window_days, as_of) for ticker in tickers]
+        rows = [row or {} for row in self.covariances.get_many(keys)]
+        cov = np.array([[row.get(other, np.nan) for other in tickers] for row in rows]).reshape(n, n)
+        missed = np.isnan(cov)
+        pairs = n * (n + 1) // 2
+        misses = int(np.triu(missed).sum())
+        record_cache_lookups("covariance", pairs - misses, misses)
+
+        if misses:
+            # One pairwise-complete covariance over every ticker involved in a missing pair
+            index = np.flatnonzero(missed.any(axis=1))
+            names = [tickers[k] for k in index]
+            block = pairwise_covariance(pd.DataFrame({t: returns[t] for t in names})) * TRADING_DAYS
+            cov[np.ix_(index, index)] = block
+            updated = []
+            for k, values in zip(index, block):
+                row = dict(rows[k])
+                row.update(zip(names, values.tolist()))
+                updated.append((keys[k], row))
+            self.covariances.put_many(updated)
+        return cov
+
+    def preload(self, tickers, window_days, as_of):
+        """Fetch the return series of every ticker not cached yet in one call, e.g. ahead of a batch."""
+        self._series(tickers, window_days, to_day(as_of))
+
+    def statistics(self, tickers, window_days, as_of, estimator=None):
+        """
+        Daily returns (0 on days a ticker has none), annualised mean returns and covariance, and
+        last close for tickers over [as_of - window_days, as_of). Returns None if any ticker lacks
+        price history. estimator: one of covariance.ESTIMATORS (default COVARIANCE_ESTIMATOR).
+        "sample" and "ledoit_wolf" start from the cached pairwise-complete sample covariance; the
+        "factor" covariance is fitted from the returns alone and is a FactorCovariance (loadings
+        and specific variances) rather than a DataFrame.
+        """
+        as_of = to_day(as_of)
+        estimator = estimator or COVARIANCE_ESTIMATOR
+        series = self._series(tickers, window_days, as_of)
+        if any(len(series[t][0]) < 2 for t in tickers):
+            return None
+
+        returns = {t: series[t][0] for t in tickers}
+        frame = pd.DataFrame(returns).sort_index()
+        key = (tuple(tickers), window_days, as_of, estimator)
+        cov = self.models.get(key)
+        record_cache_lookups("covariance_model", int(cov is not None), int(cov is None))
+        if cov is None:
+            sample = None if estimator == "factor" else self._covariance(tickers, returns, window_days, as_of)
+            cov = estimate_covariance(frame, estimator, TRADING_DAYS, COVARIANCE_FACTORS, sample)
+            self.models.put(key, cov)
+        return {
+            "returns": frame.fillna(0.0),
+            "mean_returns": pd.Series({t: returns[t].mean() * TRADING_DAYS for t in tickers}),
+            "cov_matrix": cov,
+            "latest_prices": pd.Series({t: series[t][1] for t in tickers})
+        }
+
+
+_cache = None
+
+
+def get_return_stats_cache():
+    global _cache
+    if _cache is None:
+        _cache = ReturnStatsCache()
+    return _cache
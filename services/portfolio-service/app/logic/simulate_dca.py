@@ -1,7 +1,8 @@
 from datetime import datetime
 import pandas as pd
 import numpy as np
-import yfinance as yf
+
+from app.logic.price_provider import get_price_provider
 
 def simulate_dca_projection(initial_investment, monthly_contribution, years, actual_cagr, optimized_cagr):
     months = years * 12
@@ -31,3 +32,147 @@ def simulate_dca_projection(initial_investment, monthly_contribution, years, act
         "actual_cagr": round(actual_cagr, 2),
         "optimized_cagr": round(optimized_cagr, 2)
     }
+
+MONTE_CARLO_HISTORY_YEARS = 10
+PERCENTILES = (5, 50, 95)
+
+def allocation_monthly_returns(weights, end_date=None, history_years=MONTE_CARLO_HISTORY_YEARS):
+    """
+    Historical monthly returns of a monthly-rebalanced allocation {ticker: weight}.
+    Months where a ticker has no price yet are covered by the remaining tickers.
+    """
+    tickers = [t for t, w in weights.items() if w > 0]
+    if not tickers:
+        return np.array([])
+    end_date = end_date or datetime.utcnow()
+    start_date = end_date - pd.DateOffset(years=history_years)
+    monthly = get_price_provider().get_monthly_close(tickers, start_date, end_date)
+    if monthly.empty:
+        return np.array([])
+
+    returns = monthly.pct_change().iloc[1:].to_numpy()
+    w = np.array([weights[t] for t in tickers])
+    available = ~np.isnan(returns)
+    scale = (available * w).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        portfolio = np.nansum(returns * w, axis=1) / scale
+    return portfolio[scale > 0]
+
+def sample_shocks(history_length, paths, months, method, block_size, rng):
+    """
+    Random draws of shape (months, paths) shared by every allocation simulated with them.
+    "bootstrap": indices into the historical months, resampled in contiguous blocks to keep
+    short-term autocorrelation. "parametric": standard normal draws for a log-normal model,
+    antithetic (the second half of the paths uses the first half's draws negated), which halves
+    the drawing and narrows the sampling error of the bands.
+    """
+    if method == "bootstrap":
+        block_size = max(1, min(block_size, history_length))
+        blocks = -(-months // block_size)
+        starts = rng.integers(0, history_length - block_size + 1, size=(blocks, 1, paths), dtype=np.int32)
+        return (starts + np.arange(block_size, dtype=np.int32)[:, None]).reshape(-1, paths)[:months]
+    if method == "parametric":
+        draws = rng.standard_normal((months, -(-paths // 2)), dtype=np.float32)
+        return np.concatenate([draws, -draws[:, :paths - draws.shape[1]]], axis=1)
+    raise ValueError(f"Unsupported method: {method}")
+
+def project_values(history, shocks, method, initial_investment, monthly_contribution, out=None):
+    """
+    Month-end values (months, paths) from the sampled shocks, with the contribution added at the
+    start of each month as in simulate_dca_projection: V_t = (V_{t-1} + c)(1 + r_t).
+    Stepped a month at a time, so each row of `paths` values is drawn, grown and stored while in
+    cache; float32 is plenty for percentile bands. out: a (months, paths) float32 buffer to fill.
+    The loop is over months only (vectorised over paths) and is deliberate: the closed form
+    V_t = G_t (V_0 + c sum_{s<t} 1/G_s) over cumulative log returns, vectorised over months in
+    float64, measured about 100 ms for 360 months x 10000 paths against about 9 ms for this loop
+    (two full-size exp passes and float64 temporaries instead of cache-resident float32 rows).
+    """
+    history = np.asarray(history, dtype=np.float64)
+    months, paths = shocks.shape
+    values = np.empty((months, paths), dtype=np.float32) if out is None else out
+    if method == "bootstrap":
+        table = (1 + history).astype(np.float32)
+    else:
+        log_returns = np.log1p(history)
+        scale, drift = np.float32(log_returns.std(ddof=1)), np.float32(log_returns.mean())
+
+    previous = np.full(paths, initial_investment, dtype=np.float32)
+    invested = np.empty(paths, dtype=np.float32)
+    contribution = np.float32(monthly_contribution)
+    for month in range(months):
+        row = values[month]
+        if method == "bootstrap":
+            np.take(table, shocks[month], out=row)
+        else:
+            np.multiply(shocks[month], scale, out=row)
+            row += drift
+            np.exp(row, out=row)
+        np.add(previous, contribution, out=invested)
+        row *= invested
+        previous = row
+    return values
+
+def percentile_bands(values, percentiles=PERCENTILES):
+    """
+    Per-month percentiles across paths (nearest rank) of values (months, paths), or a list of
+    them for a stack (k, months, paths). Sorts the rows in place: numpy's vectorised sort of every
+    row is several times faster than a partition around more than one rank.
+    """
+    paths = values.shape[-1]
+    ranks = [int(round(p / 100 * (paths - 1))) for p in percentiles]
+    values.sort(axis=-1)
+    picked = values[..., ranks].astype(np.float64).round(2)
+
+    def bands(rows):
+        return {f"p{p}": rows[:, i].tolist() for i, p in enumerate(percentiles)}
+    return bands(picked) if picked.ndim == 2 else [bands(rows) for rows in picked]
+
+def simulate_dca_monte_carlo(initial_investment, monthly_contribution, years, actual_returns, optimized_returns,
+                             paths=10000, method="bootstrap", block_size=12, seed=None):
+    """
+    Stochastic DCA projection for the actual and optimized allocations from their historical
+    monthly returns. Both allocations are driven by the same sampled months (or normal draws),
+    so their bands are directly comparable. Returns p5/p50/p95 bands per month (empty for 0 years).
+    """
+    months = max(years * 12, 0)
+    start_date = datetime.utcnow()
+    date_range = pd.date_range(start=start_date, periods=months, freq='MS')
+
+    rng = np.random.default_rng(seed)
+    history_length = min(len(actual_returns), len(optimized_returns))
+    shocks = sample_shocks(history_length, paths, months, method, block_size, rng)
+
+    # Both allocations in one buffer, so their bands come from a single sort
+    values = np.empty((2, months, paths), dtype=np.float32)
+    for out, history in zip(values, (actual_returns, optimized_returns)):
+        project_values(np.asarray(history)[-history_length:], shocks, method, initial_investment, monthly_contribution, out)
+    actual_bands, optimized_bands = percentile_bands(values)
+
+    return {
+        "dates": [date.strftime("%Y-%m") for date in date_range],
+        "method": method,
+        "paths": paths,
+        "history_months": history_length,
+        "actual_portfolio_bands": actual_bands,
+        "optimized_portfolio_bands": optimized_bands
+    }
+
+def current_weights(positions, end_date=None):
+    """Market-value weights {ticker: weight} of the positive holdings at the latest close."""
+    held = {p.ticker: p.net_shares for p in positions if p.net_shares > 0}
+    if not held:
+        return {}
+    latest = get_price_provider().get_latest_close(list(held), end_date or datetime.utcnow())
+    values = {t: shares * latest[t] for t, shares in held.items() if pd.notna(latest.get(t)) and latest[t] > 0}
+    total = sum(values.values())
+    return {t: value / total for t, value in values.items()} if total > 0 else {}
+
+def monte_carlo_projection(positions, optimized_allocation, initial_investment, monthly_contribution, years,
+                           paths=10000, method="bootstrap", block_size=12, seed=None):
+    """Monte Carlo DCA for the held allocation against the optimized one, from their price history."""
+    actual_returns = allocation_monthly_returns(current_weights(positions))
+    optimized_returns = allocation_monthly_returns(optimized_allocation)
+    if min(len(actual_returns), len(optimized_returns)) < 2:
+        return {"message": "Insufficient price history for Monte Carlo simulation."}
+    return simulate_dca_monte_carlo(initial_investment, monthly_contribution, years, actual_returns, optimized_returns,
+                                    paths=paths, method=method, block_size=block_size, seed=seed)
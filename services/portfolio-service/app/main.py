@@ -1,15 +1,54 @@
 # portfolio-service/app/main.py
 
-from fastapi import FastAPI
-from app.routes import portfolio_routes, transaction_routes, market_routes  
-from app.database import engine
-from app.models import Base
+from contextlib import asynccontextmanager
+from app.instrumentation import instrument_app, start_metrics, stop_metrics
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from app.routes import portfolio_routes, transaction_routes, market_routes, job_routes
+from sqlalchemy import inspect
+from app.database import add_column, create_indexes, engine, SessionLocal
+from app.crud.market_event import seed_market_events
+from app.executor import AnalyticsOverloaded, ANALYTICS_RETRY_AFTER, shutdown_executor
+from app.jobs import start_job_workers, stop_job_workers
+from app.price_warmer import start_price_warmer, stop_price_warmer
+from app.models import Base, Transaction
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_metrics()
+    start_job_workers()
+    start_price_warmer()
+    yield
+    await stop_price_warmer()
+    await stop_job_workers()
+    shutdown_executor()
+    stop_metrics()
+
+app = FastAPI(lifespan=lifespan)
+instrument_app(app)
 
 # Include routers
 app.include_router(portfolio_routes.router, prefix="/portfolio", tags=["Portfolio"])
 app.include_router(transaction_routes.router, prefix="/portfolio", tags=["Transactions"])
 app.include_router(market_routes.router, prefix="/market", tags=["Market Events"])  
+app.include_router(job_routes.router, prefix="/portfolio", tags=["Jobs"])
+
+# Analytics pool is saturated: shed load instead of queueing without bound
+@app.exception_handler(AnalyticsOverloaded)
+async def analytics_overloaded(request: Request, exc: AnalyticsOverloaded):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Analytics workers are busy, please retry shortly"},
+        headers={"Retry-After": str(ANALYTICS_RETRY_AFTER)}
+    )
 
 Base.metadata.create_all(bind=engine)
+
+# create_all only adds missing tables; columns and indexes added to existing tables since are patched in
+# here. Every uvicorn worker runs this at startup, so each step is idempotent rather than check-then-create.
+if "version" not in {c["name"] for c in inspect(engine).get_columns("portfolios")}:
+    add_column(engine, "portfolios", "version", "INTEGER NOT NULL DEFAULT 0")
+create_indexes(engine, Transaction.__table__)
+
+with SessionLocal() as db:
+    seed_market_events(db)
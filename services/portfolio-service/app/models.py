@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Text, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 import datetime
@@ -20,12 +20,22 @@ class Portfolio(Base):
     name = Column(String, default="Default Portfolio")
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    version = Column(Integer, nullable=False, default=0, server_default="0")  # Bumped on every transaction change
 
     user = relationship("User", back_populates="portfolios")
     transactions = relationship("Transaction", back_populates="portfolio", cascade="all, delete-orphan")
+    positions = relationship("Position", back_populates="portfolio", cascade="all, delete-orphan")
+    # Rows keyed on the portfolio are deleted with it here: SQLite does not enforce their ON DELETE
+    # CASCADE and the ORM delete path does not apply it.
+    nav = relationship("PortfolioNav", cascade="all, delete-orphan")
+    nav_summary = relationship("PortfolioNavSummary", uselist=False, cascade="all, delete-orphan")
+    suggested_allocation = relationship("SuggestedAllocation", uselist=False, cascade="all, delete-orphan")
+    jobs = relationship("Job", cascade="all, delete-orphan")
 
 class Transaction(Base):
     __tablename__ = "transactions"
+    # Keyset pagination and per-portfolio date scans walk this index in order
+    __table_args__ = (Index("ix_transactions_portfolio_date_id", "portfolio_id", "date", "id"),)
     id = Column(Integer, primary_key=True, index=True)
     portfolio_id = Column(Integer, ForeignKey("portfolios.id"), index=True)
     date = Column(DateTime)
@@ -37,3 +47,86 @@ class Transaction(Base):
     notes = Column(Text)
 
     portfolio = relationship("Portfolio", back_populates="transactions")
+
+class Position(Base):
+    """Per-ticker holdings, maintained on every transaction write (see app/crud/position.py)."""
+    __tablename__ = "positions"
+    __table_args__ = (UniqueConstraint("portfolio_id", "ticker", name="uq_positions_portfolio_ticker"),)
+    id = Column(Integer, primary_key=True, index=True)
+    portfolio_id = Column(Integer, ForeignKey("portfolios.id"), index=True)
+    ticker = Column(String)
+    net_shares = Column(Float, default=0.0)
+    cost_basis = Column(Float, default=0.0)  # Total amount spent on buys
+    first_trade_date = Column(DateTime)
+    last_trade_date = Column(DateTime)
+
+    portfolio = relationship("Portfolio", back_populates="positions")
+
+class Job(Base):
+    """Background analytics job (see app/jobs.py). Results are kept until expires_at."""
+    __tablename__ = "jobs"
+    # Workers claim the oldest pending job; submissions look up identical unfinished jobs
+    __table_args__ = (Index("ix_jobs_status_created_at", "status", "created_at"),)
+    id = Column(String, primary_key=True)  # UUID
+    user_id = Column(String, ForeignKey("users.id"), index=True)
+    portfolio_id = Column(Integer, ForeignKey("portfolios.id", ondelete="CASCADE"), index=True)
+    kind = Column(String)  # e.g., optimize or dca-simulation
+    params = Column(Text)  # JSON
+    dedupe_key = Column(String, index=True)  # Same kind, portfolio version, price data and params
+    status = Column(String, default="pending")  # pending, running, succeeded or failed
+    attempts = Column(Integer, default=0)
+    result = Column(Text)  # JSON, once succeeded
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    expires_at = Column(DateTime, index=True)
+
+class PortfolioNav(Base):
+    """One business day of a portfolio's NAV series (see app/logic/nav.py and app/crud/nav.py)."""
+    __tablename__ = "portfolio_nav"
+    portfolio_id = Column(Integer, ForeignKey("portfolios.id", ondelete="CASCADE"), primary_key=True)
+    date = Column(Date, primary_key=True)
+    market_value = Column(Float)  # Holdings valued at the day's close
+    net_flow = Column(Float)  # Buys minus sells on the day
+    daily_return = Column(Float)  # Null while nothing was held the day before
+    twr_index = Column(Float)  # Time-weighted return index, 1.0 before the first day
+    drawdown = Column(Float)  # twr_index relative to its running peak, minus one
+
+class PortfolioNavSummary(Base):
+    """Where a portfolio's NAV series ends and the running state after that day (a NavState)."""
+    __tablename__ = "portfolio_nav_summaries"
+    portfolio_id = Column(Integer, ForeignKey("portfolios.id", ondelete="CASCADE"), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)  # Portfolio.version the series was built from
+    start_date = Column(Date)
+    end_date = Column(Date)
+    dirty_from = Column(Date)  # Earliest changed transaction date since; rows from then on are stale
+    market_value = Column(Float, default=0.0)
+    twr_index = Column(Float, default=1.0)
+    peak = Column(Float, default=1.0)
+    max_drawdown = Column(Float, default=0.0)
+    return_count = Column(Integer, default=0)
+    return_sum = Column(Float, default=0.0)
+    return_sumsq = Column(Float, default=0.0)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+class MarketEvent(Base):
+    """Dated market headline shown alongside portfolio charts (see app/crud/market_event.py)."""
+    __tablename__ = "market_events"
+    # Range queries walk the date index; the unique pair makes bulk loads idempotent
+    __table_args__ = (UniqueConstraint("date", "headline", name="uq_market_events_date_headline"),)
+    id = Column(Integer, primary_key=True)
+    date = Column(Date, nullable=False, index=True)
+    headline = Column(Text, nullable=False)
+    source = Column(String)
+
+class SuggestedAllocation(Base):
+    """Latest nightly rebalancing suggestion per portfolio (see app/batch/rebalance.py)."""
+    __tablename__ = "suggested_allocations"
+    portfolio_id = Column(Integer, ForeignKey("portfolios.id", ondelete="CASCADE"), primary_key=True)
+    as_of = Column(Date, nullable=False, index=True)  # Last day of the price history used
+    version = Column(Integer, nullable=False, default=0)  # Portfolio.version the suggestion was computed from
+    target_return = Column(Float, nullable=False)
+    status = Column(String)  # succeeded, or failed with the reason in result
+    result = Column(Text)  # JSON: the GET /optimize/{portfolio_id} optimization_result
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
@@ -0,0 +1,120 @@
+"""
+Background warming of the price store: at startup and every day after the market close, the
+price history of every ticker in the transactions table is fetched into the store, so requests
+read prices from disk instead of paying for the download.
+
+Downloads go PRICE_WARM_BATCH_SIZE tickers at a time, PRICE_WARM_BATCH_INTERVAL seconds apart,
+to stay within the price source's rate limits. Only one process sharing PRICE_STORE_DIR warms
+at a time. The store is filled through get_price_provider(), so PRICE_PROVIDER=fixture warms
+it from local files, e.g. for tests.
+"""
+import asyncio
+import fcntl
+import os
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+from fastapi.concurrency import run_in_threadpool
+
+from app.crud.transaction import traded_tickers
+from app.database import ReadSessionLocal
+from app.logic.optimize import HISTORY_YEARS
+from app.logic.price_provider import get_price_provider
+from app.logic.price_store import MARKET_CLOSE_UTC, PRICE_STORE_DIR
+from app.logic.simulate_dca import MONTE_CARLO_HISTORY_YEARS
+
+PRICE_WARM_ENABLED = os.getenv("PRICE_WARM_ENABLED", "true").lower() in ("1", "true", "yes")
+# Time of day (UTC, HH:MM) of the daily run; by default the close, from which the day's bars are final.
+PRICE_WARM_TIME = os.getenv("PRICE_WARM_TIME", MARKET_CLOSE_UTC)
+# Tickers per download, and seconds between downloads.
+PRICE_WARM_BATCH_SIZE = int(os.getenv("PRICE_WARM_BATCH_SIZE", "50"))
+PRICE_WARM_BATCH_INTERVAL = float(os.getenv("PRICE_WARM_BATCH_INTERVAL", "2"))
+
+# History every analytics route reads: optimization, and the Monte Carlo bootstrap
+WARM_YEARS = max(HISTORY_YEARS, MONTE_CARLO_HISTORY_YEARS)
+
+_task = None
+
+
+def warm_batches(first_dates, today, batch_size=PRICE_WARM_BATCH_SIZE):
+    """
+    Downloads (tickers, start, end) covering {ticker: first transaction date}: each ticker from
+    WARM_YEARS years back, or from shortly before its first transaction if that is earlier,
+    through today. Tickers are batched in order of start, so a batch fetches little it does not need.
+    """
+    end = today + pd.Timedelta(days=1)
+    history_start = today - pd.DateOffset(years=WARM_YEARS) - pd.Timedelta(days=1)
+    starts = sorted((min(history_start, pd.Timestamp(first).normalize() - pd.Timedelta(days=10)), ticker)
+                    for ticker, first in first_dates.items())
+    batches = []
+    for i in range(0, len(starts), batch_size):
+        batch = starts[i:i + batch_size]
+        batches.append(([ticker for _, ticker in batch], batch[0][0], end))
+    return batches
+
+
+def _load_traded_tickers():
+    with ReadSessionLocal() as db:
+        return traded_tickers(db)
+
+
+async def warm_price_store(batch_size=PRICE_WARM_BATCH_SIZE, interval=PRICE_WARM_BATCH_INTERVAL):
+    """
+    Fetch the price history of every traded ticker into the store, a batch at a time.
+    Returns the number of tickers warmed, or None if another process is already warming.
+    """
+    os.makedirs(PRICE_STORE_DIR, exist_ok=True)
+    with open(os.path.join(PRICE_STORE_DIR, ".warming.lock"), "a") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+        try:
+            first_dates = await run_in_threadpool(_load_traded_tickers)
+            started = time.perf_counter()
+            batches = warm_batches(first_dates, pd.Timestamp(datetime.utcnow().date()), batch_size)
+            for i, (tickers, start, end) in enumerate(batches):
+                if i:
+                    await asyncio.sleep(interval)
+                # Fetch failures are logged by the store and the range left uncovered for requests to retry
+                await run_in_threadpool(get_price_provider().get_close, tickers, start, end)
+            print(f"Warmed prices of {len(first_dates)} tickers in {time.perf_counter() - started:.1f}s")
+            return len(first_dates)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def seconds_until_next_run(now):
+    """Seconds from now (UTC) to the next PRICE_WARM_TIME."""
+    hour, minute = (int(part) for part in PRICE_WARM_TIME.split(":"))
+    run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if run <= now:
+        run += timedelta(days=1)
+    return (run - now).total_seconds()
+
+
+async def _warmer_loop():
+    while True:
+        try:
+            await warm_price_store()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Price warming failed: {e}")
+        await asyncio.sleep(seconds_until_next_run(datetime.utcnow()))
+
+
+def start_price_warmer():
+    """Warm the price store now and daily at PRICE_WARM_TIME (called from the app lifespan)."""
+    global _task
+    if PRICE_WARM_ENABLED:
+        _task = asyncio.create_task(_warmer_loop())
+
+
+async def stop_price_warmer():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
@@ -0,0 +1,68 @@
+import hashlib
+import os
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.instrumentation import record_cache_lookups
+from app.logic.price_provider import price_data_as_of
+from app.logic.return_stats import LRUCache
+
+# Rendered analytics responses kept per process, keyed on portfolio versions and the price as-of stamp.
+ANALYTICS_CACHE_SIZE = int(os.getenv("ANALYTICS_CACHE_SIZE", "1000"))
+ANALYTICS_CACHE_TTL = int(os.getenv("ANALYTICS_CACHE_TTL", "900"))
+# Total size of the cached response bodies.
+ANALYTICS_CACHE_BYTES = int(os.getenv("ANALYTICS_CACHE_BYTES", str(64 * 2 ** 20)))
+
+_cache = LRUCache(ANALYTICS_CACHE_SIZE, ANALYTICS_CACHE_TTL, ANALYTICS_CACHE_BYTES, weigh=len)
+
+
+def analytics_key(route, versions, request: Request):
+    """
+    Cache key of an analytics response: the route, {portfolio_id: version} of every portfolio it
+    reads, the price data as-of stamp and the query parameters.
+    """
+    return (
+        route,
+        tuple(sorted(versions.items())),
+        price_data_as_of(),
+        tuple(sorted(request.query_params.multi_items()))
+    )
+
+
+def etag_for(key):
+    return '"' + hashlib.sha1(repr(key).encode()).hexdigest() + '"'
+
+
+def _client_has(request: Request, etag):
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag in tags or "*" in tags
+
+
+async def cached_response(request: Request, key, compute, cacheable=None):
+    """
+    Serve an analytics response for key: 304 if the client already holds it (If-None-Match),
+    the cached body if this process rendered it before, otherwise await compute() and cache it.
+    The ETag is derived from the key, so revalidation never touches the data.
+    cacheable(result): if given and false, the result is served without an ETag and not cached,
+    e.g. when part of it failed. Errors compute() raises (HTTPException) are never cached.
+    """
+    etag = etag_for(key)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _client_has(request, etag):
+        record_cache_lookups("analytics_response", 1, 0)
+        return Response(status_code=304, headers=headers)
+
+    body = _cache.get(key)
+    record_cache_lookups("analytics_response", body is not None, body is None)
+    if body is None:
+        result = await compute()
+        body = JSONResponse(jsonable_encoder(result)).body
+        if cacheable is not None and not cacheable(result):
+            return Response(body, media_type="application/json", headers={"Cache-Control": "no-store"})
+        _cache.put(key, body)
+    return Response(body, media_type="application/json", headers=headers)
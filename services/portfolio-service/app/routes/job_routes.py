@@ -0,0 +1,95 @@
+import json
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+from app.models import Job, Portfolio
+from app.database import get_db
+from app.crud.job import get_job, find_duplicate_job, create_job
+from app.jobs import dedupe_key, notify_workers
+from app.schemas.job import JOB_PARAMS, JobSubmitRequest
+
+router = APIRouter()
+
+def job_row(job: Job):
+    row = {
+        "job_id": job.id,
+        "kind": job.kind,
+        "portfolio_id": job.portfolio_id,
+        "params": json.loads(job.params),
+        "status": job.status,
+        "attempts": job.attempts,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "expires_at": job.expires_at
+    }
+    if job.status == "succeeded":
+        row["result"] = json.loads(job.result)
+    elif job.status == "failed":
+        row["error"] = job.error
+    return row
+
+# ==========================
+# Submit a Job
+# ==========================
+'''Queues a long-running analytics computation instead of holding the connection open for it.
+kind is optimize or dca-simulation; params are the query parameters of the matching GET route.
+Returns 202 with the job ID; poll GET /jobs/{job_id} for the status and, once done, the result.
+Submitting the same job again while it is queued, running or its result is still kept returns
+the existing job instead of computing it twice.'''
+@router.post("/jobs", status_code=202)
+def submit_job(req: JobSubmitRequest, request: Request, response: Response, db: Session = Depends(get_db)):
+    user_id = request.headers.get("X-User-Id")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Missing X-User-Id header")
+
+    portfolio = db.query(Portfolio.user_id, Portfolio.version).filter(Portfolio.id == req.portfolio_id).first()
+    if not portfolio or portfolio.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Portfolio not found or not authorized")
+
+    try:
+        params = JOB_PARAMS[req.kind](**req.params).model_dump()
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=json.loads(e.json(include_url=False)))
+
+    key = dedupe_key(req.kind, req.portfolio_id, portfolio.version, params)
+    job = find_duplicate_job(db, user_id, key)
+    if job is None:
+        job = create_job(db, user_id, req.portfolio_id, req.kind, params, key)
+        notify_workers()
+
+    response.headers["Location"] = str(request.url_for("job_status", job_id=job.id))
+    return job_row(job)
+
+# ==========================
+# Job Status and Result
+# ==========================
+@router.get("/jobs/{job_id}")
+def job_status(job_id: str, request: Request, db: Session = Depends(get_db)):
+    user_id = request.headers.get("X-User-Id")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Missing X-User-Id header")
+
+    job = get_job(db, job_id)
+    if not job or job.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Job not found, expired or not authorized")
+
+    return job_row(job)
+
+# ==========================
+# Cancel or Discard a Job
+# ==========================
+'''Removes the job: a queued job is never run, a running job's result is discarded.'''
+@router.delete("/jobs/{job_id}")
+def delete_job(job_id: str, request: Request, db: Session = Depends(get_db)):
+    user_id = request.headers.get("X-User-Id")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Missing X-User-Id header")
+
+    job = get_job(db, job_id)
+    if not job or job.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Job not found, expired or not authorized")
+
+    db.delete(job)
+    db.commit()
+    return {"message": f"Job {job_id} deleted successfully"}
@@ -1,24 +1,29 @@
+import json
+from datetime import date
+import numpy as np
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Request, Query
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from app.models import Portfolio, Transaction, User
-from app.database import SessionLocal
-from app.logic.metrics import compute_portfolio_metrics
-from app.logic.optimize import optimize_portfolio  
-from app.logic.simulate_dca import simulate_dca_projection
+from app.database import get_db, get_read_db, SessionLocal
+from app.logic.metrics import compute_portfolio_metrics, compute_batch_metrics, nav_statistics
+from app.logic.optimize import optimize_portfolio, compute_efficient_frontier
+from app.logic.pipeline import SECTIONS, StageError, resolve_stages, run_pipeline
 from app.logic.portfolio_value import compute_value_over_time
+from app.crud.position import get_positions, get_holdings, get_holdings_for_portfolios
+from app.crud.transaction import load_ledger
+from app.crud.nav import refresh_navs, get_nav_series
+from app.crud.market_event import get_market_events
+from app.crud.suggested_allocation import get_suggested_allocation
+from app.executor import run_cpu
+from app.routes.market_routes import MAX_EVENTS, event_rows
+from app.jobs import job_handler
+from app.response_cache import analytics_key, cached_response
+from app.logic.csv_import import open_transaction_csv, import_transactions, CSVImportError
 from app.schemas.portfolio import PortfolioUpdateRequest
-import pandas as pd
-from io import StringIO
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # ==========================
 # CSV Upload & Portfolio Create
 # ==========================
@@ -30,13 +35,11 @@ def upload(file: UploadFile = File(...), request: Request = None, db: Session =
     if not file.filename.endswith(".csv"):
         raise HTTPException(status_code=400, detail="File must be a CSV")
 
-    content = file.file.read().decode("utf-8")
-    df = pd.read_csv(StringIO(content))
-
-    required_columns = {"date", "ticker", "action", "shares", "price", "amount", "notes"}
-    if not required_columns.issubset(df.columns):
-        missing = required_columns - set(df.columns)
-        raise HTTPException(status_code=400, detail=f"CSV missing columns: {missing}")
+    # Header is checked up front; rows are parsed, validated and inserted chunk by chunk
+    try:
+        chunks = open_transaction_csv(file.file)
+    except CSVImportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
@@ -47,39 +50,42 @@ def upload(file: UploadFile = File(...), request: Request = None, db: Session =
 
     portfolio = Portfolio(user_id=user_id, name="Imported Portfolio")
     db.add(portfolio)
-    db.commit()
-    db.refresh(portfolio)
+    db.flush()
 
-    for _, row in df.iterrows():
-        transaction = Transaction(
-            portfolio_id=portfolio.id,
-            date=pd.to_datetime(row["date"]),
-            ticker=row["ticker"],
-            action=row["action"],
-            shares=row["shares"],
-            price=row["price"],
-            amount=row["amount"],
-            notes=row.get("notes", "")
-        )
-        db.add(transaction)
+    try:
+        summary = import_transactions(db, portfolio.id, chunks)
+    except CSVImportError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
 
     db.commit()
 
-    return {"message": "Portfolio and transactions uploaded", "portfolio_id": portfolio.id}
+    return {"message": "Portfolio and transactions uploaded", "portfolio_id": portfolio.id, **summary}
 
 # ==========================
-# Debug: Get All Portfolios
+# List Portfolios
 # ==========================
-@router.get("/debug/portfolios")
-def debug_portfolios(db: Session = Depends(get_db)):
-    portfolios = db.query(Portfolio).all()
-    return [{
-        "id": p.id,
-        "user_id": p.user_id,
-        "name": p.name,
-        "created_at": p.created_at,
-        "updated_at": p.updated_at
-    } for p in portfolios]
+'''Lists the user's portfolios by id, keyset-paginated: pass the previous page's next_cursor as cursor.'''
+@router.get("/portfolios")
+def list_portfolios(request: Request,
+                    limit: int = Query(100, ge=1, le=1000),
+                    cursor: int = Query(None),
+                    db: Session = Depends(get_read_db)):
+    user_id = request.headers.get("X-User-Id")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Missing X-User-Id header")
+
+    query = db.query(Portfolio.id, Portfolio.name, Portfolio.created_at, Portfolio.updated_at) \
+        .filter(Portfolio.user_id == user_id)
+    if cursor is not None:
+        query = query.filter(Portfolio.id > cursor)
+    rows = query.order_by(Portfolio.id).limit(limit + 1).all()
+    page = rows[:limit]
+
+    return {
+        "portfolios": [row._asdict() for row in page],
+        "next_cursor": page[-1].id if len(rows) > limit else None
+    }
 
 # ==========================
 # Delete a Portfolio
@@ -123,27 +129,135 @@ def update_portfolio(portfolio_id: int, req: PortfolioUpdateRequest, request: Re
 
     return {"message": f"Portfolio {portfolio_id} updated", "name": portfolio.name}
 
+# ==========================
+# Portfolio Positions
+# ==========================
+@router.get("/positions/{portfolio_id}")
+def portfolio_positions(portfolio_id: int, request: Request, db: Session = Depends(get_db)):
+    user_id = request.headers.get("X-User-Id")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Missing X-User-Id header")
+
+    portfolio = db.query(Portfolio).filter(Portfolio.id == portfolio_id).first()
+    if not portfolio or portfolio.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Portfolio not found or not authorized")
+
+    return {"portfolio_id": portfolio_id, "positions": [{
+        "ticker": p.ticker,
+        "net_shares": p.net_shares,
+        "cost_basis": p.cost_basis,
+        "first_trade_date": p.first_trade_date,
+        "last_trade_date": p.last_trade_date
+    } for p in get_positions(db, portfolio_id)]}
+
+# ==========================
+# Analytics Data Loading
+# ==========================
+def owned_portfolio_versions(db: Session, user_id: str, portfolio_ids=None):
+    """
+    Ownership check for the analytics routes: {portfolio_id: version} of the requested portfolios
+    (all of the user's if portfolio_ids is None). Raises 404 if any is missing or not the user's.
+    """
+    query = db.query(Portfolio.id, Portfolio.user_id, Portfolio.version)
+    if portfolio_ids is None:
+        return {pid: version for pid, _, version in query.filter(Portfolio.user_id == user_id).order_by(Portfolio.id)}
+
+    found = {pid: (owner, version) for pid, owner, version in query.filter(Portfolio.id.in_(portfolio_ids))}
+    if any(found.get(pid, (None,))[0] != user_id for pid in portfolio_ids):
+        raise HTTPException(status_code=404, detail="Portfolio not found or not authorized")
+    return {pid: found[pid][1] for pid in portfolio_ids}
+
+def load_portfolio_data(db: Session, portfolio_id: int, transactions=False, positions=False):
+    """
+    The data the analytics routes need: the transaction Ledger and Holding tuples, both cheap to
+    pickle to the worker processes. Call owned_portfolio_versions first.
+    Blocking; the async routes call it through run_in_threadpool.
+    """
+    return (
+        load_ledger(db, portfolio_id) if transactions else None,
+        get_holdings(db, portfolio_id) if positions else None
+    )
+
+def parse_weight_caps(weight_caps: str):
+    """{ticker: cap} from the weight_caps query parameter, e.g. AAPL:0.3,MSFT:0.5. Raises 400 if malformed."""
+    if not weight_caps:
+        return None
+    try:
+        caps = {ticker.strip(): float(cap) for ticker, cap in (item.split(":") for item in weight_caps.split(",") if item.strip())}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="weight_caps must be comma-separated TICKER:cap pairs, e.g. AAPL:0.3")
+    if any(not 0 <= cap <= 1 for cap in caps.values()):
+        raise HTTPException(status_code=400, detail="Weight caps must be between 0 and 1")
+    return caps
+
+def load_nav_states(portfolio_ids):
+    """
+    {portfolio_id: NavState} of the portfolios' daily NAV series, extended or rebuilt first where
+    stale. Uses a primary session, since refreshing writes.
+    """
+    db = SessionLocal()
+    try:
+        return refresh_navs(db, portfolio_ids)
+    finally:
+        db.close()
+
 # ==========================
 # Portfolio Metrics
 # ==========================
 ''' This endpoint computes various metrics for the portfolio based on historical transactions.
 It uses the compute_portfolio_metrics function to calculate metrics like total return, volatility, etc.
+Max drawdown, Sharpe ratio and time-weighted return come from the stored daily NAV series summary,
+which is brought up to date first if transactions changed or a trading day passed.
 The response includes the computed metrics. '''
 
 @router.get("/metrics/{portfolio_id}")
-def portfolio_metrics(portfolio_id: int, request: Request, db: Session = Depends(get_db)):
+async def portfolio_metrics(portfolio_id: int, request: Request, db: Session = Depends(get_read_db)):
     user_id = request.headers.get("X-User-Id")
     if not user_id:
         raise HTTPException(status_code=401, detail="Missing X-User-Id header")
 
-    portfolio = db.query(Portfolio).filter(Portfolio.id == portfolio_id).first()
-    if not portfolio or portfolio.user_id != user_id:
-        raise HTTPException(status_code=404, detail="Portfolio not found or not authorized")
+    versions = await run_in_threadpool(owned_portfolio_versions, db, user_id, [portfolio_id])
 
-    transactions = db.query(Transaction).filter(Transaction.portfolio_id == portfolio_id).all()
-    metrics = compute_portfolio_metrics(transactions)
+    async def compute():
+        _, positions = await run_in_threadpool(load_portfolio_data, db, portfolio_id, positions=True)
+        nav = await run_in_threadpool(load_nav_states, [portfolio_id])
+        metrics = await run_cpu(compute_portfolio_metrics, None, positions, nav[portfolio_id])
+        return {"portfolio_id": portfolio_id, "metrics": metrics}
 
-    return {"portfolio_id": portfolio_id, "metrics": metrics}
+    return await cached_response(request, analytics_key("metrics", versions, request), compute)
+
+# ==========================
+# Batch Portfolio Metrics
+# ==========================
+'''This endpoint computes the metrics of many portfolios in one request, e.g. for a dashboard.
+portfolio_ids is a comma-separated list; without it every portfolio of the user is included.
+Positions and NAV summaries are loaded with one query each, prices for the union of held tickers
+are fetched once, and the metrics are computed together in one worker call.'''
+@router.get("/metrics")
+async def batch_portfolio_metrics(request: Request,
+                                  portfolio_ids: str = Query(None, description="Comma-separated portfolio IDs, e.g. 1,2,3"),
+                                  db: Session = Depends(get_read_db)):
+    user_id = request.headers.get("X-User-Id")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Missing X-User-Id header")
+
+    ids = None
+    if portfolio_ids:
+        try:
+            ids = [int(pid) for pid in portfolio_ids.split(",") if pid.strip()]
+        except ValueError:
+            raise HTTPException(status_code=400, detail="portfolio_ids must be comma-separated integers")
+
+    versions = await run_in_threadpool(owned_portfolio_versions, db, user_id, ids)
+
+    async def compute():
+        holdings = await run_in_threadpool(get_holdings_for_portfolios, db, list(versions)) if versions else {}
+        nav = await run_in_threadpool(load_nav_states, list(versions)) if versions else {}
+        portfolios = {pid: (None, holdings[pid]) for pid in versions}
+        metrics = await run_cpu(compute_batch_metrics, portfolios, nav) if portfolios else {}
+        return {"portfolios": [{"portfolio_id": pid, "metrics": m} for pid, m in metrics.items()]}
+
+    return await cached_response(request, analytics_key("batch-metrics", versions, request), compute)
 
 # ==========================
 # Portfolio Optimization
@@ -151,120 +265,285 @@ def portfolio_metrics(portfolio_id: int, request: Request, db: Session = Depends
 '''This endpoint optimizes the portfolio based on historical transactions and a target return.
 It uses the optimization logic to determine the best asset allocation.
 The target_return parameter is used to specify the desired return for the optimization.
+max_weight caps every holding's weight, weight_caps individual ones (e.g. AAPL:0.3,MSFT:0.5).
+covariance picks the covariance estimator: sample, ledoit_wolf (shrunk, for many holdings with
+short histories) or factor (statistical factor model, for large universes); default COVARIANCE_ESTIMATOR.
 The response includes the optimized allocation and expected metrics.'''
 @router.get("/optimize/{portfolio_id}")
-def optimize(portfolio_id: int, target_return: float = Query(0.20, description="Target return as a decimal, e.g., 0.08 for 8%"),
-             request: Request = None, db: Session = Depends(get_db)):
+async def optimize(portfolio_id: int, target_return: float = Query(0.20, description="Target return as a decimal, e.g., 0.08 for 8%"),
+                   max_weight: float = Query(None, gt=0, le=1, description="Largest weight of any holding"),
+                   weight_caps: str = Query(None, description="Per-ticker weight caps, e.g. AAPL:0.3,MSFT:0.5"),
+                   covariance: str = Query(None, pattern="^(sample|ledoit_wolf|factor)$", description="Covariance estimator"),
+                   request: Request = None, db: Session = Depends(get_read_db)):
     user_id = request.headers.get("X-User-Id")
     if not user_id:
         raise HTTPException(status_code=401, detail="Missing X-User-Id header")
 
-    portfolio = db.query(Portfolio).filter(Portfolio.id == portfolio_id).first()
-    if not portfolio or portfolio.user_id != user_id:
-        raise HTTPException(status_code=404, detail="Portfolio not found or not authorized")
+    caps = parse_weight_caps(weight_caps)
+    versions = await run_in_threadpool(owned_portfolio_versions, db, user_id, [portfolio_id])
 
-    transactions = db.query(Transaction).filter(Transaction.portfolio_id == portfolio_id).all()
+    async def compute():
+        return await optimize_result(db, portfolio_id, target_return=target_return, max_weight=max_weight,
+                                     weight_caps=caps, covariance=covariance)
 
-    optimization_result = optimize_portfolio(transactions, target_return)
+    return await cached_response(request, analytics_key("optimize", versions, request), compute)
 
+@job_handler("optimize")
+async def optimize_result(db: Session, portfolio_id: int, target_return: float = 0.20,
+                          max_weight: float = None, weight_caps: dict = None, covariance: str = None):
+    """Body of GET /optimize/{portfolio_id}, also run as a background job (see app/routes/job_routes.py)."""
+    _, positions = await run_in_threadpool(load_portfolio_data, db, portfolio_id, positions=True)
+    optimization_result = await run_cpu(optimize_portfolio, positions, target_return, max_weight, weight_caps, covariance)
     return {
         "portfolio_id": portfolio_id,
         "target_return": target_return,
         "optimization_result": optimization_result
     }
 
+# ==========================
+# Suggested Allocation
+# ==========================
+'''This endpoint returns the portfolio's latest rebalancing suggestion from the nightly batch run
+(python -m app.batch.rebalance): the optimization result for its target return, the day of price
+history it used, and whether the portfolio's transactions changed since (stale).'''
+@router.get("/suggested-allocation/{portfolio_id}")
+def suggested_allocation(portfolio_id: int, request: Request, db: Session = Depends(get_read_db)):
+    user_id = request.headers.get("X-User-Id")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Missing X-User-Id header")
+
+    versions = owned_portfolio_versions(db, user_id, [portfolio_id])
+    suggestion = get_suggested_allocation(db, portfolio_id)
+    if not suggestion:
+        raise HTTPException(status_code=404, detail="No suggested allocation yet")
+
+    return {
+        "portfolio_id": portfolio_id,
+        "as_of": suggestion.as_of,
+        "target_return": suggestion.target_return,
+        "stale": suggestion.version != versions[portfolio_id],
+        "optimization_result": json.loads(suggestion.result)
+    }
+
+# ==========================
+# Efficient Frontier
+# ==========================
+'''This endpoint computes the efficient frontier for the portfolio's holdings in one pass.
+Target returns are given either as a comma-separated list (targets) or as a range (start, stop, steps);
+with neither, the range of the holdings' own mean returns is used.
+Return statistics are computed once and each solve is warm-started from the previous one.
+max_weight and weight_caps bound the weights and covariance picks the estimator as for /optimize.'''
+@router.get("/optimize/{portfolio_id}/frontier")
+async def efficient_frontier(portfolio_id: int,
+                             targets: str = Query(None, description="Comma-separated target returns, e.g. 0.05,0.08,0.1"),
+                             start: float = Query(None, description="First target return of the range"),
+                             stop: float = Query(None, description="Last target return of the range"),
+                             steps: int = Query(20, ge=2, le=200, description="Number of targets in the range"),
+                             max_weight: float = Query(None, gt=0, le=1, description="Largest weight of any holding"),
+                             weight_caps: str = Query(None, description="Per-ticker weight caps, e.g. AAPL:0.3,MSFT:0.5"),
+                             covariance: str = Query(None, pattern="^(sample|ledoit_wolf|factor)$", description="Covariance estimator"),
+                             request: Request = None, db: Session = Depends(get_read_db)):
+    user_id = request.headers.get("X-User-Id")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Missing X-User-Id header")
+
+    if targets:
+        try:
+            target_returns = [float(t) for t in targets.split(",") if t.strip()]
+        except ValueError:
+            raise HTTPException(status_code=400, detail="targets must be comma-separated numbers")
+        if len(target_returns) > 200:
+            raise HTTPException(status_code=400, detail="At most 200 targets per request")
+    elif start is not None or stop is not None:
+        if start is None or stop is None:
+            raise HTTPException(status_code=400, detail="Both start and stop are required for a range")
+        target_returns = np.linspace(start, stop, steps).tolist()
+    else:
+        target_returns = None
+
+    caps = parse_weight_caps(weight_caps)
+    versions = await run_in_threadpool(owned_portfolio_versions, db, user_id, [portfolio_id])
+
+    async def compute():
+        _, positions = await run_in_threadpool(load_portfolio_data, db, portfolio_id, positions=True)
+        frontier = await run_cpu(compute_efficient_frontier, positions, target_returns, steps, max_weight, caps, covariance)
+        return {"portfolio_id": portfolio_id, **frontier}
+
+    return await cached_response(request, analytics_key("frontier", versions, request), compute)
+
 # ==========================
 # Portfolio Over Time
 # ==========================
 '''This endpoint computes the portfolio value over time based on historical transactions and prices.
-It uses the optimization logic to simulate the portfolio's performance.
-The target_return parameter is used to determine the expected return for the optimization.
-The response includes both the actual and optimized portfolio values over time.'''
+Holdings are valued at the end of every period of the requested frequency (daily, weekly or monthly).
+The response includes the start date, end date, and portfolio values per period.
+With include_events=true the market events between the start and end date are attached as well.'''
 @router.get("/value-over-time/{portfolio_id}")
-def value_over_time(portfolio_id: int, target_return: float = Query(0.08, description="Target return for optimization"),
-                    request: Request = None, db: Session = Depends(get_db)):
+async def value_over_time(portfolio_id: int, target_return: float = Query(0.08, description="Target return for optimization"),
+                          frequency: str = Query("monthly", pattern="^(daily|weekly|monthly)$", description="Valuation frequency: daily, weekly or monthly"),
+                          include_events: bool = Query(False, description="Attach market events in the valued range"),
+                          request: Request = None, db: Session = Depends(get_read_db)):
     user_id = request.headers.get("X-User-Id")
     if not user_id:
         raise HTTPException(status_code=401, detail="Missing X-User-Id header")
 
-    portfolio = db.query(Portfolio).filter(Portfolio.id == portfolio_id).first()
-    if not portfolio or portfolio.user_id != user_id:
-        raise HTTPException(status_code=404, detail="Portfolio not found or not authorized")
-
-    transactions = db.query(Transaction).filter(Transaction.portfolio_id == portfolio_id).all()
+    versions = await run_in_threadpool(owned_portfolio_versions, db, user_id, [portfolio_id])
 
-    result = compute_value_over_time(transactions, target_return)
+    async def compute():
+        transactions, _ = await run_in_threadpool(load_portfolio_data, db, portfolio_id, transactions=True)
+        result = await run_cpu(compute_value_over_time, transactions, target_return, frequency)
+        if "error" in result:
+            raise HTTPException(status_code=400, detail=result["error"])
+        if include_events and "start_date" in result:
+            events = await run_in_threadpool(
+                get_market_events, db, date.fromisoformat(result["start_date"]), date.fromisoformat(result["end_date"]), MAX_EVENTS
+            )
+            result["events"] = event_rows(events)
+        return result
 
-    return result
+    return await cached_response(request, analytics_key("value-over-time", versions, request), compute)
 
 # ==========================
 # Dollar-Cost Averaging Simulation
 # ==========================
 '''This endpoint simulates a dollar-cost averaging (DCA) strategy for the portfolio.
-It uses the compute_value_over_time function to simulate the portfolio's performance.
-The target_return parameter is used to determine the expected return for the simulation.
-The response includes the simulated portfolio values over time.'''
+It projects the actual and optimized portfolios forward using their CAGRs.
+The target_return parameter is used to determine the expected return for the optimization.
+The response includes the simulated portfolio values over time.
+With mode=monte_carlo it instead simulates `paths` futures from the allocations' historical monthly
+returns (block bootstrap, or a fitted log-normal with method=parametric) and returns p5/p50/p95 bands.'''
 @router.get("/dca-simulation/{portfolio_id}")
-def dca_simulation(request: Request, 
-                   portfolio_id: int,
-                   initial_investment: float = Query(10000),
-                   monthly_contribution: float = Query(500),
-                   years: int = Query(10),
-                   target_return: float = Query(0.10),
-                   db: Session = Depends(get_db)):
+async def dca_simulation(request: Request,
+                         portfolio_id: int,
+                         initial_investment: float = Query(10000),
+                         monthly_contribution: float = Query(500),
+                         years: int = Query(10, ge=1),
+                         target_return: float = Query(0.10),
+                         mode: str = Query("deterministic", pattern="^(deterministic|monte_carlo)$"),
+                         paths: int = Query(10000, ge=100, le=100000),
+                         method: str = Query("bootstrap", pattern="^(bootstrap|parametric)$"),
+                         block_size: int = Query(12, ge=1, le=120),
+                         seed: int = Query(None),
+                         db: Session = Depends(get_read_db)):
     user_id = request.headers.get("X-User-Id")
     if not user_id:
         raise HTTPException(status_code=401, detail="Missing X-User-Id header")
 
-    portfolio = db.query(Portfolio).filter(Portfolio.id == portfolio_id).first()
-    if not portfolio or portfolio.user_id != user_id:
-        raise HTTPException(status_code=404, detail="Portfolio not found or not authorized")
+    versions = await run_in_threadpool(owned_portfolio_versions, db, user_id, [portfolio_id])
 
-    transactions = db.query(Transaction).filter(Transaction.portfolio_id == portfolio_id).all()
+    async def compute():
+        return await dca_simulation_result(
+            db, portfolio_id, initial_investment=initial_investment, monthly_contribution=monthly_contribution,
+            years=years, target_return=target_return, mode=mode, paths=paths, method=method,
+            block_size=block_size, seed=seed
+        )
+
+    return await cached_response(request, analytics_key("dca-simulation", versions, request), compute)
+
+@job_handler("dca-simulation")
+async def dca_simulation_result(db: Session, portfolio_id: int, initial_investment: float = 10000,
+                                monthly_contribution: float = 500, years: int = 10, target_return: float = 0.10,
+                                mode: str = "deterministic", paths: int = 10000, method: str = "bootstrap",
+                                block_size: int = 12, seed: int = None):
+    """Body of GET /dca-simulation/{portfolio_id}, also run as a background job (see app/routes/job_routes.py)."""
+    transactions, positions = await run_in_threadpool(
+        load_portfolio_data, db, portfolio_id, transactions=mode != "monte_carlo", positions=True
+    )
+    params = {
+        "initial_investment": initial_investment, "monthly_contribution": monthly_contribution, "years": years,
+        "target_return": target_return, "mode": mode, "paths": paths, "method": method,
+        "block_size": block_size, "seed": seed
+    }
 
-    # Calculate real metrics
-    actual_metrics = compute_portfolio_metrics(transactions)
-    if "cagr" not in actual_metrics or actual_metrics["cagr"] == 0:
-        raise HTTPException(status_code=400, detail="CAGR could not be calculated from portfolio.")
-    actual_cagr = actual_metrics["cagr"]
+    # Metrics (deterministic mode only) and optimization share one ledger and one price fetch
+    try:
+        result = await run_cpu(run_pipeline, transactions, positions, ["projection"], params, strict=True)
+    except StageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return result["projection"]
+
+# ==========================
+# Combined Portfolio Analytics
+# ==========================
+'''This endpoint returns several analytics of the portfolio in one response, e.g. for a dashboard.
+sections is a comma-separated subset of positions, metrics, value_over_time, optimization and
+projection (default: all); the other parameters are those of the individual routes.
+Transactions and positions are loaded once, the prices every section needs are fetched in one call,
+and the sections are computed in dependency order in one worker call, so a projection reuses the
+metrics and optimization results. A section that cannot be computed reports {"error": ...}; such a
+response is not cached, so the next request computes it again.'''
+@router.get("/analytics/{portfolio_id}")
+async def portfolio_analytics(request: Request,
+                              portfolio_id: int,
+                              sections: str = Query(None, description="Comma-separated sections, e.g. metrics,optimization"),
+                              target_return: float = Query(0.10),
+                              frequency: str = Query("monthly", pattern="^(daily|weekly|monthly)$", description="Valuation frequency: daily, weekly or monthly"),
+                              initial_investment: float = Query(10000),
+                              monthly_contribution: float = Query(500),
+                              years: int = Query(10, ge=1),
+                              mode: str = Query("deterministic", pattern="^(deterministic|monte_carlo)$"),
+                              paths: int = Query(10000, ge=100, le=100000),
+                              method: str = Query("bootstrap", pattern="^(bootstrap|parametric)$"),
+                              block_size: int = Query(12, ge=1, le=120),
+                              seed: int = Query(None),
+                              db: Session = Depends(get_read_db)):
+    user_id = request.headers.get("X-User-Id")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Missing X-User-Id header")
 
-    # Calculate optimized metrics
-    optimized_result = optimize_portfolio(transactions, target_return)
-    if "cagr" not in optimized_result:
-        return {"message": "Optimization failed", "reason": optimized_result.get("message")}
+    requested = list(SECTIONS)
+    if sections:
+        requested = list(dict.fromkeys(s.strip() for s in sections.split(",") if s.strip()))
+        unknown = [s for s in requested if s not in SECTIONS]
+        if unknown or not requested:
+            raise HTTPException(status_code=400, detail=f"sections must be a comma-separated subset of {', '.join(SECTIONS)}")
+
+    params = {
+        "target_return": target_return, "frequency": frequency, "initial_investment": initial_investment,
+        "monthly_contribution": monthly_contribution, "years": years, "mode": mode, "paths": paths,
+        "method": method, "block_size": block_size, "seed": seed
+    }
+    versions = await run_in_threadpool(owned_portfolio_versions, db, user_id, [portfolio_id])
 
-    optimized_cagr = optimized_result["cagr"]
+    async def compute():
+        transactions, positions = await run_in_threadpool(
+            load_portfolio_data, db, portfolio_id, transactions=True, positions=True
+        )
+        stages = resolve_stages(requested, params)
+        nav = (await run_in_threadpool(load_nav_states, [portfolio_id]))[portfolio_id] if "metrics" in stages else None
+        result = await run_cpu(run_pipeline, transactions, positions, requested, params, nav)
+        return {"portfolio_id": portfolio_id, **result}
 
-    # Simulate with real CAGR values
-    result = simulate_dca_projection(initial_investment, monthly_contribution, years, actual_cagr, optimized_cagr)
+    def complete(result):
+        return not any(isinstance(section, dict) and "error" in section for section in result.values())
 
-    return result
+    return await cached_response(request, analytics_key("analytics", versions, request), compute, cacheable=complete)
 
 # ==========================
-# Portfolio Monthly Values
+# Daily NAV Series
 # ==========================
-'''This endpoint calculates the monthly portfolio values based on historical transactions and prices.
-It uses the calculate_monthly_portfolio_value function to compute the values.
-The CSV file should contain the historical transactions with columns like date, ticker, action, shares, price, amount, and notes.
-The response includes the start date, end date, and monthly portfolio values.'''
-@router.get("/value-over-time/{portfolio_id}")
-def value_over_time(portfolio_id: int, target_return: float = Query(0.08, description="Target return for optimization"),
-                    request: Request = None, db: Session = Depends(get_db)):
+'''This endpoint returns the portfolio's stored daily NAV series: holdings valued at each business
+day's close, the day's net flow, daily return and time-weighted return index, and drawdown.
+The series is extended to the last complete trading day (or rebuilt from the earliest changed
+transaction) before it is read.'''
+@router.get("/nav/{portfolio_id}")
+async def portfolio_nav(portfolio_id: int, request: Request,
+                        start: date = Query(None, description="First day, e.g. 2023-01-01"),
+                        end: date = Query(None, description="Last day, e.g. 2023-12-31"),
+                        db: Session = Depends(get_read_db)):
     user_id = request.headers.get("X-User-Id")
     if not user_id:
         raise HTTPException(status_code=401, detail="Missing X-User-Id header")
 
-    portfolio = db.query(Portfolio).filter(Portfolio.id == portfolio_id).first()
-    if not portfolio or portfolio.user_id != user_id:
-        raise HTTPException(status_code=404, detail="Portfolio not found or not authorized")
-
-    transactions = db.query(Transaction).filter(Transaction.portfolio_id == portfolio_id).all()
-    if not transactions:
-        raise HTTPException(status_code=400, detail="No transactions found for this portfolio")
-
-    result = compute_value_over_time(transactions, target_return)
+    versions = await run_in_threadpool(owned_portfolio_versions, db, user_id, [portfolio_id])
 
-    if "error" in result:
-        raise HTTPException(status_code=400, detail=result["error"])
+    async def compute():
+        nav = (await run_in_threadpool(load_nav_states, [portfolio_id]))[portfolio_id]
+        rows = await run_in_threadpool(get_nav_series, db, portfolio_id, start, end)
+        return {
+            "portfolio_id": portfolio_id,
+            **nav_statistics(nav),
+            "series": [row._asdict() for row in rows]
+        }
 
-    return result
\ No newline at end of file
+    return await cached_response(request, analytics_key("nav", versions, request), compute)
@@ -1,54 +1,96 @@
-from fastapi import APIRouter, HTTPException, Depends, Request
+import base64
+import json
+from datetime import date, datetime, time, timedelta
+from fastapi import APIRouter, HTTPException, Depends, Request, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from app.models import Transaction
-from app.database import SessionLocal
+from app.models import Portfolio, Transaction
+from app.database import get_db, get_read_db, ReadSessionLocal
+from app.crud.transaction import list_transactions
+from app.crud.portfolio import bump_portfolio_version
+from app.crud.nav import invalidate_nav
+from app.crud.position import ensure_positions, apply_transaction, revert_transaction
 import pandas as pd
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Page size bounds for the transaction listing, and rows fetched per round trip when streaming
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 1000
 
 # ==========================
-# Debug: Get All Transactions for a Portfolio
+# List Transactions
 # ==========================
-@router.get("/debug/transactions/{portfolio_id}")
-def debug_transactions(portfolio_id: int, db: Session = Depends(get_db)):
-    transactions = db.query(Transaction).filter(Transaction.portfolio_id == portfolio_id).all()
-    return [{
-        "id": t.id,
-        "portfolio_id": t.portfolio_id,
-        "date": t.date,
-        "ticker": t.ticker,
-        "action": t.action,
-        "shares": t.shares,
-        "price": t.price,
-        "amount": t.amount,
-        "notes": t.notes
-    } for t in transactions]
+'''Lists the user's transactions in (portfolio_id, date, id) order, undated rows last in each
+portfolio, optionally narrowed to one portfolio, one ticker and a date range (start and end inclusive).
+Pages are keyset-paginated: pass the previous page's next_cursor as cursor.
+With stream=true every matching row after the cursor is streamed as NDJSON from a server-side
+cursor, so memory use does not grow with the number of rows.'''
+@router.get("/transactions")
+def list_user_transactions(request: Request,
+                           portfolio_id: int = Query(None),
+                           ticker: str = Query(None),
+                           start: date = Query(None, description="First trade date, e.g. 2023-01-01"),
+                           end: date = Query(None, description="Last trade date, e.g. 2023-12-31"),
+                           limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+                           cursor: str = Query(None),
+                           stream: bool = Query(False),
+                           db: Session = Depends(get_read_db)):
+    user_id = request.headers.get("X-User-Id")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Missing X-User-Id header")
 
-# ==========================
-# Debug: Get All Transactions (Across All Portfolios)
-# ==========================
-@router.get("/debug/transactions")
-def debug_all_transactions(db: Session = Depends(get_db)):
-    transactions = db.query(Transaction).all()
-    return [{
-        "id": t.id,
-        "portfolio_id": t.portfolio_id,
-        "date": t.date,
-        "ticker": t.ticker,
-        "action": t.action,
-        "shares": t.shares,
-        "price": t.price,
-        "amount": t.amount,
-        "notes": t.notes
-    } for t in transactions]
+    if portfolio_id is not None:
+        portfolio = db.query(Portfolio.user_id).filter(Portfolio.id == portfolio_id).first()
+        if not portfolio or portfolio.user_id != user_id:
+            raise HTTPException(status_code=404, detail="Portfolio not found or not authorized")
+        portfolio_ids = [portfolio_id]
+    else:
+        portfolio_ids = select(Portfolio.id).where(Portfolio.user_id == user_id)
+
+    filters = {
+        "ticker": ticker,
+        "start": datetime.combine(start, time.min) if start else None,
+        "end": datetime.combine(end + timedelta(days=1), time.min) if end else None,
+        "after": decode_cursor(cursor) if cursor else None
+    }
+
+    if stream:
+        return StreamingResponse(stream_transactions(portfolio_ids, filters), media_type="application/x-ndjson")
+
+    rows = list_transactions(db, portfolio_ids, **filters).limit(limit + 1).all()
+    page = rows[:limit]
+    return {
+        "transactions": [transaction_row(row) for row in page],
+        "next_cursor": encode_cursor(page[-1]) if len(rows) > limit else None
+    }
+
+def transaction_row(row):
+    values = row._asdict()
+    values["date"] = values["date"].isoformat() if values["date"] else None
+    return values
+
+def encode_cursor(row):
+    key = [row.portfolio_id, row.date.isoformat() if row.date else None, row.id]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        portfolio_id, day, transaction_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return int(portfolio_id), datetime.fromisoformat(day) if day is not None else None, int(transaction_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def stream_transactions(portfolio_ids, filters):
+    # Own session: the request's session is closed before a streamed body is sent
+    db = ReadSessionLocal()
+    try:
+        for row in list_transactions(db, portfolio_ids, **filters).yield_per(STREAM_BATCH_SIZE):
+            yield json.dumps(transaction_row(row)) + "\n"
+    finally:
+        db.close()
 
 # ==========================
 # Delete a Transaction
@@ -66,7 +108,13 @@ def delete_transaction(transaction_id: int, request: Request, db: Session = Depe
     if transaction.portfolio.user_id != user_id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this transaction")
 
+    ensure_positions(db, transaction.portfolio_id)
     db.delete(transaction)
+    db.flush()
+    revert_transaction(db, transaction.portfolio_id, transaction.ticker, transaction.action,
+                       transaction.shares, transaction.amount, transaction.date)
+    bump_portfolio_version(db, transaction.portfolio_id)
+    invalidate_nav(db, transaction.portfolio_id, transaction.date)
     db.commit()
     return {"message": f"Transaction {transaction_id} deleted successfully"}
 
@@ -95,7 +143,11 @@ def update_transaction(transaction_id: int, req: TransactionUpdateRequest, reque
     if transaction.portfolio.user_id != user_id:
         raise HTTPException(status_code=403, detail="Not authorized to update this transaction")
 
-    transaction.date = pd.to_datetime(req.date)
+    ensure_positions(db, transaction.portfolio_id)
+    previous = (transaction.portfolio_id, transaction.ticker, transaction.action,
+                transaction.shares, transaction.amount, transaction.date)
+
+    transaction.date = pd.to_datetime(req.date).to_pydatetime()
     transaction.ticker = req.ticker
     transaction.action = req.action
     transaction.shares = req.shares
@@ -103,6 +155,13 @@ def update_transaction(transaction_id: int, req: TransactionUpdateRequest, reque
     transaction.amount = req.amount
     transaction.notes = req.notes
 
+    db.flush()
+    revert_transaction(db, *previous)
+    apply_transaction(db, transaction)
+    bump_portfolio_version(db, transaction.portfolio_id)
+    # Undated rows have no place in the series: rebuild it from the start (see invalidate_nav)
+    dates = (previous[-1], transaction.date)
+    invalidate_nav(db, transaction.portfolio_id, None if None in dates else min(dates))
     db.commit()
     db.refresh(transaction)
 
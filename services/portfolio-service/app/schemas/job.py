@@ -0,0 +1,27 @@
+from typing import Annotated, Dict, Literal, Optional
+from pydantic import BaseModel, Field
+
+class OptimizeJobParams(BaseModel):
+    target_return: float = 0.20
+    max_weight: Optional[float] = Field(None, gt=0, le=1)
+    weight_caps: Optional[Dict[str, Annotated[float, Field(ge=0, le=1)]]] = None  # {ticker: cap}
+    covariance: Optional[Literal["sample", "ledoit_wolf", "factor"]] = None
+
+class DcaSimulationJobParams(BaseModel):
+    initial_investment: float = 10000
+    monthly_contribution: float = 500
+    years: int = Field(10, ge=1)
+    target_return: float = 0.10
+    mode: Literal["deterministic", "monte_carlo"] = "deterministic"
+    paths: int = Field(10000, ge=100, le=100000)
+    method: Literal["bootstrap", "parametric"] = "bootstrap"
+    block_size: int = Field(12, ge=1, le=120)
+    seed: Optional[int] = None
+
+# Same parameters, with the same defaults and bounds, as the synchronous routes
+JOB_PARAMS = {"optimize": OptimizeJobParams, "dca-simulation": DcaSimulationJobParams}
+
+class JobSubmitRequest(BaseModel):
+    kind: Literal["optimize", "dca-simulation"]
+    portfolio_id: int
+    params: dict = {}
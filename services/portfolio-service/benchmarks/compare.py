@@ -0,0 +1,48 @@
+"""
+Compare two benchmark result files and flag slowdowns.
+
+    python -m benchmarks.compare benchmarks/results/<old>.json benchmarks/results/<new>.json --threshold 1.2
+
+Exits with status 1 if any case common to both files got slower than the threshold ratio.
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(old, new, metric="warm_median"):
+    """Rows of (size, case, old seconds, new seconds, ratio) for cases present in both reports."""
+    rows = []
+    for size, run in new["sizes"].items():
+        previous = old["sizes"].get(size, {}).get("results", {})
+        for case, timings in run["results"].items():
+            if case in previous and previous[case].get(metric) and timings.get(metric) is not None:
+                rows.append((size, case, previous[case][metric], timings[metric], timings[metric] / previous[case][metric]))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--metric", default="warm_median", choices=["cold", "warm_min", "warm_median"])
+    parser.add_argument("--threshold", type=float, default=1.2, help="Slowdown ratio reported as a regression")
+    args = parser.parse_args(argv)
+
+    old, new = load(args.old), load(args.new)
+    print(f"{old['commit']} -> {new['commit']} ({args.metric})")
+    regressions = 0
+    for size, case, before, after, ratio in compare(old, new, args.metric):
+        flag = "REGRESSION" if ratio > args.threshold else ""
+        regressions += bool(flag)
+        print(f"{size:>12} {case:<28} {before:>9.4f}s -> {after:>9.4f}s  x{ratio:5.2f} {flag}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""
+Benchmarks for the portfolio-service logic layer, on synthetic portfolios and offline prices.
+
+    python -m benchmarks.run                      # default sizes
+    python -m benchmarks.run --sizes 1000x10 1000000x500 --repeat 5
+    python -m benchmarks.compare old.json new.json
+
+Run from services/portfolio-service. Each case is timed once cold (empty price store and return
+statistics cache) and then --repeat times warm. Results are written as JSON, by default to
+benchmarks/results/<commit>.json.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from io import BytesIO
+
+DEFAULT_SIZES = ["10x1", "1000x10", "10000x50", "100000x100"]
+FULL_SIZES = DEFAULT_SIZES + ["1000000x500"]
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def configure_environment(workdir):
+    """Point the price layer at offline fixtures before anything under app/ is imported."""
+    os.environ["PRICE_PROVIDER"] = "fixture"
+    os.environ["PRICE_FIXTURE_DIR"] = os.path.join(workdir, "fixtures")
+    os.environ["PRICE_STORE_DIR"] = os.path.join(workdir, "store")
+    os.environ["ANALYTICS_WORKERS"] = "0"
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def parse_size(size):
+    transactions, tickers = size.lower().split("x")
+    return int(transactions), int(tickers)
+
+
+def reset_caches():
+    """Empty the on-disk price store and the in-process return statistics cache."""
+    from app.logic.price_provider import get_price_provider
+    from app.logic.return_stats import get_return_stats_cache
+
+    store = get_price_provider()
+    shutil.rmtree(store.root, ignore_errors=True)
+    os.makedirs(store.root)
+    cache = get_return_stats_cache()
+    cache.series.clear()
+    cache.covariances.clear()
+    cache.models.clear()
+
+
+def time_case(fn, repeat):
+    """Seconds for one cold call and `repeat` warm calls."""
+    reset_caches()
+    start = time.perf_counter()
+    fn()
+    cold = time.perf_counter() - start
+
+    warm = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        warm.append(time.perf_counter() - start)
+    return {
+        "cold": round(cold, 6),
+        "warm_min": round(min(warm), 6) if warm else None,
+        "warm_median": round(statistics.median(warm), 6) if warm else None,
+        "repeat": repeat,
+    }
+
+
+def csv_upload(data):
+    """The upload route's import path into a fresh in-memory SQLite database."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from app.logic.csv_import import open_transaction_csv, import_transactions
+    from app.models import Base, Portfolio, User
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        db.add(User(id="benchmark", email="benchmark@example.com"))
+        portfolio = Portfolio(user_id="benchmark", name="Benchmark")
+        db.add(portfolio)
+        db.flush()
+        summary = import_transactions(db, portfolio.id, open_transaction_csv(BytesIO(data)))
+        db.commit()
+        return summary
+    finally:
+        db.close()
+        engine.dispose()
+
+
+def run_size(size, repeat, cases):
+    from benchmarks import synthetic
+    from app.logic.metrics import compute_portfolio_metrics
+    from app.logic.optimize import optimize_portfolio
+    from app.logic.portfolio_value import compute_value_over_time
+    from app.logic.simulate_dca import simulate_dca_projection
+
+    count, ticker_count = parse_size(size)
+    tickers = synthetic.ticker_names(ticker_count)
+    frame = synthetic.synthetic_transactions(count, tickers, seed=count + ticker_count)
+    records = synthetic.ledger(frame)
+    holdings = synthetic.holdings(frame)
+
+    benchmarks = {
+        "compute_portfolio_metrics": lambda: compute_portfolio_metrics(records, holdings),
+        "optimize_portfolio": lambda: optimize_portfolio(holdings, 0.08),
+        "compute_value_over_time": lambda: compute_value_over_time(records, 0.08),
+        "simulate_dca_projection": lambda: simulate_dca_projection(10000, 500, 30, 7.5, 9.0),
+        "csv_upload": lambda data=synthetic.transaction_csv(frame): csv_upload(data),
+    }
+
+    results = {}
+    for name, fn in benchmarks.items():
+        if cases and name not in cases:
+            continue
+        results[name] = time_case(fn, repeat)
+        print(f"{size:>12} {name:<28} cold {results[name]['cold']:>9.4f}s  warm {results[name]['warm_median'] or 0:>9.4f}s",
+              file=sys.stderr)
+    return {"transactions": count, "tickers": ticker_count, "results": results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", default=None, help="TRANSACTIONSxTICKERS, e.g. 1000x10")
+    parser.add_argument("--full", action="store_true", help=f"Run {' '.join(FULL_SIZES)}")
+    parser.add_argument("--cases", nargs="+", default=None, help="Only run these benchmarks")
+    parser.add_argument("--repeat", type=int, default=3, help="Warm runs per case")
+    parser.add_argument("--output", default=None, help="Result file (default benchmarks/results/<commit>.json)")
+    args = parser.parse_args(argv)
+    sizes = args.sizes or (FULL_SIZES if args.full else DEFAULT_SIZES)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        configure_environment(workdir)
+        from benchmarks.synthetic import synthetic_prices, ticker_names
+        from app.logic.price_provider import FixtureProvider
+
+        FixtureProvider.write(os.environ["PRICE_FIXTURE_DIR"], synthetic_prices(ticker_names(max(parse_size(s)[1] for s in sizes))))
+        runs = {size: run_size(size, args.repeat, args.cases) for size in sizes}
+
+    import numpy, pandas, scipy
+    report = {
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "versions": {"numpy": numpy.__version__, "pandas": pandas.__version__, "scipy": scipy.__version__},
+        "sizes": runs,
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
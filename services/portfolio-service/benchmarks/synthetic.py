@@ -0,0 +1,80 @@
+"""Deterministic synthetic prices and portfolios for the benchmarks."""
+import numpy as np
+import pandas as pd
+
+from app.logic.ledger import Ledger
+from app.logic.positions import Holding, summarize_positions
+
+PRICE_START = "2015-01-01"
+
+
+def ticker_names(count):
+    return [f"SYN{i:03d}" for i in range(count)]
+
+
+def synthetic_prices(tickers, start=PRICE_START, end=None, seed=0):
+    """Geometric random walk closes on business days, one column per ticker, some listed late."""
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range(start, end or pd.Timestamp.today().normalize())
+    drift = rng.uniform(-0.0002, 0.0008, len(tickers))
+    volatility = rng.uniform(0.008, 0.03, len(tickers))
+    steps = rng.standard_normal((len(index), len(tickers))) * volatility + drift
+    prices = pd.DataFrame(np.exp(np.cumsum(steps, axis=0)) * rng.uniform(10, 500, len(tickers)),
+                          index=index, columns=tickers)
+
+    # A tenth of the tickers only start trading part-way through, as newer listings do
+    late = rng.choice(len(tickers), size=len(tickers) // 10, replace=False)
+    for column, listed in zip(late, rng.integers(0, len(index) // 2, len(late))):
+        prices.iloc[:listed, column] = np.nan
+    return prices
+
+
+def synthetic_transactions(count, tickers, start="2019-01-01", end=None, seed=0):
+    """
+    count transactions over tickers as a DataFrame with the upload CSV columns, roughly 80% buys.
+    Sells are smaller than buys on average and never exceed the shares bought so far, so holdings stay long.
+    """
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp(start)
+    end = pd.Timestamp(end) if end else pd.Timestamp.today().normalize() - pd.Timedelta(days=1)
+    dates = np.sort(start + pd.to_timedelta(rng.integers(0, (end - start).days + 1, count), unit="D"))
+    ticker_index = rng.integers(0, len(tickers), count)
+    ticker_index[:len(tickers)] = np.arange(min(count, len(tickers)))  # every ticker is bought at least once
+    shares = rng.integers(1, 100, count).astype(float)
+    sell = rng.random(count) < 0.2
+    sell[:len(tickers)] = False
+
+    bought = pd.Series(np.where(sell, 0.0, shares)).groupby(ticker_index).cumsum().to_numpy()
+    shares = np.where(sell, np.minimum(np.ceil(shares / 2), bought), shares)
+    sell &= shares > 0
+    shares[shares == 0] = 1
+
+    price = np.round(rng.uniform(10, 500, count), 2)
+    return pd.DataFrame({
+        "date": dates,
+        "ticker": np.asarray(tickers, dtype=object)[ticker_index],
+        "action": np.where(sell, "sell", "buy"),
+        "shares": shares,
+        "price": price,
+        "amount": np.round(shares * price, 2),
+        "notes": "",
+    })
+
+
+def ledger(transactions):
+    """The Ledger load_ledgers hands to the logic layer."""
+    return Ledger.from_frame(transactions)
+
+
+def holdings(transactions):
+    """Holding tuples as maintained in the positions table."""
+    summary = summarize_positions(transactions)
+    return [
+        Holding(ticker, row.net_shares, row.cost_basis, row.first_trade_date.to_pydatetime(), row.last_trade_date.to_pydatetime())
+        for ticker, row in summary.iterrows()
+    ]
+
+
+def transaction_csv(transactions):
+    """The transactions as upload CSV bytes."""
+    return transactions.assign(date=transactions["date"].dt.strftime("%Y-%m-%d")).to_csv(index=False).encode()
@@ -0,0 +1,23 @@
+import os
+import tempfile
+
+# The suite runs offline and in-process: SQLite, fixture prices and no analytics worker pool.
+# Must be set before anything under app/ is imported.
+_workdir = tempfile.mkdtemp(prefix="portfolio-tests-")
+os.environ.setdefault("DATABASE_URL", "sqlite:///./test.db")
+os.environ.setdefault("PRICE_PROVIDER", "fixture")
+os.environ.setdefault("PRICE_FIXTURE_DIR", os.path.join(_workdir, "fixtures"))
+os.environ.setdefault("PRICE_STORE_DIR", os.path.join(_workdir, "prices"))
+os.environ.setdefault("ANALYTICS_WORKERS", "0")
+
+# test_api.py numbers portfolios and transactions from 1, so start from an empty database
+if os.path.exists("test.db"):
+    os.remove("test.db")
+
+import numpy as np
+import pandas as pd
+from app.logic.price_provider import FixtureProvider
+
+_dates = pd.bdate_range("2019-01-01", pd.Timestamp.today().normalize())
+_walk = np.exp(np.cumsum(np.random.default_rng(42).normal(0.0004, 0.015, (len(_dates), 3)), axis=0)) * 100
+FixtureProvider.write(os.environ["PRICE_FIXTURE_DIR"], pd.DataFrame(_walk, index=_dates, columns=["AAPL", "GOOGL", "MSFT"]))
@@ -1,10 +1,19 @@
+import asyncio
+import datetime
+import json
+import numpy as np
+import pandas as pd
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect
 from sqlalchemy.orm import sessionmaker
 from app.main import app
-from app.models import Base
-from app.database import get_db
+from app.models import Base, Job, Portfolio, PortfolioNav, PortfolioNavSummary, SuggestedAllocation, Transaction, User
+from app.crud import nav as nav_crud
+from app.crud.job import claim_next_job
+from app import executor
+from app.database import add_column, create_indexes, get_db, get_read_db
+from app.jobs import run_next_job
 
 # Use SQLite for testing instead of PostgreSQL
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -21,6 +30,7 @@ def override_get_db():
         db.close()
 
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
 
 # Create all tables before testing
 Base.metadata.create_all(bind=engine)
@@ -52,6 +62,9 @@ def test_portfolio_metrics():
     assert response.status_code == 200
     assert "metrics" in response.json()
 
+    cached = client.get("/portfolio/metrics/1", headers={**headers, "If-None-Match": response.headers["ETag"]})
+    assert cached.status_code == 304
+
 # ===========================
 # TEST 3: Update Portfolio Name
 # ===========================
@@ -76,10 +89,19 @@ def test_update_transaction():
         "amount": 3100,
         "notes": "Updated note"
     }
+    etag = client.get("/portfolio/metrics/1", headers=headers).headers["ETag"]
     response = client.put("/portfolio/transaction/1", json=data, headers=headers)
     assert response.status_code == 200
     assert response.json()["message"] == "Transaction 1 updated"
 
+    positions = client.get("/portfolio/positions/1", headers=headers).json()["positions"]
+    assert {p["ticker"]: p["net_shares"] for p in positions} == {"AAPL": 18, "GOOGL": 5}
+
+    # The portfolio version changed, so cached metrics are recomputed
+    response = client.get("/portfolio/metrics/1", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
 # ===========================
 # TEST 5: Delete Transaction
 # ===========================
@@ -93,7 +115,355 @@ def test_delete_transaction():
 # TEST 6: Delete Portfolio
 # ===========================
 def test_delete_portfolio():
+    db = TestingSessionLocal()
+    for row in (PortfolioNav(portfolio_id=1, date=pd.Timestamp("2023-01-03").date(), market_value=1500.0),
+                PortfolioNavSummary(portfolio_id=1, version=0),
+                SuggestedAllocation(portfolio_id=1, as_of=pd.Timestamp("2023-01-03").date(), target_return=0.1),
+                Job(id="job-of-portfolio-1", user_id="user-1234", portfolio_id=1, kind="optimize")):
+        db.merge(row)
+    db.commit()
+
     headers = {"X-User-Id": "user-1234"}
     response = client.delete("/portfolio/portfolio/1", headers=headers)
     assert response.status_code == 200
     assert "deleted" in response.json()["message"]
+
+    # SQLite does not enforce ON DELETE CASCADE: the dependent rows go with the portfolio through the ORM
+    for model in (PortfolioNav, PortfolioNavSummary, SuggestedAllocation, Job):
+        assert db.query(model).filter(model.portfolio_id == 1).count() == 0
+    db.close()
+
+# ===========================
+# TEST 7: CSV Upload Reports Invalid Rows
+# ===========================
+def test_upload_csv_reports_row_errors():
+    csv_content = """date,ticker,action,shares,price,amount,notes
+2023-01-01,AAPL,buy,10,150,1500,Initial investment
+not-a-date,AAPL,hold,10,150,1500,Bad row
+"""
+    files = {"file": ("test.csv", csv_content)}
+    headers = {"X-User-Id": "user-1234"}
+
+    response = client.post("/portfolio/upload", files=files, headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["rows_imported"] == 1
+    assert body["rows_failed"] == 1
+    assert body["errors"][0]["row"] == 3
+
+# ===========================
+# TEST 8: Keyset-Paginated and Streamed Transaction Listing
+# ===========================
+def test_list_transactions():
+    csv_content = """date,ticker,action,shares,price,amount,notes
+2023-03-01,AAPL,buy,1,150,150,c
+2023-01-01,AAPL,buy,1,150,150,a
+2023-02-01,MSFT,buy,1,250,250,b
+"""
+    headers = {"X-User-Id": "user-5678"}
+    client.post("/portfolio/upload", files={"file": ("test.csv", csv_content)}, headers=headers)
+
+    first = client.get("/portfolio/transactions?limit=2", headers=headers).json()
+    second = client.get(f"/portfolio/transactions?limit=2&cursor={first['next_cursor']}", headers=headers).json()
+    assert [t["notes"] for t in first["transactions"] + second["transactions"]] == ["a", "b", "c"]
+    assert second["next_cursor"] is None
+
+    response = client.get("/portfolio/transactions?stream=true&ticker=AAPL&end=2023-02-28", headers=headers)
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line)["notes"] for line in response.text.splitlines()] == ["a"]
+
+# ===========================
+# TEST 9: Background Jobs
+# ===========================
+def test_background_job():
+    headers = {"X-User-Id": "user-5678"}
+    portfolio_id = client.get("/portfolio/portfolios", headers=headers).json()["portfolios"][0]["id"]
+    submit = {"kind": "optimize", "portfolio_id": portfolio_id, "params": {"target_return": 0.1}}
+
+    response = client.post("/portfolio/jobs", json=submit, headers=headers)
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    assert response.json()["status"] == "pending"
+    # An identical submission joins the queued job
+    assert client.post("/portfolio/jobs", json=submit, headers=headers).json()["job_id"] == job_id
+
+    assert asyncio.run(run_next_job())
+    job = client.get(f"/portfolio/jobs/{job_id}", headers=headers).json()
+    assert job["status"] == "succeeded"
+    assert job["result"]["portfolio_id"] == portfolio_id
+
+    assert client.get(f"/portfolio/jobs/{job_id}", headers={"X-User-Id": "user-1234"}).status_code == 404
+    bad = {"kind": "dca-simulation", "portfolio_id": portfolio_id, "params": {"paths": 1}}
+    assert client.post("/portfolio/jobs", json=bad, headers=headers).status_code == 422
+    bad["params"] = {"years": 0}
+    assert client.post("/portfolio/jobs", json=bad, headers=headers).status_code == 422
+    assert client.get(f"/portfolio/dca-simulation/{portfolio_id}?mode=monte_carlo&years=0", headers=headers).status_code == 422
+
+# ===========================
+# TEST 10: Market Events
+# ===========================
+def test_market_events():
+    response = client.get("/market/events?start_date=2022-01-01&end_date=2022-12-31")
+    assert response.status_code == 200
+    assert [e["date"] for e in response.json()["events"]] == ["2022-02-24", "2022-06-15"]
+
+    limited = client.get("/market/events?limit=2").json()
+    assert len(limited["events"]) == 2 and limited["truncated"]
+
+    headers = {"X-User-Id": "user-5678"}
+    portfolio_id = client.get("/portfolio/portfolios", headers=headers).json()["portfolios"][0]["id"]
+    body = client.get(f"/portfolio/value-over-time/{portfolio_id}?include_events=true", headers=headers).json()
+    assert all(body["start_date"] <= e["date"] <= body["end_date"] for e in body["events"])
+
+    response = client.get(f"/portfolio/value-over-time/{portfolio_id}?frequency=yearly", headers=headers)
+    assert response.status_code == 422
+
+# ===========================
+# TEST 11: Combined Analytics
+# ===========================
+def test_portfolio_analytics():
+    headers = {"X-User-Id": "user-5678"}
+    portfolio_id = client.get("/portfolio/portfolios", headers=headers).json()["portfolios"][0]["id"]
+
+    response = client.get(f"/portfolio/analytics/{portfolio_id}?sections=positions,metrics", headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert set(body) == {"portfolio_id", "positions", "metrics"}
+    assert {p["ticker"] for p in body["positions"]} >= {"AAPL"}
+
+    response = client.get(f"/portfolio/analytics/{portfolio_id}?sections=metrics,bogus", headers=headers)
+    assert response.status_code == 400
+
+    response = client.get(f"/portfolio/analytics/{portfolio_id}?sections=value_over_time&frequency=yearly", headers=headers)
+    assert response.status_code == 422
+
+# ===========================
+# TEST 12: NAV summaries: a portfolio without transactions is stored once, a lost race is redone
+# ===========================
+def test_refresh_nav_summaries(monkeypatch):
+    db = TestingSessionLocal()
+    db.add(User(id="user-nav"))
+    db.flush()
+    empty, other = Portfolio(user_id="user-nav"), Portfolio(user_id="user-nav")
+    db.add_all([empty, other])
+    db.commit()
+
+    loads = []
+    load_ledger = nav_crud.load_ledger
+
+    def counting_load(session, portfolio_id):
+        loads.append(portfolio_id)
+        if portfolio_id == other.id and len(loads) == 2:
+            # A concurrent refresh commits a summary first, built from an older version
+            with TestingSessionLocal() as rival:
+                rival.add(PortfolioNavSummary(portfolio_id=portfolio_id, version=-1))
+                rival.commit()
+        return load_ledger(session, portfolio_id)
+
+    monkeypatch.setattr(nav_crud, "load_ledger", counting_load)
+    assert nav_crud.refresh_nav(db, empty.id).start_date is None
+    nav_crud.refresh_nav(db, empty.id)
+    assert loads == [empty.id]
+
+    summary = nav_crud.refresh_nav(db, other.id)
+    assert summary is not None and summary.version == other.version
+    assert loads == [empty.id, other.id, other.id]
+    db.close()
+
+# ===========================
+# TEST 13: Keyset pages cover transactions without a date
+# ===========================
+def test_list_transactions_with_undated_rows():
+    db = TestingSessionLocal()
+    db.add(User(id="user-undated"))
+    db.flush()
+    first, second = Portfolio(user_id="user-undated"), Portfolio(user_id="user-undated")
+    db.add_all([first, second])
+    db.flush()
+    for portfolio, day, notes in [(first, None, "first-undated"), (first, "2023-01-02", "first-dated"),
+                                  (first, None, "first-undated-2"), (second, "2023-01-01", "second-dated"),
+                                  (second, None, "second-undated")]:
+        db.add(Transaction(portfolio_id=portfolio.id, date=day and pd.Timestamp(day).to_pydatetime(), ticker="AAPL",
+                           action="buy", shares=1, price=100, amount=100, notes=notes))
+    db.commit()
+    db.close()
+
+    headers = {"X-User-Id": "user-undated"}
+    seen, cursor = [], None
+    while True:
+        page = client.get("/portfolio/transactions?limit=1" + (f"&cursor={cursor}" if cursor else ""), headers=headers).json()
+        seen += [t["notes"] for t in page["transactions"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == ["first-dated", "first-undated", "first-undated-2", "second-dated", "second-undated"]
+
+# ===========================
+# TEST 14: A ticker whose only transaction is undated still gets a position and analytics
+# ===========================
+def test_undated_transaction_analytics():
+    db = TestingSessionLocal()
+    db.add(User(id="user-legacy"))
+    db.flush()
+    portfolio = Portfolio(user_id="user-legacy")
+    db.add(portfolio)
+    db.flush()
+    db.add_all([
+        Transaction(portfolio_id=portfolio.id, date=pd.Timestamp("2023-01-03").to_pydatetime(), ticker="AAPL",
+                    action="buy", shares=10, price=150, amount=1500, notes="dated"),
+        Transaction(portfolio_id=portfolio.id, date=None, ticker="MSFT", action="buy", shares=5, price=250, amount=1250,
+                    notes="legacy"),
+    ])
+    db.commit()
+    portfolio_id = portfolio.id
+    db.close()
+
+    headers = {"X-User-Id": "user-legacy"}
+    positions = client.get(f"/portfolio/positions/{portfolio_id}", headers=headers)
+    assert positions.status_code == 200
+    msft = next(p for p in positions.json()["positions"] if p["ticker"] == "MSFT")
+    assert msft["net_shares"] == 5 and msft["first_trade_date"] is None
+
+    metrics = client.get(f"/portfolio/metrics/{portfolio_id}", headers=headers)
+    assert metrics.status_code == 200 and metrics.json()["metrics"]["net_shares"] == {"AAPL": 10, "MSFT": 5}
+    assert client.get(f"/portfolio/optimize/{portfolio_id}?target_return=0.1", headers=headers).status_code == 200
+
+# ===========================
+# TEST 15: Editing and deleting undated transactions rebuilds the NAV series
+# ===========================
+def test_edit_undated_transaction():
+    headers = {"X-User-Id": "user-legacy"}
+    portfolio_id = client.get("/portfolio/portfolios", headers=headers).json()["portfolios"][0]["id"]
+    db = TestingSessionLocal()
+    legacy = db.query(Transaction).filter(Transaction.portfolio_id == portfolio_id, Transaction.date.is_(None)).one()
+    db.add(Transaction(portfolio_id=portfolio_id, date=None, ticker="AAPL", action="buy", shares=1, price=150, amount=150))
+    db.commit()
+    nav_crud.refresh_nav(db, portfolio_id)
+    undated = db.query(Transaction.id).filter(Transaction.portfolio_id == portfolio_id, Transaction.date.is_(None),
+                                              Transaction.ticker == "AAPL").scalar()
+
+    update = {"date": "2023-02-01", "ticker": "MSFT", "action": "buy", "shares": 5, "price": 250, "amount": 1250, "notes": "dated now"}
+    assert client.put(f"/portfolio/transaction/{legacy.id}", json=update, headers=headers).status_code == 200
+    assert db.get(PortfolioNavSummary, portfolio_id) is None
+    nav_crud.refresh_nav(db, portfolio_id)
+
+    assert client.delete(f"/portfolio/transaction/{undated}", headers=headers).status_code == 200
+    db.expire_all()
+    assert db.get(PortfolioNavSummary, portfolio_id) is None
+    summary = nav_crud.refresh_nav(db, portfolio_id)
+    assert summary.start_date == pd.Timestamp("2023-01-03").date()
+    db.close()
+
+# ===========================
+# TEST 16: A job that keeps losing its worker is marked failed after JOB_MAX_ATTEMPTS runs
+# ===========================
+def test_job_max_attempts():
+    headers = {"X-User-Id": "user-5678"}
+    portfolio_id = client.get("/portfolio/portfolios", headers=headers).json()["portfolios"][0]["id"]
+    db = TestingSessionLocal()
+    lost = datetime.datetime.utcnow() - datetime.timedelta(hours=1)
+    for job_id, attempts in [("job-retry", 2), ("job-abandoned", 3)]:
+        db.add(Job(id=job_id, user_id="user-5678", portfolio_id=portfolio_id, kind="optimize", params="{}",
+                   dedupe_key=job_id, status="running", attempts=attempts, started_at=lost))
+    db.commit()
+
+    claimed = []
+    while (job := claim_next_job(db, stale_after=60, max_attempts=3, ttl=60)) is not None:
+        claimed.append(job.id)
+    assert "job-retry" in claimed and "job-abandoned" not in claimed
+
+    db.expire_all()
+    retry, abandoned = db.get(Job, "job-retry"), db.get(Job, "job-abandoned")
+    assert retry.status == "running" and retry.attempts == 3
+    assert abandoned.status == "failed" and abandoned.attempts == 3 and abandoned.expires_at is not None
+    # Lost a third time: no fourth run
+    claim_next_job(db, stale_after=-1, max_attempts=3, ttl=60)
+    db.expire_all()
+    assert db.get(Job, "job-retry").status == "failed"
+    db.close()
+
+# ===========================
+# TEST 17: Efficient frontier targets, ranges and their errors; points match single /optimize solves
+# ===========================
+def test_efficient_frontier():
+    headers = {"X-User-Id": "user-5678"}
+    portfolio_id = client.get("/portfolio/portfolios", headers=headers).json()["portfolios"][0]["id"]
+    url = f"/portfolio/optimize/{portfolio_id}/frontier"
+
+    body = client.get(f"{url}?targets=0.12, 0.01,0.1,5", headers=headers).json()
+    frontier = body["frontier"]
+    assert [p["target_return"] for p in frontier] == [0.01, 0.1, 0.12, 5.0]
+    assert [p["feasible"] for p in frontier] == [False, True, True, False]
+    for point in frontier[1:3]:
+        single = client.get(f"/portfolio/optimize/{portfolio_id}?target_return={point['target_return']}", headers=headers).json()
+        assert point["allocation"] == single["optimization_result"]["optimized_allocation"]
+        assert point["expected_volatility"] == single["optimization_result"]["expected_volatility"]
+
+    ranged = client.get(f"{url}?start=0.06&stop=0.2&steps=8", headers=headers).json()["frontier"]
+    assert [p["target_return"] for p in ranged] == [round(t, 4) for t in np.linspace(0.06, 0.2, 8)]
+    default = client.get(url, headers=headers).json()
+    assert len(default["frontier"]) == 20 and all(p["feasible"] for p in default["frontier"])
+
+    for query, detail in [("targets=0.1,abc", "targets must be comma-separated numbers"),
+                          ("targets=" + ",".join(["0.1"] * 201), "At most 200 targets per request"),
+                          ("start=0.05", "Both start and stop are required for a range"),
+                          ("stop=0.2", "Both start and stop are required for a range")]:
+        response = client.get(f"{url}?{query}", headers=headers)
+        assert response.status_code == 400 and response.json()["detail"] == detail
+    assert client.get(f"{url}?start=0.05&stop=0.2&steps=1", headers=headers).status_code == 422
+    assert client.get(url).status_code == 401
+
+# ===========================
+# TEST 18: With the analytics pool full, analytics routes answer 503 with Retry-After and queued
+# jobs are put back without using up an attempt
+# ===========================
+def test_analytics_backpressure(monkeypatch):
+    headers = {"X-User-Id": "user-5678"}
+    portfolio_id = client.get("/portfolio/portfolios", headers=headers).json()["portfolios"][0]["id"]
+    monkeypatch.setattr(executor, "capacity", lambda: 0)
+
+    # A query not requested before, so the response cache cannot answer it
+    response = client.get(f"/portfolio/optimize/{portfolio_id}/frontier?targets=0.0777", headers=headers)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(executor.ANALYTICS_RETRY_AFTER)
+    assert executor._in_flight == 0
+
+    submit = {"kind": "optimize", "portfolio_id": portfolio_id, "params": {"target_return": 0.0777}}
+    job_id = client.post("/portfolio/jobs", json=submit, headers=headers).json()["job_id"]
+    while asyncio.run(run_next_job()):
+        pass
+    job = client.get(f"/portfolio/jobs/{job_id}", headers=headers).json()
+    assert job["status"] == "pending" and executor._in_flight == 0
+    db = TestingSessionLocal()
+    assert db.get(Job, job_id).attempts == 0
+    db.close()
+
+    monkeypatch.undo()
+    assert client.get(f"/portfolio/optimize/{portfolio_id}/frontier?targets=0.0777", headers=headers).status_code == 200
+    assert executor._in_flight == 0
+
+# ===========================
+# TEST 19: CSV dates are read in the one format the file uses; other dates are row errors
+# ===========================
+def test_upload_csv_date_format():
+    csv_content = """date,ticker,action,shares,price,amount,notes
+01/02/2023,AAPL,buy,1,150,150,a
+13/02/2023,AAPL,buy,1,150,150,b
+2023-02-14,AAPL,buy,1,150,150,c
+"""
+    headers = {"X-User-Id": "user-dayfirst"}
+    body = client.post("/portfolio/upload", files={"file": ("test.csv", csv_content)}, headers=headers).json()
+    assert body["rows_imported"] == 2 and body["errors"] == [{"row": 4, "error": "invalid date (expected DD/MM/YYYY)"}]
+
+    listed = client.get("/portfolio/transactions", headers=headers).json()["transactions"]
+    assert [t["date"][:10] for t in listed] == ["2023-02-01", "2023-02-13"]
+
+# ===========================
+# TEST 20: Startup migrations can run again, as when another worker got there first
+# ===========================
+def test_migrations_idempotent():
+    # SQLite has no ADD COLUMN IF NOT EXISTS: the duplicate-column error is what gets ignored
+    add_column(engine, "portfolios", "version", "INTEGER NOT NULL DEFAULT 0")
+    create_indexes(engine, Transaction.__table__)
+    assert "version" in {c["name"] for c in inspect(engine).get_columns("portfolios")}
+    assert "ix_transactions_portfolio_date_id" in {i["name"] for i in inspect(engine).get_indexes("transactions")}
@@ -0,0 +1,47 @@
+import numpy as np
+from app.logic.covariance import factor_model, ledoit_wolf, nearest_psd
+from app.logic.qp import return_range, solve_min_variance
+
+def factor_returns(rng, periods, n):
+    return rng.normal(0, 0.01, (periods, 3)) @ rng.normal(0, 1, (3, n)) + rng.normal(0, 0.01, (periods, n))
+
+# ===========================
+# TEST 1: Ledoit-Wolf matches the closed-form shrinkage and stays well conditioned with few periods
+# ===========================
+def test_ledoit_wolf_shrinkage():
+    rng = np.random.default_rng(5)
+    returns = factor_returns(rng, 40, 60)
+    X = returns - returns.mean(axis=0)
+    sample = X.T @ X / (len(X) - 1)
+    mu = np.trace(sample) / 60
+    target = mu * np.eye(60)
+    beta = sum(np.sum((np.outer(x, x) - X.T @ X / len(X)) ** 2) for x in X) / len(X) ** 2
+    delta = np.sum((sample - target) ** 2)
+    shrinkage = min(beta, delta) / delta
+
+    shrunk = ledoit_wolf(returns)
+    assert np.allclose(shrunk, shrinkage * target + (1 - shrinkage) * nearest_psd(sample), atol=1e-14)
+    assert np.linalg.eigvalsh(shrunk)[0] > 0 and np.linalg.eigvalsh(sample)[0] < 1e-12
+
+# ===========================
+# TEST 2: The factor model fitted from returns matches the leading eigenvectors of the sample
+# covariance, and the optimizer gives the same weights on the factor form as on the full matrix
+# ===========================
+def test_factor_model_solve():
+    rng = np.random.default_rng(11)
+    model = factor_returns(rng, 300, 80)
+    cov = factor_model(model, 5, 252)
+    dense = cov.to_numpy()
+    sample = np.cov(model.T) * 252
+    values, vectors = np.linalg.eigh(sample)
+    leading = (vectors[:, -5:] * values[-5:]) @ vectors[:, -5:].T
+    assert np.allclose(dense - np.diag(cov.specific), leading) and np.allclose(np.diag(dense), np.diag(sample))
+    weights = rng.uniform(size=80)
+    assert np.allclose(cov @ weights, dense @ weights) and np.allclose(cov.diagonal(), np.diag(dense))
+
+    mu = rng.normal(0.08, 0.05, 80)
+    low, high = return_range(mu, 0.05)
+    target = low + 0.7 * (high - low)
+    factored, full = solve_min_variance(cov, mu, target, 0.05), solve_min_variance(dense, mu, target, 0.05)
+    assert factored.success and full.success
+    assert np.abs(factored.x - full.x).max() < 1e-9
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+from app.logic.holdings import period_grid, period_labels, holdings_matrix, aligned_prices, portfolio_values
+from app.logic.ledger import action_sides
+
+# ===========================
+# TEST 1: Holdings accumulate per period
+# ===========================
+def test_holdings_matrix_monthly():
+    grid = period_grid("2023-01-15", "2023-03-10", "monthly")
+    dates = pd.to_datetime(["2023-01-15", "2023-02-01", "2023-03-10"]).values
+    deltas = action_sides(["buy", "Buy", "sell"]) * np.array([10, 5, 2])
+
+    holdings = holdings_matrix(dates, np.array([0, 1, 0]), deltas, 2, grid)
+
+    assert period_labels(grid) == ["2023-01", "2023-02", "2023-03"]
+    assert holdings.tolist() == [[10, 0], [10, 5], [8, 5]]
+
+# ===========================
+# TEST 2: Values use the last close on or before each period end
+# ===========================
+def test_portfolio_values_weekly():
+    grid = period_grid("2023-01-02", "2023-01-13", "weekly")
+    daily = pd.DataFrame({"AAPL": [100.0, 110.0], "MSFT": [np.nan, 50.0]},
+                         index=pd.to_datetime(["2023-01-05", "2023-01-11"]))
+    holdings = np.array([[1.0, 2.0], [1.0, -1.0]])
+
+    values = portfolio_values(holdings, aligned_prices(daily, ["AAPL", "MSFT"], grid))
+
+    assert values.tolist() == [100.0, 110.0]
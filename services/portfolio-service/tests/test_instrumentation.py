@@ -0,0 +1,33 @@
+import importlib
+import os
+from types import SimpleNamespace
+from app import instrumentation
+from app.instrumentation import _route_template
+
+# ===========================
+# TEST 1: Route labels use the template, with the router prefix
+# ===========================
+def test_route_template():
+    prefixed = {"path": "/portfolio/metrics/7", "route": SimpleNamespace(path="/portfolio/metrics/{portfolio_id}")}
+    unprefixed = {"path": "/portfolio/metrics/7", "route": SimpleNamespace(path="/metrics/{portfolio_id}")}
+
+    assert _route_template(prefixed) == "/portfolio/metrics/{portfolio_id}"
+    assert _route_template(unprefixed) == "/portfolio/metrics/{portfolio_id}"
+    assert _route_template({"path": "/nope"}) == "unmatched"
+
+# ===========================
+# TEST 2: Importing sets nothing up; the lifespan hooks create and remove the samples directory
+# ===========================
+def test_metrics_lifecycle(monkeypatch):
+    monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR", raising=False)
+    importlib.reload(instrumentation)
+    assert "PROMETHEUS_MULTIPROC_DIR" not in os.environ
+    instrumentation.record_cache_lookups("test", 1, 0)
+
+    instrumentation.start_metrics()
+    directory = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    instrumentation.record_cache_lookups("test", 1, 0)
+    assert os.listdir(directory)
+
+    instrumentation.stop_metrics()
+    assert not os.path.exists(directory) and "PROMETHEUS_MULTIPROC_DIR" not in os.environ
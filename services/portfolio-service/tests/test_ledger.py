@@ -0,0 +1,44 @@
+import pickle
+from datetime import datetime
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+from app.logic.ledger import TRANSACTION_COLUMNS, as_ledger
+from app.logic.positions import positions_from_transactions, summarize_positions
+
+ROWS = [
+    [datetime(2023, 3, 1), "AAPL", "Sell", 2, 160, 320],
+    [datetime(2023, 1, 1), "AAPL", "buy", 10, 150, 1500],
+    [None, "MSFT", "buy", 1, 1, 1],  # No date: dropped
+    [datetime(2023, 2, 1), "GOOGL", "buy", 5, 100, 500],
+]
+
+# ===========================
+# TEST 1: Ledgers are sorted, typed and signed once
+# ===========================
+def test_ledger_columns():
+    frame = pd.DataFrame(ROWS, columns=TRANSACTION_COLUMNS)
+    ledger = as_ledger(frame)
+
+    assert ledger.tickers == ["AAPL", "GOOGL"]
+    assert ledger.days.astype(str).tolist() == ["2023-01-01", "2023-02-01", "2023-03-01"]
+    assert ledger.signed_shares.tolist() == [10, 5, -2]
+    assert ledger.cash_flows.tolist() == [1500, 500, -320]
+
+    # Same ledger from transaction objects, and through pickling to a worker
+    objects = as_ledger([SimpleNamespace(**dict(zip(TRANSACTION_COLUMNS, row))) for row in ROWS])
+    assert np.array_equal(objects.rows, ledger.rows)
+    assert np.array_equal(pickle.loads(pickle.dumps(ledger)).rows, ledger.rows)
+
+# ===========================
+# TEST 2: Positions from a ledger match the DataFrame aggregation
+# ===========================
+def test_positions_from_ledger():
+    frame = pd.DataFrame(ROWS, columns=TRANSACTION_COLUMNS).dropna(subset=["date"])
+    summary = summarize_positions(frame)
+
+    for holding in positions_from_transactions(as_ledger(frame)):
+        row = summary.loc[holding.ticker]
+        assert holding.net_shares == row.net_shares
+        assert holding.cost_basis == row.cost_basis
+        assert holding.first_trade_date == row.first_trade_date and holding.last_trade_date == row.last_trade_date
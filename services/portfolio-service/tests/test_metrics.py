@@ -0,0 +1,48 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pandas as pd
+from app.logic import metrics
+from app.logic.ledger import TRANSACTION_COLUMNS
+from app.logic.price_provider import PriceProvider
+
+
+def transactions(*rows):
+    return pd.DataFrame(list(rows), columns=TRANSACTION_COLUMNS)
+
+
+class StaticProvider(PriceProvider):
+    def __init__(self):
+        self.calls = []
+
+    def get_close(self, tickers, start, end):
+        self.calls.append(sorted(tickers))
+        idx = pd.to_datetime(["2023-01-02", "2023-01-03", "2023-06-01"])
+        prices = pd.DataFrame({"AAPL": [100.0, 110.0, 150.0], "MSFT": [200.0, None, 250.0]}, index=idx)
+        return prices.reindex(columns=list(tickers))
+
+# ===========================
+# TEST 1: Batch metrics share one price fetch and match single-portfolio results
+# ===========================
+def test_batch_metrics(monkeypatch):
+    provider = StaticProvider()
+    monkeypatch.setattr(metrics, "get_price_provider", lambda: provider)
+    portfolios = {
+        1: (transactions([datetime(2022, 1, 3), "AAPL", "buy", 10, 90, 900],
+                         [datetime(2023, 1, 3), "MSFT", "buy", 2, 200, 400]), None),
+        2: (transactions([datetime(2023, 6, 1), "AAPL", "buy", 1, 150, 150]), None),
+        3: (transactions(), None),
+    }
+
+    batch = metrics.compute_batch_metrics(portfolios)
+
+    assert provider.calls == [["AAPL", "MSFT"]]
+    # MSFT has no close on 2023-01-03, so the previous day's is used
+    assert batch[1]["current_value"] == 10 * 110 + 2 * 200
+    assert batch[2]["current_value"] == 150
+    assert batch[3]["net_shares"] == {}
+    for pid, (frame, _) in portfolios.items():
+        assert metrics.compute_portfolio_metrics(frame) == batch[pid]
+        # Transaction objects are accepted as well
+        records = [SimpleNamespace(**row) for row in frame.to_dict("records")]
+        assert metrics.compute_portfolio_metrics(records) == batch[pid]
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+from app.logic.metrics import nav_statistics
+from app.logic.nav import nav_series
+from app.logic.ledger import TRANSACTION_COLUMNS
+
+DAYS = pd.bdate_range("2024-01-01", "2024-03-29")
+PRICES = pd.DataFrame({
+    "AAPL": np.linspace(100, 130, len(DAYS)),
+    "MSFT": np.linspace(200, 180, len(DAYS))
+}, index=DAYS)
+TRANSACTIONS = pd.DataFrame([
+    [pd.Timestamp("2024-01-02"), "AAPL", "buy", 10, 100.0, 1000.0],
+    [pd.Timestamp("2024-01-20"), "MSFT", "buy", 5, 195.0, 975.0],  # Saturday: lands on Monday
+    [pd.Timestamp("2024-02-15"), "AAPL", "sell", 4, 115.0, 460.0],
+], columns=TRANSACTION_COLUMNS)
+
+# ===========================
+# TEST 1: Extending a series matches computing it in one go
+# ===========================
+def test_incremental_extension_matches_full():
+    full, full_state = nav_series(TRANSACTIONS, PRICES, DAYS)
+
+    split = DAYS.get_loc(pd.Timestamp("2024-01-19"))  # The Friday before the weekend trade
+    head, state = nav_series(TRANSACTIONS, PRICES, DAYS[:split + 1])
+    tail, state = nav_series(TRANSACTIONS, PRICES, DAYS[split + 1:], state)
+
+    pd.testing.assert_frame_equal(pd.concat([head, tail], ignore_index=True), full)
+    assert np.allclose(state, full_state)
+    assert full.loc[full["date"] == "2024-01-22", "net_flow"].item() == 975.0
+
+# ===========================
+# TEST 2: Flows are not returns
+# ===========================
+def test_time_weighted_return_ignores_flows():
+    rows, state = nav_series(TRANSACTIONS, PRICES, DAYS)
+    held = rows.set_index("date")
+
+    # Only AAPL is held until the MSFT buy, so the index tracks its price exactly
+    before = held.loc["2024-01-19"]
+    assert np.isclose(before["twr_index"], PRICES.loc["2024-01-19", "AAPL"] / PRICES.loc["2024-01-02", "AAPL"])
+    # The MSFT purchase adds value but not return
+    assert held.loc["2024-01-22", "market_value"] > before["market_value"] + 900
+    assert abs(held.loc["2024-01-22", "daily_return"]) < 0.01
+
+    stats = nav_statistics(state)
+    assert stats["time_weighted_return"] == round((state.twr_index - 1) * 100, 2)
+    assert stats["max_drawdown"] <= 0
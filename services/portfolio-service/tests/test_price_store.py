@@ -0,0 +1,175 @@
+import threading
+import time
+import numpy as np
+import pandas as pd
+from app.logic.price_provider import PriceProvider, FixtureProvider, CoalescingProvider
+from app.logic.price_store import PriceStore
+
+
+class CountingProvider(PriceProvider):
+    def __init__(self, calls, scale=1.0, delay=0):
+        self.calls = calls
+        self.scale = scale
+        self.delay = delay
+
+    def get_close(self, tickers, start, end):
+        self.calls.append((tuple(tickers), str(start), str(end)))
+        time.sleep(self.delay)
+        idx = pd.bdate_range(str(start), pd.Timestamp(str(end)) - pd.Timedelta(days=1))
+        return pd.DataFrame({t: 100.0 * self.scale + np.arange(len(idx)) for t in tickers}, index=idx)
+
+# ===========================
+# TEST 1: Warm store does not download again
+# ===========================
+def test_warm_store_skips_download(tmp_path):
+    calls = []
+    store = PriceStore(str(tmp_path), provider=CountingProvider(calls))
+
+    first = store.get_close(["AAPL", "MSFT"], "2023-01-01", "2023-02-01")
+    second = store.get_close(["AAPL", "MSFT"], "2023-01-05", "2023-01-20")
+
+    assert len(calls) == 1
+    assert list(first.columns) == ["AAPL", "MSFT"]
+    assert second.index.min() >= pd.Timestamp("2023-01-05")
+    assert second.index.max() < pd.Timestamp("2023-01-20")
+
+# ===========================
+# TEST 2: Only missing ranges are fetched
+# ===========================
+def test_fetches_only_missing_ranges(tmp_path):
+    calls = []
+    store = PriceStore(str(tmp_path), provider=CountingProvider(calls))
+    store.get_close(["AAPL"], "2023-01-01", "2023-02-01")
+    calls.clear()
+
+    store.get_close(["AAPL"], "2022-12-01", "2023-01-15")
+
+    assert calls == [(("AAPL",), "2022-12-01", "2023-01-01")]
+
+# ===========================
+# TEST 3: Re-adjusted upstream history invalidates the ticker
+# ===========================
+def test_readjusted_history_is_refetched(tmp_path):
+    calls = []
+    store = PriceStore(str(tmp_path), provider=CountingProvider(calls))
+    store.get_close(["AAPL"], "2023-01-01", "2023-02-01")
+
+    store.provider = CountingProvider(calls, scale=0.5)
+    prices = store.get_close(["AAPL"], "2023-01-01", "2023-03-01")
+
+    assert prices["AAPL"].iloc[0] == 50.0
+
+# ===========================
+# TEST 4: Concurrent overlapping requests share one fetch
+# ===========================
+def test_coalescing_shares_inflight_fetch():
+    calls = []
+    provider = CoalescingProvider(CountingProvider(calls, delay=0.2))
+    results = {}
+
+    def request(key, tickers, start):
+        results[key] = provider.get_close(tickers, start, "2023-02-01")
+
+    threads = [threading.Thread(target=request, args=(0, ["AAPL", "MSFT"], "2023-01-01"))]
+    threads[0].start()
+    time.sleep(0.05)
+    threads += [threading.Thread(target=request, args=(i, ["MSFT"], "2023-01-10")) for i in range(1, 4)]
+    for t in threads[1:]:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert list(results[0].columns) == ["AAPL", "MSFT"]
+    assert all(results[i].index.min() >= pd.Timestamp("2023-01-10") for i in range(1, 4))
+
+# ===========================
+# TEST 5: Fixture backend round-trips written prices
+# ===========================
+def test_fixture_provider(tmp_path):
+    idx = pd.bdate_range("2023-01-02", "2023-03-31")
+    FixtureProvider.write(str(tmp_path), pd.DataFrame({"AAPL": np.linspace(100, 120, len(idx))}, index=idx))
+    provider = FixtureProvider(str(tmp_path))
+
+    monthly = provider.get_monthly_close(["AAPL", "MISSING"], "2023-01-01", "2023-04-01")
+
+    assert len(monthly) == 3
+    assert monthly["AAPL"].iloc[-1] == 120
+    assert monthly["MISSING"].isna().all()
+
+# ===========================
+# TEST 6: Today's bar is refetched until the close, and kept once warmed after it
+# ===========================
+def test_bars_settle_at_close(tmp_path, monkeypatch):
+    from datetime import datetime
+    from app.logic import price_store
+    from app.price_warmer import warm_batches
+
+    assert price_store.settled_until(datetime(2024, 6, 28, 15, 0)) == np.datetime64("2024-06-28")
+    assert price_store.settled_until(datetime(2024, 6, 28, 22, 0)) == np.datetime64("2024-06-29")
+
+    calls = []
+    today = pd.Timestamp.today().normalize()
+    tomorrow = today + pd.Timedelta(days=1)
+    idx = pd.bdate_range("2019-01-01", today)
+    FixtureProvider.write(str(tmp_path / "fixtures"), pd.DataFrame({"AAPL": np.linspace(100, 200, len(idx))}, index=idx))
+    fixtures = FixtureProvider(str(tmp_path / "fixtures"))
+    fetch = fixtures.get_close
+    fixtures.get_close = lambda tickers, start, end: calls.append(tickers) or fetch(tickers, start, end)
+    store = PriceStore(str(tmp_path / "store"), provider=fixtures)
+    monkeypatch.setattr(price_store, "settled_until", lambda: np.datetime64(today.date(), "D"))
+    store.get_close(["AAPL"], today - pd.Timedelta(days=30), tomorrow)
+    monkeypatch.setattr(price_store, "settled_until", lambda: np.datetime64(tomorrow.date(), "D"))
+    store.get_close(["AAPL"], today - pd.Timedelta(days=30), tomorrow)
+    store.get_close(["AAPL"], today - pd.Timedelta(days=30), tomorrow)
+    assert len(calls) == 2
+
+    batches = warm_batches({"OLD": datetime(2000, 1, 3), "AAPL": datetime(2024, 1, 2), "MSFT": datetime(2023, 5, 1)}, today, 2)
+    assert [tickers for tickers, _, _ in batches] == [["OLD", "AAPL"], ["MSFT"]]
+    assert batches[0][1] == pd.Timestamp("1999-12-24") and all(end == tomorrow for _, _, end in batches)
+
+# ===========================
+# TEST 7: Workers sharing the directory download a missing range once
+# ===========================
+def test_workers_share_download(tmp_path):
+    calls = []
+    provider = CountingProvider(calls, delay=0.3)
+    # Separate stores share only the files and their flocks, like separate worker processes
+    stores = [PriceStore(str(tmp_path), provider=provider) for _ in range(3)]
+    results = [None] * 3
+
+    def read(i):
+        results[i] = stores[i].get_close(["AAPL", "MSFT"], "2023-01-01", "2023-02-01")
+
+    threads = [threading.Thread(target=read, args=(i,)) for i in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert all(r.equals(results[0]) and len(r) for r in results)
+
+# ===========================
+# TEST 8: A ticker fetched empty is not downloaded again until its negative entry expires,
+# whether it was fetched alone or with others
+# ===========================
+class PartialProvider(CountingProvider):
+    def get_close(self, tickers, start, end):
+        return super().get_close(tickers, start, end).drop(columns=["GONE"], errors="ignore")
+
+def test_empty_fetch_negative_entry(tmp_path, monkeypatch):
+    calls = []
+    store = PriceStore(str(tmp_path), provider=PartialProvider(calls))
+
+    assert store.get_close(["GONE"], "2023-01-01", "2023-02-01")["GONE"].empty
+    store.get_close(["GONE"], "2023-01-01", "2023-02-01")
+    store.get_close(["AAPL", "GONE"], "2023-03-01", "2023-04-01")
+    store.get_close(["GONE"], "2023-03-01", "2023-04-01")
+    assert calls == [(("GONE",), "2023-01-01", "2023-02-01"), (("AAPL", "GONE"), "2023-03-01", "2023-04-01")]
+
+    # Expired entries are retried
+    monkeypatch.setattr("app.logic.price_store.PRICE_MISSING_TTL", -1)
+    store.get_close(["GONE"], "2023-05-01", "2023-06-01")
+    store.get_close(["GONE"], "2023-05-01", "2023-06-01")
+    assert calls[2:] == [(("GONE",), "2023-05-01", "2023-06-01")] * 2
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize
+from app.logic import optimize
+from app.logic.positions import Holding
+from app.logic.qp import return_range, solve_min_variance
+
+def random_problem(rng, n):
+    returns = rng.normal(0, 0.01, (500, 2)) @ rng.normal(0, 1, (2, n)) + rng.normal(0, 0.01, (500, n))
+    return np.cov(returns.T) * 252, rng.normal(0.08, 0.05, n)
+
+# ===========================
+# TEST 1: Same minimum as a general-purpose solver, with and without caps
+# ===========================
+def test_matches_slsqp():
+    rng = np.random.default_rng(7)
+    for n, cap in [(3, None), (8, None), (8, 0.2), (15, 0.1)]:
+        cov, mu = random_problem(rng, n)
+        low, high = return_range(mu, cap)
+        target = low + 0.6 * (high - low)
+
+        result = solve_min_variance(cov, mu, target, cap)
+        reference = minimize(lambda w: w @ cov @ w, np.ones(n) / n, jac=lambda w: 2 * cov @ w, method="SLSQP",
+                             bounds=[(0, cap or 1)] * n, options={"ftol": 1e-14, "maxiter": 1000},
+                             constraints=({"type": "eq", "fun": lambda w: w.sum() - 1}, {"type": "eq", "fun": lambda w: w @ mu - target}))
+
+        assert result.success
+        assert abs(result.x.sum() - 1) < 1e-9 and abs(result.x @ mu - target) < 1e-9
+        assert result.x.min() >= 0 and result.x.max() <= (cap or 1)
+        assert result.x @ cov @ result.x <= reference.fun * (1 + 1e-8)
+
+# ===========================
+# TEST 2: Deterministic, warm-startable, and infeasible caps reported
+# ===========================
+def test_warm_start_and_infeasible_caps():
+    rng = np.random.default_rng(3)
+    cov, mu = random_problem(rng, 40)
+    low, high = return_range(mu)
+
+    first = solve_min_variance(cov, mu, low + 0.5 * (high - low))
+    assert np.array_equal(first.x, solve_min_variance(cov, mu, low + 0.5 * (high - low)).x)
+    warm = solve_min_variance(cov, mu, low + 0.55 * (high - low), initial_weights=first.x)
+    cold = solve_min_variance(cov, mu, low + 0.55 * (high - low))
+    assert np.allclose(warm.x, cold.x, atol=1e-8)
+
+    assert return_range(mu, 0.02) is None
+    assert not solve_min_variance(cov, mu, high, 0.05).success
+
+# ===========================
+# TEST 3: Optimal with a singular covariance (fewer return observations than assets)
+# ===========================
+def test_rank_deficient_covariance():
+    rng = np.random.default_rng(0)
+    for _ in range(40):
+        n = int(rng.integers(5, 30))
+        cov = np.cov(rng.normal(0.0005, 0.01, (int(rng.integers(3, n)), n)).T) * 252
+        mu = rng.normal(0.08, 0.05, n)
+        cap = max(0.1, 1.5 / n) if rng.uniform() < 0.5 else None
+        low, high = return_range(mu, cap)
+        target = low + rng.uniform(0.2, 0.8) * (high - low)
+
+        result = solve_min_variance(cov, mu, target, cap)
+        references = [minimize(lambda w: w @ cov @ w, x0, jac=lambda w: 2 * cov @ w, method="SLSQP",
+                               bounds=[(0, cap or 1)] * n, options={"ftol": 1e-15, "maxiter": 1000},
+                               constraints=({"type": "eq", "fun": lambda w: w.sum() - 1}, {"type": "eq", "fun": lambda w: w @ mu - target}))
+                      for x0 in (np.ones(n) / n, result.x)]
+
+        assert result.success
+        assert abs(result.x.sum() - 1) < 1e-9 and abs(result.x @ mu - target) < 1e-9
+        best = min(r.fun for r in references if r.success)
+        assert result.x @ cov @ result.x <= best + 1e-7 * np.diag(cov).mean()
+
+# ===========================
+# TEST 4: Warm-started frontier points match cold solves, and targets outside the reachable
+# range are reported infeasible
+# ===========================
+def test_frontier_matches_cold_solves(monkeypatch):
+    rng = np.random.default_rng(21)
+    cov, mu = random_problem(rng, 30)
+    tickers = [f"T{i:02d}" for i in range(30)]
+    stats = {"mean_returns": pd.Series(mu, index=tickers), "cov_matrix": pd.DataFrame(cov, index=tickers, columns=tickers)}
+    monkeypatch.setattr(optimize, "load_return_statistics", lambda tickers, covariance=None: stats)
+    positions = [Holding(t, 1.0, 100.0, None, None) for t in tickers]
+
+    low, high = return_range(mu, 0.2)
+    targets = [high + 0.01, low + 0.2 * (high - low), low - 0.01, low + 0.5 * (high - low), low + 0.8 * (high - low)]
+    frontier = optimize.compute_efficient_frontier(positions, targets, max_weight=0.2)["frontier"]
+
+    assert [p["target_return"] for p in frontier] == [round(t, 4) for t in sorted(targets)]
+    assert [p["feasible"] for p in frontier] == [False, True, True, True, False]
+    for point, target in zip(frontier[1:4], sorted(targets)[1:4]):
+        cold = solve_min_variance(cov, mu, target, 0.2)
+        assert np.allclose(list(point["allocation"].values()), cold.x, atol=1e-4)
@@ -0,0 +1,34 @@
+from datetime import datetime
+from app.batch.rebalance import group_by_universe, rebalance_page
+from app.logic.optimize import load_return_statistics, optimize_portfolio
+from app.logic.positions import Holding
+
+def holding(ticker, shares, cost):
+    return Holding(ticker, shares, cost, datetime(2021, 1, 4), datetime(2022, 3, 1))
+
+# ===========================
+# TEST 1: One solve per ticker set gives the same results as optimize_portfolio
+# ===========================
+def test_rebalance_page_matches_optimize_portfolio():
+    holdings = {
+        1: [holding("AAPL", 10, 1500), holding("MSFT", 3, 300)],
+        2: [holding("MSFT", 1, 90), holding("AAPL", 2, 250)],
+        3: [holding("AAPL", 5, 700), holding("GOOGL", 4, 400), holding("MSFT", 0, 100)],
+        4: [holding("GOOGL", 0, 100)],
+        5: [],
+    }
+    assert sorted(len(members) for members in group_by_universe(holdings).values()) == [1, 2, 2]
+
+    stats = load_return_statistics(["AAPL", "MSFT"])
+    target_return = float(stats["mean_returns"].mean())
+    results = rebalance_page(holdings, target_return, datetime.utcnow())
+
+    assert set(results) == set(holdings)
+    assert "optimized_allocation" in results[1]
+    assert results[4] == {"message": "No net holdings to optimize."}
+    assert results[5] == {"message": "No transactions to optimize."}
+    for portfolio_id, positions in holdings.items():
+        expected = optimize_portfolio(positions, target_return)
+        assert results[portfolio_id].keys() == expected.keys()
+        assert results[portfolio_id].get("optimized_allocation") == expected.get("optimized_allocation")
+        assert results[portfolio_id].get("total_invested") == expected.get("total_invested")
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+from app.logic.price_provider import PriceProvider
+from app.logic.return_stats import LRUCache, ReturnStatsCache
+
+
+class RandomWalkProvider(PriceProvider):
+    def __init__(self):
+        self.calls = []
+
+    def get_close(self, tickers, start, end):
+        self.calls.append(tuple(tickers))
+        idx = pd.bdate_range("2022-01-03", "2022-12-30")
+        rng = np.random.default_rng(0)
+        walk = np.exp(np.cumsum(rng.normal(0, 0.01, (len(idx), 4)), axis=0)) * 100
+        prices = pd.DataFrame(walk, index=idx, columns=["A", "B", "C", "D"])
+        return prices.reindex(columns=list(tickers))
+
+# ===========================
+# TEST 1: Covariance assembled from cached pairs matches a direct computation
+# ===========================
+def test_statistics_reuse_cached_pairs():
+    provider = RandomWalkProvider()
+    cache = ReturnStatsCache(provider=provider)
+
+    cache.statistics(["A", "B", "C"], 365, "2023-01-01")
+    stats = cache.statistics(["C", "A", "B", "D"], 365, "2023-01-01")
+
+    prices = provider.get_close(["C", "A", "B", "D"], None, None)
+    expected = prices.pct_change().dropna().cov() * 252
+    assert provider.calls[:2] == [("A", "B", "C"), ("D",)]
+    assert np.allclose(stats["cov_matrix"].to_numpy(), expected.to_numpy())
+    assert list(stats["mean_returns"].index) == ["C", "A", "B", "D"]
+
+# ===========================
+# TEST 2: LRU eviction by entries and by bytes, and TTL expiry
+# ===========================
+def test_lru_cache_bounds():
+    cache = LRUCache(max_entries=2, ttl=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+
+    sized = LRUCache(max_entries=10, ttl=60, max_bytes=2000)
+    sized.put("a", np.zeros(100))
+    sized.put("b", np.zeros(100))
+    sized.get("a")
+    sized.put("c", np.zeros(100))
+    sized.put("d", np.zeros(1000))
+    assert sized.get("b") is None and sized.get("d") is None
+    assert sized.get("a") is not None and sized.bytes == 1600
+
+    expired = LRUCache(max_entries=2, ttl=-1)
+    expired.put("a", 1)
+    assert expired.get("a") is None
+
+# ===========================
+# TEST 3: Tickers with different histories get a positive semi-definite covariance, the sample-based
+# estimators start from that same pairwise-complete covariance, and the factor model keeps each
+# ticker's own-history variance
+# ===========================
+class StaggeredProvider(PriceProvider):
+    def get_close(self, tickers, start, end):
+        idx = pd.bdate_range("2022-01-03", "2022-12-30")
+        rng = np.random.default_rng(3)
+        a = rng.normal(0, 0.01, len(idx))
+        half = len(idx) // 2
+        returns = pd.DataFrame({"A": a, "B": a + rng.normal(0, 0.001, len(idx)), "C": -a + rng.normal(0, 0.001, len(idx))}, index=idx)
+        returns.iloc[half:, 1] = np.nan
+        returns.iloc[:half, 2] = np.nan
+        return (100 * np.exp(returns.cumsum())).where(returns.notna()).reindex(columns=list(tickers))
+
+def test_staggered_histories():
+    cache = ReturnStatsCache(provider=StaggeredProvider())
+    tickers = ["A", "B", "C"]
+    sample = cache.statistics(tickers, 365, "2023-01-01", "sample")["cov_matrix"].to_numpy()
+    shrunk = cache.statistics(tickers, 365, "2023-01-01", "ledoit_wolf")["cov_matrix"].to_numpy()
+    stats = cache.statistics(tickers, 365, "2023-01-01", "factor")
+    factor, own = stats["cov_matrix"], stats["returns"].replace(0.0, np.nan).var() * 252
+
+    # B and C never trade on the same day, so the pairwise matrix itself is indefinite
+    assert np.linalg.eigvalsh(sample)[0] > -1e-12
+    off = ~np.eye(3, dtype=bool)
+    ratio = shrunk[off] / sample[off]
+    assert np.allclose(ratio, ratio[0]) and 0 < ratio[0] <= 1
+    dense = factor.to_numpy()
+    assert np.allclose(np.diag(dense), own) and np.linalg.eigvalsh(dense)[0] > 0
+    assert dense[0, 1] > 0 > dense[0, 2]
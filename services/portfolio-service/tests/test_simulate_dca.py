@@ -0,0 +1,40 @@
+import numpy as np
+from app.logic.simulate_dca import simulate_dca_projection, simulate_dca_monte_carlo
+
+# ===========================
+# TEST 1: Constant returns reproduce the deterministic projection
+# ===========================
+def test_monte_carlo_matches_deterministic_for_constant_returns():
+    history = np.full(60, 0.01)
+    cagr = ((1.01 ** 12) - 1) * 100
+
+    result = simulate_dca_monte_carlo(1000, 100, 2, history, history, paths=200, seed=1)
+    expected = simulate_dca_projection(1000, 100, 2, cagr, cagr)["actual_portfolio_values"]
+
+    assert np.allclose(result["actual_portfolio_bands"]["p50"], expected, rtol=1e-5)
+    assert np.allclose(result["optimized_portfolio_bands"]["p5"], expected, rtol=1e-5)
+
+# ===========================
+# TEST 2: Bands are ordered and reproducible with a seed
+# ===========================
+def test_monte_carlo_bands():
+    rng = np.random.default_rng(0)
+    history = rng.normal(0.007, 0.04, 120)
+
+    for method in ["bootstrap", "parametric"]:
+        first = simulate_dca_monte_carlo(10000, 500, 5, history, history, paths=1000, method=method, seed=7)
+        second = simulate_dca_monte_carlo(10000, 500, 5, history, history, paths=1000, method=method, seed=7)
+        bands = first["actual_portfolio_bands"]
+
+        assert first == second
+        assert len(bands["p50"]) == 60
+        assert all(lo <= mid <= hi for lo, mid, hi in zip(bands["p5"], bands["p50"], bands["p95"]))
+
+# ===========================
+# TEST 3: Zero years projects nothing instead of failing
+# ===========================
+def test_monte_carlo_zero_years():
+    history = np.full(60, 0.01)
+    for method in ["bootstrap", "parametric"]:
+        result = simulate_dca_monte_carlo(1000, 100, 0, history, history, paths=100, method=method)
+        assert result["dates"] == [] and result["actual_portfolio_bands"]["p50"] == []